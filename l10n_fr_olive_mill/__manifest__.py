@@ -18,6 +18,7 @@
     'data': [
         'security/olive_security.xml',
         'security/ir.model.access.csv',
+        'data/olive_agrimer_ledger.xml',
         'views/olive_agrimer_report.xml',
         'views/product.xml',
         'views/product_pricelist.xml',
@@ -2,4 +2,8 @@
 
 from . import product
 from . import product_pricelist
+from . import olive_agrimer_ledger
 from . import olive_agrimer_report
+from . import olive_arrival
+from . import olive_oil_production
+from . import stock_move
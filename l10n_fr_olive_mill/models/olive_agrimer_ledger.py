@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Barroux Abbey (https://www.barroux.org/)
+# @author: Alexis de Lattre <alexis.delattre@akretion.com>
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, fields, models, _
+import odoo.addons.decimal_precision as dp
+from odoo.exceptions import UserError
+from datetime import timedelta
+import logging
+
+logger = logging.getLogger(__name__)
+
+OIL_TYPES = [
+    ('organic_virgin', 'Organic Virgin'),
+    ('organic_extravirgin', 'Organic Extra Virgin'),
+    ('regular_virgin', 'Regular Virgin'),
+    ('regular_extravirgin', 'Regular Extra Virgin'),
+    ]
+
+CATEGORIES = [
+    ('arrival', 'Olive Arrival (kg)'),
+    ('pressed', 'Olive Pressed (kg)'),
+    ('produced', 'Oil Produced (L)'),
+    ('shrinkage', 'Shrinkage (L)'),
+    ('withdrawal', 'Withdrawal (L)'),
+    ('consumer', 'Sale to Consumers (L)'),
+    ('distributor', 'Sale to Distributors (L)'),
+    ('loose', 'Loose Sale (L)'),
+    ]
+
+# Number of days processed per SQL scan when rebuilding the ledger
+REBUILD_CHUNK_DAYS = 31
+
+
+class OliveAgrimerLedger(models.Model):
+    _name = 'olive.agrimer.ledger'
+    _description = 'Olive AgriMer Daily Ledger'
+    _order = 'date desc, category, oil_type'
+    _rec_name = 'date'
+
+    company_id = fields.Many2one(
+        'res.company', string='Company', ondelete='cascade', required=True,
+        readonly=True, index=True)
+    date = fields.Date(string='Date', required=True, readonly=True, index=True)
+    # oil_type is empty on arrival/pressed lines when the oil product
+    # has no oil type configured
+    oil_type = fields.Selection(OIL_TYPES, string='Oil Type', readonly=True)
+    category = fields.Selection(
+        CATEGORIES, string='Category', required=True, readonly=True)
+    qty = fields.Float(
+        string='Quantity', digits=dp.get_precision('Olive Oil Volume'),
+        readonly=True)
+
+    @api.model
+    def _get_oil_type(self, oil_product):
+        if not oil_product.olive_oil_type:
+            raise UserError(_(
+                "Oil type not configured on oil product '%s'.")
+                % oil_product.display_name)
+        if not oil_product.olive_culture_type:
+            raise UserError(_(
+                "Culture type not configured on oil product '%s'.")
+                % oil_product.display_name)
+        culture_type = oil_product.olive_culture_type
+        if culture_type == 'conversion':
+            culture_type = 'organic'
+        return '%s_%s' % (culture_type, oil_product.olive_oil_type)
+
+    @api.model
+    def _get_oil_type_tables(self, product_ids=None):
+        '''Returns (oilproduct2oiltype, bottle2oiltypevol) where
+        oilproduct2oiltype = {oil_product_id: oil_type}
+        bottle2oiltypevol = {bottle_product_id: {oil_type: volume}}
+        If product_ids is set, the tables are limited to these products'''
+        oilproduct2oiltype = {}
+        bottle2oiltypevol = {}
+        ppo = self.env['product.product'].with_context(active_test=False)
+        domain = []
+        if product_ids is not None:
+            domain = [('id', 'in', product_ids)]
+        oil_products = ppo.search(domain + [
+            ('olive_type', '=', 'oil'),
+            ('olive_oil_type', '!=', False),
+            ('olive_culture_type', '!=', False)])
+        for oil_product in oil_products:
+            oilproduct2oiltype[oil_product.id] = self._get_oil_type(
+                oil_product)
+        # Oil volumes of bottles and packs come from the explosion table
+        bottles = ppo.search(domain + [
+            ('olive_type', 'in', ('bottle_full', 'bottle_full_pack'))])
+        explosion = ppo.olive_oil_explosion_get(bottles.ids)
+        for bottle in bottles.filtered(lambda p: p.id not in explosion):
+            # Bottle or pack with a BOM that is not valid:
+            # the compute methods raise an explicit error
+            if bottle.olive_type == 'bottle_full':
+                bottle._oil_bottle_full_compute_bom_and_oil_product()
+            else:
+                bottle._oil_bottle_full_pack_compute_bottles()
+            raise UserError(_(
+                "Product '%s' is not in the oil volume table of the "
+                "bottles and packs: check the bill of material of the "
+                "product and of its bottles.") % bottle.display_name)
+        for bottle_id, oil2vol in explosion.items():
+            bottle2oiltypevol[bottle_id] = pdict = {}
+            for oil_product_id, volume in oil2vol.items():
+                oil_type = oilproduct2oiltype.get(oil_product_id)
+                if not oil_type:
+                    oil_type = self._get_oil_type(ppo.browse(oil_product_id))
+                pdict[oil_type] = pdict.get(oil_type, 0.0) + volume
+        return oilproduct2oiltype, bottle2oiltypevol
+
+    @api.model
+    def _scan_arrival_lines(
+            self, key2qty, oilproduct2oiltype, sign=1, company_id=None,
+            date_start=None, date_end=None, line_ids=None):
+        '''Adds to key2qty the olive arrival qty (on arrival date),
+        the olive pressed qty, the oil produced and the shrinkage
+        (on production date). key = (company_id, date, oil_type, category)'''
+        where = ''
+        params = {
+            'company_id': company_id,
+            'date_start': date_start,
+            'date_end': date_end,
+            'line_ids': line_ids,
+            }
+        if company_id:
+            where += ' AND company_id = %(company_id)s'
+        if line_ids is not None:
+            where += ' AND id = ANY(%(line_ids)s)'
+        arrival_where = where
+        production_where = where
+        if date_start:
+            arrival_where += ' AND arrival_date >= %(date_start)s'
+            production_where += ' AND production_date >= %(date_start)s'
+        if date_end:
+            arrival_where += ' AND arrival_date <= %(date_end)s'
+            production_where += ' AND production_date <= %(date_end)s'
+        self._cr.execute("""
+            SELECT company_id, arrival_date, oil_product_id, SUM(olive_qty)
+            FROM olive_arrival_line
+            WHERE arrival_state = 'done'""" + arrival_where + """
+            GROUP BY company_id, arrival_date, oil_product_id
+            """, params)
+        for company_id, day, product_id, olive_qty in self._cr.fetchall():
+            key = (company_id, day, oilproduct2oiltype.get(product_id),
+                   'arrival')
+            key2qty[key] = key2qty.get(key, 0.0) + sign * (olive_qty or 0.0)
+        self._cr.execute("""
+            SELECT
+                company_id, production_date, oil_product_id,
+                SUM(olive_qty), SUM(oil_qty_net), SUM(shrinkage_oil_qty)
+            FROM olive_arrival_line
+            WHERE production_state = 'done'""" + production_where + """
+            GROUP BY company_id, production_date, oil_product_id
+            """, params)
+        for company_id, day, product_id, olive_qty, oil_qty_net,\
+                shrinkage_qty in self._cr.fetchall():
+            oil_type = oilproduct2oiltype.get(product_id)
+            for category, qty in [
+                    ('pressed', olive_qty),
+                    ('produced', oil_qty_net),
+                    ('shrinkage', shrinkage_qty)]:
+                if category != 'pressed' and not oil_type:
+                    continue
+                key = (company_id, day, oil_type, category)
+                key2qty[key] = key2qty.get(key, 0.0) + sign * (qty or 0.0)
+
+    @api.model
+    def _scan_moves(
+            self, key2qty, oilproduct2oiltype, bottle2oiltypevol,
+            company_id=None, date_start=None, date_end=None, move_ids=None):
+        '''Adds to key2qty the withdrawal (oil from the withdrawal location),
+        the loose sale (oil from another location) and the bottle sales.
+        Returns are counted as negative quantities'''
+        product_ids = oilproduct2oiltype.keys() + bottle2oiltypevol.keys()
+        if not product_ids:
+            return
+        olive_whs = self.env['stock.warehouse'].with_context(
+            active_test=False).search([
+                ('olive_mill', '=', True),
+                ('olive_withdrawal_loc_id', '!=', False)])
+        withdrawal_loc_ids = olive_whs.mapped('olive_withdrawal_loc_id').ids
+        where = ''
+        params = {
+            'wloc_ids': withdrawal_loc_ids,
+            'product_ids': product_ids,
+            'company_id': company_id,
+            'date_start': date_start and date_start + ' 00:00:00',
+            'date_end': date_end and date_end + ' 23:59:59',
+            'move_ids': move_ids,
+            }
+        if company_id:
+            where += ' AND sm.company_id = %(company_id)s'
+        if date_start:
+            where += ' AND sm.date >= %(date_start)s'
+        if date_end:
+            where += ' AND sm.date <= %(date_end)s'
+        if move_ids is not None:
+            where += ' AND sm.id = ANY(%(move_ids)s)'
+        self._cr.execute("""
+            SELECT
+                sm.company_id,
+                to_char(sm.date, 'YYYY-MM-DD'),
+                sm.product_id,
+                sm.partner_id,
+                SUM(CASE
+                    WHEN sm.location_id = ANY(%(wloc_ids)s)
+                    AND dest.usage = 'customer' THEN sm.product_uom_qty
+                    WHEN src.usage = 'customer'
+                    AND sm.location_dest_id = ANY(%(wloc_ids)s)
+                    THEN -sm.product_uom_qty
+                    ELSE 0 END),
+                SUM(CASE
+                    WHEN NOT sm.location_id = ANY(%(wloc_ids)s)
+                    AND dest.usage = 'customer' THEN sm.product_uom_qty
+                    WHEN src.usage = 'customer'
+                    AND NOT sm.location_dest_id = ANY(%(wloc_ids)s)
+                    THEN -sm.product_uom_qty
+                    ELSE 0 END),
+                SUM(CASE
+                    WHEN src.usage = 'internal'
+                    AND dest.usage = 'customer' THEN sm.product_uom_qty
+                    WHEN src.usage = 'customer'
+                    AND dest.usage = 'internal' THEN -sm.product_uom_qty
+                    ELSE 0 END)
+            FROM stock_move sm
+            JOIN stock_location src ON src.id = sm.location_id
+            JOIN stock_location dest ON dest.id = sm.location_dest_id
+            WHERE sm.state = 'done'
+            AND sm.product_id = ANY(%(product_ids)s)
+            AND (src.usage = 'customer' OR dest.usage = 'customer')
+            """ + where + """
+            GROUP BY 1, 2, 3, 4
+            """, params)
+        res = self._cr.fetchall()
+        # Sale bottles: resolve the distributor partners in one go
+        distri_partner_ids = set()
+        distri_pricelists = self.env['product.pricelist'].search([
+            ('olive_oil_distributor', '=', True)])
+        partner_ids = set([
+            row[3] for row in res if row[3] and row[2] in bottle2oiltypevol])
+        if distri_pricelists and partner_ids:
+            for partner in self.env['res.partner'].browse(list(partner_ids)):
+                if (
+                        partner.property_product_pricelist and
+                        partner.property_product_pricelist in
+                        distri_pricelists):
+                    distri_partner_ids.add(partner.id)
+        for company_id, day, product_id, partner_id, withdrawal_qty,\
+                loose_qty, sale_qty in res:
+            oil_type = oilproduct2oiltype.get(product_id)
+            if oil_type:
+                for category, qty in [
+                        ('withdrawal', withdrawal_qty),
+                        ('loose', loose_qty)]:
+                    key = (company_id, day, oil_type, category)
+                    key2qty[key] = key2qty.get(key, 0.0) + (qty or 0.0)
+            props = bottle2oiltypevol.get(product_id)
+            if props and sale_qty:
+                if partner_id in distri_partner_ids:
+                    category = 'distributor'
+                else:
+                    category = 'consumer'
+                for oil_type, vol in props.items():
+                    key = (company_id, day, oil_type, category)
+                    key2qty[key] = key2qty.get(key, 0.0) + sale_qty * vol
+
+    @api.model
+    def _ledger_add(self, key2qty):
+        '''Adds the quantities of key2qty to the ledger rows,
+        creating the missing rows'''
+        for (company_id, day, oil_type, category), qty in key2qty.items():
+            if not qty:
+                continue
+            self._cr.execute("""
+                UPDATE olive_agrimer_ledger
+                SET qty = qty + %s, write_uid = %s,
+                write_date = (now() at time zone 'UTC')
+                WHERE company_id = %s AND date = %s AND category = %s
+                AND oil_type IS NOT DISTINCT FROM %s
+                """, (qty, self._uid, company_id, day, category,
+                      oil_type or None))
+            if not self._cr.rowcount:
+                self.sudo().create({
+                    'company_id': company_id,
+                    'date': day,
+                    'oil_type': oil_type,
+                    'category': category,
+                    'qty': qty,
+                    })
+        self.invalidate_cache(['qty'])
+
+    @api.model
+    def feed_arrival_lines(self, lines, sign=1):
+        if not lines:
+            return
+        key2qty = {}
+        oilproduct2oiltype = self._get_oil_type_tables(
+            product_ids=lines.mapped('oil_product_id').ids)[0]
+        self._scan_arrival_lines(
+            key2qty, oilproduct2oiltype, sign=sign, line_ids=lines.ids)
+        # The arrival lines may have been pressed before:
+        # only keep arrival qty here
+        key2qty = dict([
+            (key, qty) for (key, qty) in key2qty.items()
+            if key[3] == 'arrival'])
+        self._ledger_add(key2qty)
+
+    @api.model
+    def feed_production_lines(self, lines):
+        if not lines:
+            return
+        key2qty = {}
+        oilproduct2oiltype = self._get_oil_type_tables(
+            product_ids=lines.mapped('oil_product_id').ids)[0]
+        self._scan_arrival_lines(
+            key2qty, oilproduct2oiltype, line_ids=lines.ids)
+        key2qty = dict([
+            (key, qty) for (key, qty) in key2qty.items()
+            if key[3] != 'arrival'])
+        self._ledger_add(key2qty)
+
+    @api.model
+    def feed_moves(self, moves):
+        moves = moves.filtered(
+            lambda m: m.product_id.olive_type in
+            ('oil', 'bottle_full', 'bottle_full_pack') and
+            'customer' in (m.location_id.usage, m.location_dest_id.usage))
+        if not moves:
+            return
+        key2qty = {}
+        oilproduct2oiltype, bottle2oiltypevol = self._get_oil_type_tables(
+            product_ids=moves.mapped('product_id').ids)
+        self._scan_moves(
+            key2qty, oilproduct2oiltype, bottle2oiltypevol,
+            move_ids=moves.ids)
+        self._ledger_add(key2qty)
+
+    @api.model
+    def rebuild(self, company, date_start, date_end):
+        '''Re-generate the ledger rows of company between date_start
+        and date_end (included) from the arrivals, the productions
+        and the stock moves, by chunks of REBUILD_CHUNK_DAYS days'''
+        logger.info(
+            'Rebuilding AgriMer ledger of company %s from %s to %s',
+            company.name, date_start, date_end)
+        self._cr.execute("""
+            DELETE FROM olive_agrimer_ledger
+            WHERE company_id = %s AND date >= %s AND date <= %s
+            """, (company.id, date_start, date_end))
+        self.invalidate_cache()
+        oilproduct2oiltype, bottle2oiltypevol = self._get_oil_type_tables()
+        chunk_start_dt = fields.Date.from_string(date_start)
+        end_dt = fields.Date.from_string(date_end)
+        while chunk_start_dt <= end_dt:
+            chunk_end_dt = min(
+                chunk_start_dt + timedelta(days=REBUILD_CHUNK_DAYS - 1),
+                end_dt)
+            chunk_start = fields.Date.to_string(chunk_start_dt)
+            chunk_end = fields.Date.to_string(chunk_end_dt)
+            key2qty = {}
+            self._scan_arrival_lines(
+                key2qty, oilproduct2oiltype, company_id=company.id,
+                date_start=chunk_start, date_end=chunk_end)
+            self._scan_moves(
+                key2qty, oilproduct2oiltype, bottle2oiltypevol,
+                company_id=company.id,
+                date_start=chunk_start, date_end=chunk_end)
+            self._ledger_add(key2qty)
+            logger.debug(
+                'AgriMer ledger rebuilt from %s to %s', chunk_start,
+                chunk_end)
+            chunk_start_dt = chunk_end_dt + timedelta(days=1)
+        logger.info('AgriMer ledger rebuild finished')
+
+    @api.model
+    def rebuild_all(self, companies=None):
+        '''Re-generate the full history of the ledger of the companies
+        (all the companies by default)'''
+        if companies is None:
+            companies = self.env['res.company'].search([])
+        for company in companies:
+            self._cr.execute("""
+                SELECT MIN(day), MAX(day) FROM (
+                    SELECT arrival_date AS day FROM olive_arrival_line
+                    WHERE company_id = %s AND arrival_state = 'done'
+                    UNION ALL
+                    SELECT production_date FROM olive_arrival_line
+                    WHERE company_id = %s AND production_state = 'done'
+                    UNION ALL
+                    SELECT date::date FROM stock_move
+                    WHERE company_id = %s AND state = 'done'
+                    ) AS days
+                """, (company.id, company.id, company.id))
+            date_start, date_end = self._cr.fetchone()
+            if not date_start:
+                continue
+            self.rebuild(company, date_start, date_end)
+
+    @api.model
+    def init_ledger(self):
+        '''Called when installing or upgrading the module: fill the ledger
+        of the companies that don't have one yet. Afterwards, the ledger is
+        fed by the arrivals, the productions and the stock moves ;
+        use rebuild() to re-generate a period'''
+        self._cr.execute(
+            "SELECT DISTINCT company_id FROM olive_agrimer_ledger")
+        company_ids = [row[0] for row in self._cr.fetchall()]
+        companies = self.env['res.company'].search(
+            [('id', 'not in', company_ids)])
+        self.rebuild_all(companies)
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Barroux Abbey (https://www.barroux.org/)
+# @author: Alexis de Lattre <alexis.delattre@akretion.com>
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import models
+
+
+class OliveArrival(models.Model):
+    _inherit = 'olive.arrival'
+
+    def validate(self):
+        res = super(OliveArrival, self).validate()
+        if self.state == 'done':
+            self.env['olive.agrimer.ledger'].feed_arrival_lines(
+                self.line_ids)
+        return res
+
+    def cancel(self):
+        done_arrivals = self.filtered(lambda x: x.state == 'done')
+        self.env['olive.agrimer.ledger'].feed_arrival_lines(
+            done_arrivals.mapped('line_ids'), sign=-1)
+        return super(OliveArrival, self).cancel()
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Barroux Abbey (https://www.barroux.org/)
+# @author: Alexis de Lattre <alexis.delattre@akretion.com>
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import models
+
+
+class OliveOilProduction(models.Model):
+    _inherit = 'olive.oil.production'
+
+    def check2done(self):
+        res = super(OliveOilProduction, self).check2done()
+        self.env['olive.agrimer.ledger'].feed_production_lines(
+            self.line_ids)
+        return res
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Barroux Abbey (https://www.barroux.org/)
+# @author: Alexis de Lattre <alexis.delattre@akretion.com>
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import models
+
+
+class StockMove(models.Model):
+    _inherit = 'stock.move'
+
+    def action_done(self):
+        res = super(StockMove, self).action_done()
+        self.env['olive.agrimer.ledger'].feed_moves(
+            self.filtered(lambda m: m.state == 'done'))
+        return res
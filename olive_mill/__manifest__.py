@@ -30,11 +30,18 @@
         'data/sequence.xml',
         'data/organic_certifying_entity.xml',
         'data/cron.xml',
+        'data/olive_oil_bottle_explosion.xml',
+        'data/olive_oil_compensation_day.xml',
+        'data/olive_perf.xml',
+        'data/olive_lended_balance.xml',
+        'data/olive_oil_withdrawal_balance.xml',
+        'data/olive_oil_analysis_cube.xml',
         'report/report.xml',
         'views/menu.xml',
         'wizard/olive_palox_case_lend_view.xml',
         'wizard/olive_palox_generate_production_view.xml',
         'wizard/olive_withdrawal_view.xml',
+        'wizard/olive_withdrawal_batch_view.xml',
         'wizard/olive_invoice_create_view.xml',
         'wizard/olive_oil_production_ratio2force_view.xml',
         'wizard/olive_oil_production_force_ratio_view.xml',
@@ -44,13 +51,19 @@
         'wizard/olive_oil_production_compensation_view.xml',
         'wizard/olive_oil_production_product_swap_view.xml',
         'wizard/olive_oil_tank_merge_view.xml',
+        'wizard/olive_oil_tank_merge_batch_view.xml',
         'wizard/olive_oil_bottling_view.xml',
+        'wizard/olive_oil_bottling_run_view.xml',
         'wizard/olive_oil_picking_view.xml',
         'wizard/olive_appointment_print_view.xml',
         'wizard/olive_oil_production_day_print_view.xml',
+        'wizard/olive_day_print_view.xml',
         'wizard/olive_partner_warning_print_view.xml',
+        'wizard/olive_season_forecast_view.xml',
+        'wizard/olive_oil_analysis_import_view.xml',
         'views/olive_config_settings.xml',
         'views/stock_location.xml',
+        'views/stock_quant.xml',
         'views/stock_warehouse.xml',
         'views/stock_picking.xml',
         'views/olive_variant.xml',
@@ -73,6 +86,8 @@
         'views/product.xml',
         'views/stock_production_lot.xml',
         'views/olive_oil_analysis.xml',
+        'views/olive_oil_analysis_cube.xml',
+        'views/olive_perf_sample.xml',
     ],
     'demo': [
         'demo/product.xml',
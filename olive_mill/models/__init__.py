@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*-
 
+from . import olive_perf_sample
+from . import olive_tracking
+from . import ir_sequence
 from . import partner
 from . import users
 from . import product
+from . import olive_oil_bottle_explosion
 from . import company
 from . import olive_config_settings
 from . import stock_warehouse
@@ -21,8 +25,10 @@ from . import olive_preseason_poll
 from . import olive_arrival
 from . import olive_oil_production
 from . import olive_oil_analysis
+from . import olive_oil_analysis_cube
 from . import olive_sale_pricelist
 from . import stock_location
+from . import stock_quant
 from . import stock_production_lot
 from . import stock_picking
 from . import mrp_bom
@@ -4,9 +4,74 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
 
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
 import odoo.addons.decimal_precision as dp
 
+# fields of res.company read by _olive_mill_context_data()
+MILL_CONTEXT_FIELDS = [
+    'olive_oil_density', 'olive_shrinkage_ratio', 'olive_filter_ratio',
+    'olive_min_ratio', 'olive_max_ratio', 'olive_oil_production_product_id',
+    'olive_oil_leaf_removal_product_id', 'olive_oil_tax_product_id',
+    'olive_oil_early_bird_discount_product_id']
+
+
+class OliveMillContext(object):
+    """Snapshot of the olive mill configuration of a company.
+    Get it with company.olive_mill_context(). The underlying data is
+    cached until one of the fields it is built from is modified on
+    res.company, stock.warehouse or olive.season, or until the next write
+    on decimal.precision."""
+
+    def __init__(self, env, data):
+        self.env = env
+        # data only contains primitive values (IDs, floats, ints)
+        for key, value in data.items():
+            setattr(self, key, value)
+
+    @property
+    def company(self):
+        return self.env['res.company'].browse(self.company_id)
+
+    @property
+    def season(self):
+        return self.env['olive.season'].browse(self.season_id)
+
+    @property
+    def warehouse(self):
+        return self.env['stock.warehouse'].browse(self.warehouse_id)
+
+    @property
+    def withdrawal_location(self):
+        return self.env['stock.location'].browse(self.withdrawal_loc_id)
+
+    @property
+    def compensation_location(self):
+        return self.env['stock.location'].browse(self.compensation_loc_id)
+
+    @property
+    def production_product(self):
+        return self.env['product.product'].browse(self.production_product_id)
+
+    @property
+    def leaf_removal_product(self):
+        return self.env['product.product'].browse(
+            self.leaf_removal_product_id)
+
+    @property
+    def tax_product(self):
+        return self.env['product.product'].browse(self.tax_product_id)
+
+    @property
+    def early_bird_discount_product(self):
+        return self.env['product.product'].browse(
+            self.early_bird_discount_product_id)
+
+    def olive_oil_liter2kg(self, qty):
+        return qty * self.density
+
+    def olive_oil_kg2liter(self, qty):
+        return qty * 1.0 / self.density
+
 
 class ResCompany(models.Model):
     _inherit = 'res.company'
@@ -151,30 +216,90 @@ class ResCompany(models.Model):
         return qty * 1.0 / self.olive_oil_density
 
     def olive_min_max_ratio(self):
-        self.ensure_one()
-        return (self.olive_min_ratio, self.olive_max_ratio)
+        mctx = self.olive_mill_context()
+        return (mctx.min_ratio, mctx.max_ratio)
 
-    def get_current_season(self):
+    @api.model
+    @tools.ormcache('company_id', 'today')
+    def _olive_mill_context_data(self, company_id, today):
+        company = self.browse(company_id)
+        dpo = self.env['decimal.precision']
+        wh = self.env['stock.warehouse'].search([
+            ('company_id', '=', company_id),
+            ('olive_mill', '=', True)],
+            limit=1)
+        season_id = self._get_current_season_id(company_id, today)
+        return {
+            'company_id': company_id,
+            'today': today,
+            'pr_oli': dpo.precision_get('Olive Weight'),
+            'pr_oil': dpo.precision_get('Olive Oil Volume'),
+            'pr_ratio': dpo.precision_get('Olive Oil Ratio'),
+            'pr_prod': dpo.precision_get('Product Unit of Measure'),
+            'density': company.olive_oil_density,
+            'shrinkage_ratio': company.olive_shrinkage_ratio,
+            'filter_ratio': company.olive_filter_ratio,
+            'min_ratio': company.olive_min_ratio,
+            'max_ratio': company.olive_max_ratio,
+            'season_id': season_id,
+            'warehouse_id': wh.id or False,
+            'withdrawal_loc_id': wh.olive_withdrawal_loc_id.id or False,
+            'compensation_loc_id': wh.olive_compensation_loc_id.id or False,
+            'production_product_id':
+            company.olive_oil_production_product_id.id or False,
+            'leaf_removal_product_id':
+            company.olive_oil_leaf_removal_product_id.id or False,
+            'tax_product_id': company.olive_oil_tax_product_id.id or False,
+            'early_bird_discount_product_id':
+            company.olive_oil_early_bird_discount_product_id.id or False,
+            }
+
+    def olive_mill_context(self):
+        """Returns an OliveMillContext object that gives access
+        to the precisions, ratios, current season, default olive mill and
+        service products of the company without any query once cached"""
         self.ensure_one()
         today = fields.Date.context_today(self)
-        season = self.env['olive.season'].search([
+        return OliveMillContext(
+            self.env, self._olive_mill_context_data(self.id, today))
+
+    def write(self, vals):
+        # invalidate olive_mill_context()
+        if any([field in vals for field in MILL_CONTEXT_FIELDS]):
+            self.clear_caches()
+        return super(ResCompany, self).write(vals)
+
+    @api.model
+    @tools.ormcache('company_id', 'today')
+    def _get_current_season_id(self, company_id, today):
+        """Cached per company and per day, invalidated by the writes
+        on olive.season. Returns an ID or False"""
+        oso = self.env['olive.season']
+        season = oso.search([
             ('start_date', '<=', today),
             ('end_date', '>=', today),
-            ('company_id', '=', self.id),
+            ('company_id', '=', company_id),
             ], limit=1)
         if season:
-            return season
-        season = self.env['olive.season'].search([
+            return season.id
+        season = oso.search([
             ('year', '=', today[:4]),
-            ('company_id', '=', self.id),
+            ('company_id', '=', company_id),
             ], limit=1)
         if season:
-            return season
-        season = self.env['olive.season'].search([
+            return season.id
+        season = oso.search([
             ('start_date', '<=', today),
-            ('company_id', '=', self.id)],
+            ('company_id', '=', company_id)],
             order='start_date desc', limit=1)
-        return season or False
+        return season.id or False
+
+    def get_current_season(self):
+        self.ensure_one()
+        today = fields.Date.context_today(self)
+        season_id = self._get_current_season_id(self.id, today)
+        return season_id and self.env['olive.season'].browse(season_id) or\
+            False
 
     def _compute_current_season_id(self):
         for company in self:
@@ -182,6 +307,7 @@ class ResCompany(models.Model):
 
     def current_season_update(self, fields_view_get_result, view_type):
         self.ensure_one()
-        fields_view_get_result['arch'] = fields_view_get_result['arch'].replace(
+        res = fields_view_get_result
+        res['arch'] = res['arch'].replace(
             "'CURRENT_SEASON_ID'", str(self.current_season_id.id))
-        return fields_view_get_result
+        return res
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Barroux Abbey (https://www.barroux.org/)
+# @author: Alexis de Lattre <alexis.delattre@akretion.com>
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, fields, models
+import logging
+logger = logging.getLogger(__name__)
+
+
+def _select_nextval_multi(cr, seq_name, count):
+    cr.execute(
+        "SELECT nextval('%s') FROM generate_series(1, %%s)" % seq_name,
+        (count,))
+    return sorted([row[0] for row in cr.fetchall()])
+
+
+def _update_nogap_multi(self, number_increment, count):
+    # The no_gap implementation is transactional: on rollback,
+    # the reserved numbers are given back
+    self._cr.execute(
+        "UPDATE %s SET number_next = number_next + %%s WHERE id = %%s "
+        "RETURNING number_next" % self._table,
+        (number_increment * count, self.id))
+    number_next = self._cr.fetchone()[0] - number_increment * count
+    self.invalidate_cache(['number_next'], [self.id])
+    return [number_next + number_increment * i for i in range(count)]
+
+
+class IrSequence(models.Model):
+    _inherit = 'ir.sequence'
+
+    @api.model
+    def next_by_code_multi(self, sequence_code, count):
+        """Same as next_by_code(), but reserves count numbers in one query.
+        Returns a list of count names"""
+        if count <= 0:
+            return []
+        self.check_access_rights('read')
+        force_company = self._context.get('force_company')
+        if not force_company:
+            force_company = self.env.user.company_id.id
+        seqs = self.search([
+            ('code', '=', sequence_code),
+            ('company_id', 'in', [force_company, False])],
+            order='company_id')
+        if not seqs:
+            logger.debug(
+                "No ir.sequence has been found for code '%s'.", sequence_code)
+            return [False] * count
+        return seqs[0]._next_multi(count)
+
+    def _next_multi(self, count):
+        if not self.use_date_range:
+            return self._next_multi_do(count)
+        dt = self._context.get('ir_sequence_date') or fields.Date.today()
+        seq_date = self.env['ir.sequence.date_range'].search([
+            ('sequence_id', '=', self.id),
+            ('date_from', '<=', dt),
+            ('date_to', '>=', dt)], limit=1)
+        if not seq_date:
+            seq_date = self._create_date_range_seq(dt)
+        return seq_date.with_context(
+            ir_sequence_date_range=seq_date.date_from)._next_multi(count)
+
+    def _next_multi_do(self, count):
+        if self.implementation == 'standard':
+            numbers = _select_nextval_multi(
+                self._cr, 'ir_sequence_%03d' % self.id, count)
+        else:
+            numbers = _update_nogap_multi(self, self.number_increment, count)
+        return [self.get_next_char(number) for number in numbers]
+
+    @api.model
+    def olive_set_names(self, sequence_code, vals_list):
+        """Set the name of all the vals of vals_list which don't have one,
+        with a single reservation of numbers in the sequence"""
+        to_name = [
+            vals for vals in vals_list if vals.get('name', '/') == '/']
+        names = self.next_by_code_multi(sequence_code, len(to_name))
+        for vals, name in zip(to_name, names):
+            vals['name'] = name
+        return vals_list
+
+
+class IrSequenceDateRange(models.Model):
+    _inherit = 'ir.sequence.date_range'
+
+    def _next_multi(self, count):
+        seq = self.sequence_id
+        if seq.implementation == 'standard':
+            numbers = _select_nextval_multi(
+                self._cr, 'ir_sequence_%03d_%03d' % (seq.id, self.id), count)
+        else:
+            numbers = _update_nogap_multi(self, seq.number_increment, count)
+        return [seq.get_next_char(number) for number in numbers]
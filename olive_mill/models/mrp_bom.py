@@ -13,3 +13,51 @@ class MrpBom(models.Model):
     def _check_product_recursion(self):
         for bom in self.filtered(lambda b: b.product_tmpl_id.olive_type != 'oil'):
             super(MrpBom, bom)._check_product_recursion()
+
+    def _olive_bottle_products(self):
+        return self.mapped('product_tmpl_id').filtered(
+            lambda t: t.olive_type in ('bottle_full', 'bottle_full_pack')).\
+            with_context(active_test=False).mapped('product_variant_ids')
+
+    @api.model
+    def create(self, vals):
+        bom = super(MrpBom, self).create(vals)
+        bom._olive_bottle_products()._olive_bottle_explosion_refresh()
+        return bom
+
+    def write(self, vals):
+        products = self._olive_bottle_products()
+        res = super(MrpBom, self).write(vals)
+        products |= self._olive_bottle_products()
+        products._olive_bottle_explosion_refresh()
+        return res
+
+    def unlink(self):
+        products = self._olive_bottle_products()
+        res = super(MrpBom, self).unlink()
+        products._olive_bottle_explosion_refresh()
+        return res
+
+
+class MrpBomLine(models.Model):
+    _inherit = 'mrp.bom.line'
+
+    @api.model
+    def create(self, vals):
+        line = super(MrpBomLine, self).create(vals)
+        line.bom_id._olive_bottle_products()._olive_bottle_explosion_refresh()
+        return line
+
+    def write(self, vals):
+        boms = self.mapped('bom_id')
+        res = super(MrpBomLine, self).write(vals)
+        boms |= self.mapped('bom_id')
+        boms._olive_bottle_products()._olive_bottle_explosion_refresh()
+        return res
+
+    def unlink(self):
+        boms = self.mapped('bom_id')
+        res = super(MrpBomLine, self).unlink()
+        boms.exists()._olive_bottle_products().\
+            _olive_bottle_explosion_refresh()
+        return res
@@ -4,6 +4,7 @@
 
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
+from datetime import datetime
 
 
 class MrpProduction(models.Model):
@@ -23,17 +24,89 @@ class MrpProduction(models.Model):
 
     @api.multi
     def action_assign(self):
-        sqo = self.env['stock.quant']
-        for production in self:
-            if production.product_id.oil_product_type == 'can':
-                for raw_move in production.move_raw_ids:
-                    if raw_move.product_id.oil_product_type in ('oil', 'olive'):
-                        quants = sqo.search([('location_id', '=', raw_move.location_id.id), ('product_id', '=', raw_move.product_id.id)])
-                        lots = []
-                        for quant in quants:
-                            if quant.lot_id and quant.lot_id.id not in lots:
-                                lots.append(quant.lot_id.id)
-                        if len(lots) > 1:
-                            raise UserError(_(
-                                "You cannot consume '%s' from severals different lots on '%s'. You need to merge them first.") % (raw_move.product_id.display_name, raw_move.location_id.display_name))
+        # The oil of a bottling must come from a single lot
+        oil_raw_moves = self.filtered(
+            lambda p: p.product_id.olive_type == 'bottle_full').mapped(
+            'move_raw_ids').filtered(lambda m: m.product_id.olive_type == 'oil')
+        if oil_raw_moves:
+            lot_qty = self.env['stock.quant'].olive_lot_qty_get(
+                oil_raw_moves.mapped('location_id').ids,
+                oil_raw_moves.mapped('product_id').ids)
+            for raw_move in oil_raw_moves:
+                lots = lot_qty.get(
+                    (raw_move.location_id.id, raw_move.product_id.id), {})
+                if len([lot_id for lot_id in lots if lot_id]) > 1:
+                    raise UserError(_(
+                        "You cannot consume '%s' from severals different lots on '%s'. You need to merge them first.") % (raw_move.product_id.display_name, raw_move.location_id.display_name))
         return super(MrpProduction, self).action_assign()
+
+    @api.model
+    def olive_oil_bottling_produce(
+            self, bottle_product, bottle_qty, bom, src_location,
+            other_src_location, dest_location, bottle_lot, origin):
+        """Create the manufacturing order of a bottling operation and
+        mark it as done. The oil is taken from src_location and the
+        other components from other_src_location. Returns the MO"""
+        smo = self.env['stock.move']
+        mo = self.create({
+            'product_id': bottle_product.id,
+            'product_qty': bottle_qty,
+            'product_uom_id': bottle_product.uom_id.id,
+            'location_src_id': src_location.id,
+            'location_dest_id': dest_location.id,
+            'origin': origin,
+            'bom_id': bom.id,
+            })
+        assert mo.state == 'confirmed'
+        assert len(mo.move_raw_ids) > 0, 'Missing raw moves'
+        assert len(mo.move_finished_ids) == 1, 'Wrong finished moves'
+        assert mo.move_finished_ids[0].product_id == bottle_product, 'Wrong product on finished move'
+        oil_raw_move = smo.search([
+            ('product_id.olive_type', '=', 'oil'),
+            ('raw_material_production_id', '=', mo.id)])
+        other_raw_moves = smo.search([
+            ('product_id.olive_type', '!=', 'oil'),
+            ('raw_material_production_id', '=', mo.id)])
+        for rmove in other_raw_moves:
+            if rmove.product_id.tracking in ('lot', 'serial'):
+                raise UserError(_(
+                    "The bill of material has the component '%s' "
+                    "which is tracked by lot or serial. For the moment, "
+                    "the only supported scenario is where the only component "
+                    "of the bill of material tracked by lot is the oil.")
+                    % rmove.product_id.display_name)
+        # BOM has already been checked, so this should really never happen
+        assert len(oil_raw_move) == 1, 'Wrong number of oil raw moves'
+        # HACK change source location for other raw moves
+        other_raw_moves.write({'location_id': other_src_location.id})
+        mo.action_assign()
+        if mo.availability != 'assigned':
+            raise UserError(_(
+                "Could not reserve the raw material for this bottling operation. "
+                "Check that you have enough oil and empty bottles."))
+        for move_lot in oil_raw_move.move_lot_ids:
+            assert move_lot.lot_id
+            move_lot.quantity_done = move_lot.quantity
+        for rmove in other_raw_moves:
+            rmove.quantity_done = rmove.product_uom_qty
+        # raw lines should be green at this step
+        self.env['stock.move.lots'].create({
+            'move_id': mo.move_finished_ids[0].id,
+            'product_id': bottle_product.id,
+            'production_id': mo.id,
+            'quantity': bottle_qty,
+            'quantity_done': bottle_qty,
+            'lot_id': bottle_lot.id,
+            })
+        for raw_move_lot in oil_raw_move.move_lot_ids:
+            assert not raw_move_lot.lot_produced_id
+        oil_raw_move.move_lot_ids.write({'lot_produced_id': bottle_lot.id})
+        mo.write({
+            'state': 'progress',
+            'date_start': datetime.now(),
+            })
+        assert mo.post_visible is True
+        mo.post_inventory()
+        assert mo.check_to_done is True
+        mo.button_mark_done()
+        return mo
@@ -14,7 +14,7 @@ class OliveAppointment(models.Model):
     _name = 'olive.appointment'
     _description = 'Olive Appointment'
     _order = 'start_datetime desc'
-    _inherit = ['mail.thread']
+    _inherit = ['olive.tracking.mixin', 'mail.thread']
 
     # name is used when you create from calendar via the quick create pop-up
     # it is also used for appointments with type = 'other'
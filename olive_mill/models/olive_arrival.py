@@ -9,13 +9,15 @@ from odoo.tools import float_compare, float_is_zero, float_round
 from odoo.tools.misc import formatLang
 from babel.dates import format_date
 import odoo.addons.decimal_precision as dp
+from .olive_perf_sample import olive_perf
+from .olive_tracking import olive_batch_tracked
 
 
 class OliveArrival(models.Model):
     _name = 'olive.arrival'
     _description = 'Olive Arrival'
     _order = 'name desc'
-    _inherit = ['mail.thread']
+    _inherit = ['olive.tracking.mixin', 'mail.thread']
 
     name = fields.Char(string='Arrival Number', required=True, default='/')
     company_id = fields.Many2one(
@@ -154,17 +156,28 @@ class OliveArrival(models.Model):
         for re in res:
             self.browse(re['arrival_id'][0]).olive_qty = re['olive_qty']
 
+    def _get_lended_balances(self):
+        olbo = self.env['olive.lended.balance']
+        company2partners = {}
+        for arrival in self:
+            company2partners.setdefault(arrival.company_id.id, set()).add(
+                arrival.commercial_partner_id.id)
+        res = {}
+        for company_id, partner_ids in company2partners.items():
+            for partner_id, balance in olbo.get_balances(
+                    company_id, list(partner_ids)).items():
+                res[(company_id, partner_id)] = balance
+        return res
+
     @api.depends(
         'returned_regular_case', 'returned_organic_case', 'lended_case_id')
     def _compute_lended_case(self):
-        olco = self.env['olive.lended.case']
+        balances = self._get_lended_balances()
         for arrival in self:
-            cases_res = olco.read_group([
-                ('company_id', '=', arrival.company_id.id),
-                ('partner_id', '=', arrival.commercial_partner_id.id)],
-                ['regular_qty', 'organic_qty'], [])
-            lended_regular_case = cases_res and cases_res[0]['regular_qty'] or 0
-            lended_organic_case = cases_res and cases_res[0]['organic_qty'] or 0
+            balance = balances.get(
+                (arrival.company_id.id, arrival.commercial_partner_id.id), {})
+            lended_regular_case = balance.get('regular_qty', 0)
+            lended_organic_case = balance.get('organic_qty', 0)
             if not arrival.lended_case_id:
                 lended_regular_case -= arrival.returned_regular_case
                 lended_organic_case -= arrival.returned_organic_case
@@ -173,18 +186,17 @@ class OliveArrival(models.Model):
 
     @api.depends('returned_palox_ids', 'line_ids.palox_id')
     def _compute_lended_palox(self):
-        opo = self.env['olive.palox']
+        balances = self._get_lended_balances()
         for arrival in self:
-            lended_palox = opo.search([
-                ('borrower_partner_id', '=', arrival.commercial_partner_id.id)])
+            partner = arrival.commercial_partner_id
+            balance = balances.get((arrival.company_id.id, partner.id), {})
+            lended_palox = balance.get('palox_qty', 0)
             if arrival.state in ('draft', 'weighted'):
-                for rp in arrival.returned_palox_ids:
-                    if rp in lended_palox:
-                        lended_palox -= rp
-                for line in arrival.line_ids:
-                    if line.palox_id in lended_palox:
-                        lended_palox -= line.palox_id
-            arrival.lended_palox = len(lended_palox)
+                returned_palox = arrival.returned_palox_ids |\
+                    arrival.line_ids.mapped('palox_id')
+                lended_palox -= len(returned_palox.filtered(
+                    lambda p: p.borrower_partner_id == partner))
+            arrival.lended_palox = lended_palox
 
     @api.constrains('date', 'harvest_start_date')
     def arrival_check(self):
@@ -220,6 +232,12 @@ class OliveArrival(models.Model):
                 'olive.arrival')
         return super(OliveArrival, self).create(vals)
 
+    @api.model
+    def olive_create_multi(self, vals_list):
+        """Create several arrivals with one reservation in the sequence"""
+        self.env['ir.sequence'].olive_set_names('olive.arrival', vals_list)
+        return self.browse([self.create(vals).id for vals in vals_list])
+
     def cancel(self):
         for arrival in self:
             if all([line.production_id for line in arrival.line_ids]):
@@ -237,12 +255,13 @@ class OliveArrival(models.Model):
                 lambda l: l.state == 'cancel').write({'state': 'draft'})
         self.write({'state': 'draft'})
 
+    @olive_perf
     def check_arrival(self):
         warn_msgs = []
         oalo = self.env['olive.arrival.line']
-        pr_oli = self.env['decimal.precision'].precision_get('Olive Weight')
-        pr_oil = self.env['decimal.precision'].precision_get(
-            'Olive Oil Volume')
+        mctx = self.company_id.olive_mill_context()
+        pr_oli = mctx.pr_oli
+        pr_oil = mctx.pr_oil
         wh = self.warehouse_id
         olive_culture_type = self.commercial_partner_id.olive_culture_type
         if self.returned_regular_case or self.returned_organic_case:
@@ -397,6 +416,8 @@ class OliveArrival(models.Model):
         self.write({'state': 'weighted'})
         return self.check()
 
+    @olive_perf
+    @olive_batch_tracked
     def validate(self):
         self.ensure_one()
         assert self.state in ('draft', 'weighted')
@@ -404,7 +425,6 @@ class OliveArrival(models.Model):
         if not self.line_ids:
             raise UserError(_(
                 "Missing lines on arrival '%s'.") % self.name)
-        ooao = self.env['olive.oil.analysis']
         warn_msgs, action = self.check_arrival()
         if warn_msgs:
             if not self._context.get('olive_no_warning'):
@@ -418,37 +438,11 @@ class OliveArrival(models.Model):
             'state': 'done',
             'done_datetime': fields.Datetime.now(),
             }
-        i = 0
-        for line in self.line_ids:
-            i += 1
-            if line.palox_id.borrower_partner_id:
-                line.palox_id.return_borrowed_palox()
-            for palox in self.returned_palox_ids:
-                if palox.borrower_partner_id:
-                    palox.return_borrowed_palox()
-            # Create analysis
-            ana_products = self.env['product.product']
-            for extra in line.extra_ids.filtered(lambda x: x.product_id.olive_type == 'analysis'):
-                ana_products |= extra.product_id
-            if ana_products:
-                existing_ana = ooao.search(
-                    [('arrival_line_id', '=', line.id)], limit=1)
-                if not existing_ana:
-                    ana_vals = {
-                        'oil_source_type': 'arrival',
-                        'arrival_line_id': line.id,
-                        'line_ids': [],
-                        'season_id': self.season_id.id,
-                        'oil_product_id': line.oil_product_id.id,
-                        }
-                    for ana_product in ana_products:
-                        ana_vals['line_ids'].append((0, 0, {'product_id': ana_product.id}))
-                    ooao.create(ana_vals)
-
-            # Set line number
-            line.write({
-                'name': '%s/%s' % (self.name, i),
-                })
+        returned_palox = self.line_ids.mapped('palox_id') |\
+            self.returned_palox_ids
+        returned_palox.filtered('borrower_partner_id').return_borrowed_palox()
+        self.create_analysis()
+        self.set_line_numbers()
 
         if self.returned_regular_case or self.returned_organic_case:
             lended_case_vals = {
@@ -467,6 +461,53 @@ class OliveArrival(models.Model):
         self.write(arrival_vals)
         self.line_ids.write({'state': 'done'})
 
+    def create_analysis(self):
+        """Create the analysis requested by the extras of the arrival lines.
+        Works on several arrivals, with one query for the existing analysis
+        and one reservation of numbers in the sequence"""
+        ooao = self.env['olive.oil.analysis']
+        lines = self.mapped('line_ids')
+        existing_line_ids = set([ana['arrival_line_id'][0] for ana in ooao.search_read(
+            [('arrival_line_id', 'in', lines.ids)], ['arrival_line_id'])])
+        # prefetch the products of the extras of all the lines
+        lines.mapped('extra_ids.product_id.olive_type')
+        ana_vals_list = []
+        for line in lines:
+            if line.id in existing_line_ids:
+                continue
+            ana_products = line.extra_ids.filtered(
+                lambda x: x.product_id.olive_type == 'analysis').mapped(
+                'product_id')
+            if ana_products:
+                ana_vals_list.append({
+                    'oil_source_type': 'arrival',
+                    'arrival_line_id': line.id,
+                    'line_ids': [
+                        (0, 0, {'product_id': ana_product.id})
+                        for ana_product in ana_products],
+                    'season_id': line.arrival_id.season_id.id,
+                    'oil_product_id': line.oil_product_id.id,
+                    })
+        return ooao.olive_create_multi(ana_vals_list)
+
+    def set_line_numbers(self):
+        """Set the name of the arrival lines (ARRIVAL/1, ARRIVAL/2...)
+        with a single query"""
+        self._cr.execute("""
+            UPDATE olive_arrival_line l
+            SET name = a.name || '/' || sub.number,
+                write_uid = %s, write_date = now() at time zone 'UTC'
+            FROM (
+                SELECT id, row_number() OVER (
+                    PARTITION BY arrival_id ORDER BY id) AS number
+                FROM olive_arrival_line
+                WHERE arrival_id IN %s
+            ) AS sub, olive_arrival a
+            WHERE l.id = sub.id AND a.id = l.arrival_id
+            """, (self._uid, tuple(self.ids)))
+        self.env['olive.arrival.line'].invalidate_cache(
+            ['name', 'write_uid', 'write_date'], self.mapped('line_ids').ids)
+
     def unlink(self):
         for arrival in self:
             if any([l.state == 'done' for l in arrival.line_ids]):
@@ -480,6 +521,51 @@ class OliveArrival(models.Model):
         action = self.env['report'].get_action(self, 'olive.arrival')
         return action
 
+    def report_prefetch(self):
+        """Read in bulk the data printed on the arrival tickets, in the
+        environment of each language used by the template (the language
+        of the farmer). Returns this data, which is used to detect
+        unchanged documents"""
+        lang2arrivals = {}
+        for arrival in self:
+            lang = arrival.partner_id.lang or 'en_US'
+            lang2arrivals[lang] = lang2arrivals.get(lang, self.browse()) | arrival
+        res = {}
+        for lang, arrivals in lang2arrivals.items():
+            arrivals = arrivals.with_context(lang=lang)
+            lines = arrivals.mapped('line_ids')
+            res[lang] = {
+                'arrivals': arrivals.read([
+                    'name', 'date', 'harvest_start_date', 'state', 'olive_qty',
+                    'partner_id', 'olive_cultivation_form_ko',
+                    'olive_parcel_ko', 'olive_organic_certif_ko',
+                    'olive_organic_certified_logo', 'lended_regular_case',
+                    'lended_organic_case', 'lended_palox',
+                    'returned_regular_case', 'returned_organic_case',
+                    'returned_palox_ids', 'line_ids']),
+                'lines': lines.read([
+                    'name', 'ochard_id', 'variant_id', 'palox_id', 'olive_qty',
+                    'leaf_removal', 'ripeness', 'sanitary_state',
+                    'oil_destination', 'mix_withdrawal_oil_qty',
+                    'oil_product_id', 'extra_ids']),
+                'extras': lines.mapped('extra_ids').read([
+                    'qty', 'product_id', 'fillup']),
+                'partners': arrivals.mapped('partner_id').read([
+                    'name', 'parent_id', 'street', 'street2', 'zip', 'city',
+                    'state_id', 'country_id']),
+                # the template prints the full address, which contains
+                # the names of the state and of the country
+                'addresses': dict([
+                    (partner.id, partner._display_full_address())
+                    for partner in arrivals.mapped('partner_id')]),
+                'commercial_partners': arrivals.mapped(
+                    'partner_id.commercial_partner_id').read(['ref', 'vat']),
+                'palox': (
+                    lines.mapped('palox_id') |
+                    arrivals.mapped('returned_palox_ids')).read(['name']),
+                }
+        return res
+
     @api.model
     def fields_view_get(self, view_id=None, view_type='form', toolbar=False, submenu=False):
         res = super(OliveArrival, self).fields_view_get(
@@ -828,6 +914,9 @@ class OliveArrivalLine(models.Model):
     @api.depends('name', 'commercial_partner_id', 'variant_id')
     def name_get(self):
         res = []
+        # read the farmers and the variants of all the lines at once
+        self.mapped('commercial_partner_id.name')
+        self.mapped('variant_id.name')
         for rec in self:
             name = rec.name
             if rec.commercial_partner_id:
@@ -836,21 +925,19 @@ class OliveArrivalLine(models.Model):
         return res
 
     def oil_qty_compute_other_vals(self, oil_qty, compensation_oil_qty, ratio):
-        pr_oil = self.env['decimal.precision'].precision_get(
-            'Olive Oil Volume')
-        pr_oli = self.env['decimal.precision'].precision_get('Olive Weight')
-        pr_ratio = self.env['decimal.precision'].precision_get(
-            'Olive Oil Ratio')
-        company = self.production_id.company_id
-        density = company.olive_oil_density
-        shrinkage_ratio = company.olive_shrinkage_ratio
-        filter_ratio = company.olive_filter_ratio
+        mctx = self.production_id.company_id.olive_mill_context()
+        pr_oil = mctx.pr_oil
+        pr_oli = mctx.pr_oli
+        pr_ratio = mctx.pr_ratio
+        density = mctx.density
+        shrinkage_ratio = mctx.shrinkage_ratio
+        filter_ratio = mctx.filter_ratio
         oil_destination = self.oil_destination
         ctype = self.compensation_type
         if not density:
             raise UserError(_(
                 "Missing Olive Oil Density on company '%s'")
-                % company.display_name)
+                % mctx.company.display_name)
         oil_qty = float_round(oil_qty, precision_digits=pr_oil)
         compensation_oil_qty = float_round(
             compensation_oil_qty, precision_digits=pr_oil)
@@ -966,17 +1053,16 @@ class OliveArrivalLine(models.Model):
 
     def create_in_invoice_lines(self, invoice):
         ailo = self.env['account.invoice.line'].with_context(type='in_invoice')
-        pr_oli = self.env['decimal.precision'].precision_get('Olive Weight')
+        pr_oli = invoice.company_id.olive_mill_context().pr_oli
         partner = invoice.partner_id
         lang = partner.lang or self.env.user.lang
         pricelist = partner.property_product_pricelist
         currency = pricelist.currency_id
         saledict = {}  # key = arrival, value = {'product': sale_oil_qty}
         # I can't do a double groupby via read_group()
-        if partner.olive_sale_pricelist_id:
-            product2price = partner.olive_sale_pricelist_id.prepare_speeddict()
-        else:
-            product2price = {}
+        olive_pricelist = partner.olive_sale_pricelist_id
+        # key = (product, quantity), value = price_unit or None
+        seller_cache = {}
         for line in self:
             arrival = line.arrival_id
             product = line.oil_product_id
@@ -1004,14 +1090,24 @@ class OliveArrivalLine(models.Model):
                     product.with_context(lang=lang).name,
                     arrival.name, arrival_date_formatted)
                 il_vals['quantity'] = quantity
-                seller = product._select_seller(
-                    partner, quantity=quantity, uom_id=product.uom_id)
-                if seller:
-                    price_unit = seller.currency_id.compute(
-                        seller.price, currency)
-                elif product in product2price:
-                    price_unit = product2price[product]
-                else:
+                if (product, quantity) not in seller_cache:
+                    seller_price = None
+                    # Only call _select_seller() when the partner is
+                    # one of the suppliers of the product
+                    if (partner | partner.parent_id) & product.seller_ids.mapped(
+                            'name'):
+                        seller = product._select_seller(
+                            partner, quantity=quantity,
+                            uom_id=product.uom_id)
+                        if seller:
+                            seller_price = seller.currency_id.compute(
+                                seller.price, currency)
+                    seller_cache[(product, quantity)] = seller_price
+                price_unit = seller_cache[(product, quantity)]
+                if price_unit is None and olive_pricelist:
+                    price_unit = olive_pricelist.get_product_price(
+                        product, date=arrival.date)
+                if price_unit is None:
                     price_unit = 0.0
                 il_vals['price_unit'] = price_unit
                 iline = ailo.create(il_vals)
@@ -1026,10 +1122,10 @@ class OliveArrivalLine(models.Model):
     def create_out_invoice_lines(self, invoice):
         ailo = self.env['account.invoice.line'].with_context(type='out_invoice')
         ppo = self.env['product.product']
-        pr_oil = self.env['decimal.precision'].precision_get(
-            'Olive Oil Volume')
-        pr_oli = self.env['decimal.precision'].precision_get('Olive Weight')
         company = invoice.company_id
+        mctx = company.olive_mill_context()
+        pr_oil = mctx.pr_oil
+        pr_oli = mctx.pr_oli
         partner = invoice.partner_id
         pricelist = partner.property_product_pricelist
         season = self[0].season_id
@@ -1124,7 +1220,7 @@ class OliveArrivalLine(models.Model):
         price_unit_kg = pricelist.get_product_price(
             tax_product, qty, partner)
         qty_kg = float_round(
-            qty * company.olive_oil_density, precision_digits=pr_oil)
+            mctx.olive_oil_liter2kg(qty), precision_digits=pr_oil)
         il_vals['quantity'] = qty_kg
         il_vals['price_unit'] = price_unit_kg
         il_vals['name'] += _(u" (%s L = %s kg)") % (
@@ -1149,6 +1245,7 @@ class OliveArrivalLine(models.Model):
             ailo.create(il_vals)
         invoice.compute_taxes()
 
+    @olive_perf
     def in_invoice_create(self):
         aio = self.env['account.invoice']
         vals = self.prepare_invoice('in_invoice')
@@ -1156,6 +1253,7 @@ class OliveArrivalLine(models.Model):
         self.create_in_invoice_lines(invoice)
         return invoice
 
+    @olive_perf
     def out_invoice_create(self):
         aio = self.env['account.invoice']
         vals = self.prepare_invoice('out_invoice')
@@ -4,6 +4,8 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
 from odoo import api, fields, models
+import logging
+logger = logging.getLogger(__name__)
 
 
 class OliveLendedCase(models.Model):
@@ -52,8 +54,126 @@ class OliveLendedCase(models.Model):
             res.append((rec.id, name))
         return res
 
+    def _balance_deltas(self, sign=1):
+        deltas = {}
+        for rec in self:
+            if rec.company_id and rec.partner_id:
+                delta = deltas.setdefault(
+                    (rec.company_id.id, rec.partner_id.id), [0, 0, 0])
+                delta[0] += rec.regular_qty * sign
+                delta[1] += rec.organic_qty * sign
+        return deltas
+
+    @api.model
+    def create(self, vals):
+        rec = super(OliveLendedCase, self).create(vals)
+        self.env['olive.lended.balance']._add(rec._balance_deltas())
+        return rec
+
+    def write(self, vals):
+        olbo = self.env['olive.lended.balance']
+        update_balance = any([
+            field in vals for field in
+            ['company_id', 'partner_id', 'regular_qty', 'organic_qty']])
+        if update_balance:
+            olbo._add(self._balance_deltas(sign=-1))
+        res = super(OliveLendedCase, self).write(vals)
+        if update_balance:
+            olbo._add(self._balance_deltas())
+        return res
+
+    def unlink(self):
+        self.env['olive.lended.balance']._add(self._balance_deltas(sign=-1))
+        return super(OliveLendedCase, self).unlink()
+
     @api.model
     def fields_view_get(self, view_id=None, view_type='form', toolbar=False, submenu=False):
         res = super(OliveLendedCase, self).fields_view_get(
             view_id=view_id, view_type=view_type, toolbar=toolbar, submenu=submenu)
         return self.env.user.company_id.current_season_update(res, view_type)
+
+
+class OliveLendedBalance(models.Model):
+    _name = 'olive.lended.balance'
+    _description = 'Lended Cases and Palox Balance per Olive Farmer'
+    _rec_name = 'partner_id'
+
+    company_id = fields.Many2one(
+        'res.company', string='Company', required=True, ondelete='cascade',
+        readonly=True)
+    partner_id = fields.Many2one(
+        'res.partner', string='Olive Farmer', required=True,
+        ondelete='cascade', readonly=True)
+    regular_qty = fields.Integer(string='Lended Cases', readonly=True)
+    organic_qty = fields.Integer(string='Lended Organic Cases', readonly=True)
+    palox_qty = fields.Integer(string='Lended Palox', readonly=True)
+
+    _sql_constraints = [(
+        'company_partner_unique',
+        'unique(company_id, partner_id)',
+        'There is already a balance for this farmer in this company.')]
+
+    @api.model
+    def _add(self, deltas):
+        """deltas = {(company_id, partner_id): [regular, organic, palox]}"""
+        for (company_id, partner_id), delta in deltas.items():
+            if not any(delta):
+                continue
+            self._cr.execute("""
+                UPDATE olive_lended_balance
+                SET regular_qty = regular_qty + %s,
+                organic_qty = organic_qty + %s,
+                palox_qty = palox_qty + %s
+                WHERE company_id = %s AND partner_id = %s
+                """, tuple(delta) + (company_id, partner_id))
+            if not self._cr.rowcount:
+                self.sudo().create({
+                    'company_id': company_id,
+                    'partner_id': partner_id,
+                    'regular_qty': delta[0],
+                    'organic_qty': delta[1],
+                    'palox_qty': delta[2],
+                    })
+        self.invalidate_cache(['regular_qty', 'organic_qty', 'palox_qty'])
+
+    @api.model
+    def get_balances(self, company_id, partner_ids):
+        """Returns {partner_id: {'regular_qty': x, 'organic_qty': y,
+        'palox_qty': z}}. Farmers without balance are not in the dict."""
+        res = {}
+        for balance in self.search_read([
+                ('company_id', '=', company_id),
+                ('partner_id', 'in', partner_ids)],
+                ['partner_id', 'regular_qty', 'organic_qty', 'palox_qty']):
+            res[balance['partner_id'][0]] = balance
+        return res
+
+    @api.model
+    def rebuild(self):
+        """Fill the balances from the lended cases and the palox.
+        Only needed when installing or upgrading the module: afterwards,
+        the balances are kept up-to-date by the lended cases and the palox"""
+        self._cr.execute("DELETE FROM olive_lended_balance")
+        self._cr.execute("""
+            INSERT INTO olive_lended_balance (
+                create_uid, create_date, write_uid, write_date,
+                company_id, partner_id, regular_qty, organic_qty, palox_qty)
+            SELECT %s, now() at time zone 'UTC', %s, now() at time zone 'UTC',
+                company_id, partner_id,
+                SUM(regular_qty), SUM(organic_qty), SUM(palox_qty)
+            FROM (
+                SELECT company_id, partner_id,
+                    COALESCE(regular_qty, 0) AS regular_qty,
+                    COALESCE(organic_qty, 0) AS organic_qty,
+                    0 AS palox_qty
+                FROM olive_lended_case
+                WHERE company_id IS NOT NULL AND partner_id IS NOT NULL
+                UNION ALL
+                SELECT company_id, borrower_partner_id, 0, 0, 1
+                FROM olive_palox
+                WHERE borrower_partner_id IS NOT NULL AND active IS true
+            ) AS moves
+            GROUP BY company_id, partner_id
+            """, (self._uid, self._uid))
+        logger.info('%d lended balances generated', self._cr.rowcount)
+        self.invalidate_cache()
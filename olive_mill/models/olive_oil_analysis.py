@@ -7,13 +7,14 @@ from odoo import api, fields, models, _
 from odoo.exceptions import UserError
 from odoo.tools import float_is_zero
 from odoo.tools.misc import formatLang
+from .olive_oil_analysis_cube import CUBE_ANALYSIS_FIELDS
 
 
 class OliveOilAnalysis(models.Model):
     _name = 'olive.oil.analysis'
     _description = 'Olive Oil Analysis'
     _order = 'id desc'
-    _inherit = ['mail.thread']
+    _inherit = ['olive.tracking.mixin', 'mail.thread']
 
     name = fields.Char(string='Analysis Number', index=True, readonly=True)
     oil_source_type = fields.Selection([
@@ -86,6 +87,22 @@ class OliveOilAnalysis(models.Model):
                 'olive.oil.analysis')
         return super(OliveOilAnalysis, self).create(vals)
 
+    @api.model
+    def olive_create_multi(self, vals_list):
+        """Create several analysis with one reservation in the sequence"""
+        self.env['ir.sequence'].olive_set_names(
+            'olive.oil.analysis', vals_list)
+        return self.browse([self.create(vals).id for vals in vals_list])
+
+    def write(self, vals):
+        res = super(OliveOilAnalysis, self).write(vals)
+        if (
+                any([field in vals for field in CUBE_ANALYSIS_FIELDS]) and
+                ('state' in vals or any([
+                    ana.state == 'done' for ana in self]))):
+            self.env['olive.oil.analysis.cube'].refresh(self.ids)
+        return res
+
     @api.onchange('location_id')
     def location_id_change(self):
         if self.oil_source_type == 'tank' and self.location_id:
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Barroux Abbey (https://www.barroux.org/)
+# @author: Alexis de Lattre <alexis.delattre@akretion.com>
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, fields, models
+import odoo.addons.decimal_precision as dp
+import logging
+logger = logging.getLogger(__name__)
+
+CUBE_INSERT = """
+    INSERT INTO olive_oil_analysis_cube (
+        create_uid, create_date, write_uid, write_date,
+        analysis_line_id, analysis_id, product_id, result,
+        company_id, season_id, date, oil_product_id, oil_source_type,
+        partner_id, olive_culture_type, arrival_line_id, variant_id,
+        ochard_id, ripeness, sanitary_state, leaf_removal, harvest_delay,
+        production_id, oil_ratio, oil_ratio_net)
+    SELECT %s, now() at time zone 'UTC', %s, now() at time zone 'UTC',
+        l.id, a.id, l.product_id,
+        CASE l.decimal_precision
+            WHEN 0 THEN l.result_int
+            WHEN 1 THEN l.result_p1
+            WHEN 2 THEN l.result_p2
+        END,
+        a.company_id, a.season_id, a.date, a.oil_product_id,
+        a.oil_source_type, a.partner_id, al.olive_culture_type, al.id,
+        al.variant_id, al.ochard_id, al.ripeness, al.sanitary_state,
+        al.leaf_removal, ar.date - ar.harvest_start_date,
+        al.production_id, al.oil_ratio, al.oil_ratio_net
+    FROM olive_oil_analysis_line l
+    JOIN olive_oil_analysis a ON a.id = l.analysis_id
+    LEFT JOIN olive_arrival_line al ON al.id = a.arrival_line_id
+    LEFT JOIN olive_arrival ar ON ar.id = al.arrival_id
+    WHERE a.state = 'done'
+    """
+# fields of olive.oil.analysis that are copied in the cube
+CUBE_ANALYSIS_FIELDS = [
+    'state', 'line_ids', 'company_id', 'season_id', 'date', 'oil_product_id',
+    'oil_source_type', 'arrival_line_id']
+
+
+class OliveOilAnalysisCube(models.Model):
+    """One line per analysis line of the done analysis, with the attributes
+    of the arrival line and of the production: the pivot view
+    doesn't need any join. The cube is refreshed for the analysis that are
+    validated/re-opened and for the arrival lines of the productions
+    that are done."""
+    _name = 'olive.oil.analysis.cube'
+    _description = 'Olive Oil Quality Analytics'
+    _rec_name = 'product_id'
+    _order = 'date desc, id desc'
+
+    analysis_line_id = fields.Many2one(
+        'olive.oil.analysis.line', string='Analysis Line', required=True,
+        ondelete='cascade', readonly=True)
+    analysis_id = fields.Many2one(
+        'olive.oil.analysis', string='Analysis', required=True,
+        ondelete='cascade', readonly=True, index=True)
+    product_id = fields.Many2one(
+        'product.product', string='Analysis Type', readonly=True, index=True)
+    result = fields.Float(
+        string='Result', digits=(16, 2), readonly=True, group_operator='avg')
+    company_id = fields.Many2one(
+        'res.company', string='Company', readonly=True)
+    season_id = fields.Many2one(
+        'olive.season', string='Season', readonly=True, index=True)
+    date = fields.Date(string='Analysis Date', readonly=True)
+    oil_product_id = fields.Many2one(
+        'product.product', string='Oil Type', readonly=True)
+    oil_source_type = fields.Selection([
+        ('arrival', 'Arrival'),
+        ('tank', 'Tank'),
+        ], string='Oil Source Type', readonly=True)
+    partner_id = fields.Many2one(
+        'res.partner', string='Olive Farmer', readonly=True)
+    olive_culture_type = fields.Selection([
+        ('regular', 'Regular'),
+        ('organic', 'Organic'),
+        ('conversion', 'Conversion'),
+        ], string='Olive Culture Type', readonly=True)
+    arrival_line_id = fields.Many2one(
+        'olive.arrival.line', string='Arrival Line', readonly=True,
+        ondelete='set null', index=True)
+    variant_id = fields.Many2one(
+        'olive.variant', string='Olive Variant', readonly=True, index=True)
+    ochard_id = fields.Many2one('olive.ochard', string='Ochard', readonly=True)
+    ripeness = fields.Selection([
+        ('green', 'Green'),
+        ('in_between', 'In Between'),
+        ('optimal', 'Optimal'),
+        ('overripen', 'Over Ripen'),
+        ], string='Ripeness', readonly=True)
+    sanitary_state = fields.Selection([
+        ('good', 'Good'),
+        ('average', 'Average'),
+        ('fair', 'Fair'),
+        ], string='Sanitary State', readonly=True)
+    leaf_removal = fields.Boolean(string='Leaf Removal', readonly=True)
+    harvest_delay = fields.Integer(
+        string='Harvest to Arrival (days)', readonly=True,
+        group_operator='avg')
+    production_id = fields.Many2one(
+        'olive.oil.production', string='Production', readonly=True)
+    oil_ratio = fields.Float(
+        string='Oil Gross Ratio (% L)', readonly=True, group_operator='avg',
+        digits=dp.get_precision('Olive Oil Ratio'))
+    oil_ratio_net = fields.Float(
+        string='Oil Net Ratio (% L)', readonly=True, group_operator='avg',
+        digits=dp.get_precision('Olive Oil Ratio'))
+
+    @api.model
+    def refresh(self, analysis_ids):
+        """Re-generate the lines of the cube of the analysis"""
+        if not analysis_ids:
+            return
+        self._cr.execute(
+            "DELETE FROM olive_oil_analysis_cube WHERE analysis_id IN %s",
+            (tuple(analysis_ids), ))
+        self._cr.execute(
+            CUBE_INSERT + " AND a.id IN %s",
+            (self._uid, self._uid, tuple(analysis_ids)))
+        self.invalidate_cache()
+
+    @api.model
+    def refresh_arrival_lines(self, arrival_line_ids):
+        if not arrival_line_ids:
+            return
+        self._cr.execute("""
+            SELECT id FROM olive_oil_analysis
+            WHERE arrival_line_id IN %s AND state = 'done'
+            """, (tuple(arrival_line_ids), ))
+        self.refresh([row[0] for row in self._cr.fetchall()])
+
+    @api.model
+    def rebuild(self):
+        """Fill the cube from all the done analysis. Only needed when
+        installing or upgrading the module: afterwards, the cube is kept
+        up-to-date by the analysis and the productions"""
+        self._cr.execute("DELETE FROM olive_oil_analysis_cube")
+        self._cr.execute(CUBE_INSERT, (self._uid, self._uid))
+        logger.info('%d olive oil analysis cube lines generated',
+                    self._cr.rowcount)
+        self.invalidate_cache()
+
+    @api.model
+    def fields_view_get(self, view_id=None, view_type='form', toolbar=False, submenu=False):
+        res = super(OliveOilAnalysisCube, self).fields_view_get(
+            view_id=view_id, view_type=view_type, toolbar=toolbar, submenu=submenu)
+        return self.env.user.company_id.current_season_update(res, view_type)
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Barroux Abbey (https://www.barroux.org/)
+# @author: Alexis de Lattre <alexis.delattre@akretion.com>
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import fields, models
+import odoo.addons.decimal_precision as dp
+
+
+class OliveOilBottleExplosion(models.Model):
+    _name = 'olive.oil.bottle.explosion'
+    _description = 'Oil volume of full bottles and packs'
+    _order = 'product_id, bottle_product_id'
+
+    # Maintained by product.product._olive_bottle_explosion_refresh()
+    # when the BOMs of full bottles and packs are modified
+    # 1 line per full bottle
+    # 1 line per full bottle inside the pack for packs
+    product_id = fields.Many2one(
+        'product.product', string='Bottle or Pack', required=True,
+        ondelete='cascade', index=True, readonly=True)
+    olive_type = fields.Selection(
+        related='product_id.olive_type', readonly=True, store=True)
+    bom_id = fields.Many2one(
+        'mrp.bom', string='Bill of Material of the Bottle',
+        ondelete='cascade', readonly=True)
+    bottle_product_id = fields.Many2one(
+        'product.product', string='Full Bottle in Pack', ondelete='cascade',
+        readonly=True)
+    bottle_qty = fields.Float(
+        string='Bottles in Pack',
+        digits=dp.get_precision('Product Unit of Measure'), readonly=True)
+    oil_product_id = fields.Many2one(
+        'product.product', string='Oil Product', required=True,
+        ondelete='cascade', readonly=True)
+    olive_culture_type = fields.Selection(
+        related='oil_product_id.olive_culture_type', readonly=True,
+        store=True)
+    volume = fields.Float(
+        string='Oil Volume per Unit (L)',
+        digits=dp.get_precision('Olive Oil Volume'), readonly=True)
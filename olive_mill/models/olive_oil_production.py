@@ -7,13 +7,15 @@ from odoo import api, fields, models, tools, _
 from odoo.exceptions import UserError, ValidationError
 import odoo.addons.decimal_precision as dp
 from odoo.tools import float_compare, float_round
+from .olive_perf_sample import olive_perf
+from .olive_tracking import olive_batch_tracked, olive_tracking_batch
 
 
 class OliveOilProduction(models.Model):
     _name = 'olive.oil.production'
     _description = 'Olive Oil Production'
     _order = 'date desc, sequence, id desc'
-    _inherit = ['mail.thread']
+    _inherit = ['olive.tracking.mixin', 'mail.thread']
 
     name = fields.Char(string='Production Number', required=True, default='/')
     company_id = fields.Many2one(
@@ -239,6 +241,14 @@ class OliveOilProduction(models.Model):
                 'olive.oil.production')
         return super(OliveOilProduction, self).create(vals)
 
+    @api.model
+    def olive_create_multi(self, vals_list):
+        """Create several productions with one reservation in the sequence"""
+        self.env['ir.sequence'].olive_set_names(
+            'olive.oil.production', vals_list)
+        return self.browse([self.create(vals).id for vals in vals_list])
+
+    @olive_batch_tracked
     def cancel(self):
         for production in self:
             if production.state == 'done':
@@ -259,12 +269,13 @@ class OliveOilProduction(models.Model):
         assert self.state == 'cancel'
         self.write({'state': 'draft'})
 
+    @olive_perf
     def draft2ratio(self):
         """Attach arrival lines to olive.oil.production"""
         self.ensure_one()
         assert self.state == 'draft'
         oalo = self.env['olive.arrival.line']
-        pr_oli = self.env['decimal.precision'].precision_get('Olive Weight')
+        pr_oli = self.company_id.olive_mill_context().pr_oli
         if not self.line_ids:
             draft_lines = oalo.search([
                 ('palox_id', '=', self.palox_id.id),
@@ -346,7 +357,7 @@ class OliveOilProduction(models.Model):
             cloc.sudo().oil_product_id = self.oil_product_id.id
         compensation_oil_qty = self.compensation_check_tank()
         if self.compensation_type == 'first':
-            density = self.company_id.olive_oil_density
+            density = self.company_id.olive_mill_context().density
             self.write({
                 'compensation_oil_qty': compensation_oil_qty,
                 'compensation_oil_qty_kg': compensation_oil_qty * density,
@@ -389,12 +400,14 @@ class OliveOilProduction(models.Model):
             'state': 'check',
             })
 
+    @olive_perf
     def set_qty_on_lines(self, force_ratio=False):
         """force_ratio=(line_to_force, ratio)
         All pro-rata computation is handled here"""
         self.ensure_one()
-        pr_oil = self.env['decimal.precision'].precision_get('Olive Oil Volume')
-        pr_ratio = self.env['decimal.precision'].precision_get('Olive Oil Ratio')
+        mctx = self.company_id.olive_mill_context()
+        pr_oil = mctx.pr_oil
+        pr_ratio = mctx.pr_ratio
         total_oil_qty = self.oil_qty
         ctype = self.compensation_type
         if ctype == 'last':
@@ -450,7 +463,7 @@ class OliveOilProduction(models.Model):
         '''Performs check and return the qty of the tank'''
         self.ensure_one()
         ctype = self.compensation_type
-        pr_oil = self.env['decimal.precision'].precision_get('Olive Oil Volume')
+        pr_oil = self.company_id.olive_mill_context().pr_oil
         cloc = self.compensation_location_id
         if not cloc:
             if ctype == 'none':
@@ -471,12 +484,14 @@ class OliveOilProduction(models.Model):
                     "The production %s uses first of day compensation, so the compensation tank mustn't be empty before the operation.") % self.name)
         return cqty
 
+    @olive_perf
+    @olive_batch_tracked
     def check2done(self):
         self.ensure_one()
         assert self.state == 'check'
         splo = self.env['stock.production.lot']
         smo = self.env['stock.move']
-        pr_oil = self.env['decimal.precision'].precision_get('Olive Oil Volume')
+        pr_oil = self.company_id.olive_mill_context().pr_oil
         wloc = self.warehouse_id.olive_withdrawal_loc_id
         stock_loc = self.warehouse_id.lot_stock_id
         sale_loc = self.sale_location_id
@@ -667,6 +682,13 @@ class OliveOilProduction(models.Model):
 
         self.write(prod_vals)
         self.update_arrival_production_done()
+        # the oil ratios of the arrival lines are in the analysis cube
+        self.env['olive.oil.analysis.cube'].refresh_arrival_lines(
+            self.line_ids.ids)
+        if self.warehouse_id.olive_mill:
+            self.warehouse_id.olive_oil_compensation_day_add(
+                self.date, self.olive_qty,
+                sum([line.oil_qty for line in self.line_ids]))
 
     def update_arrival_production_done(self):
         self.ensure_one()
@@ -680,21 +702,23 @@ class OliveOilProduction(models.Model):
             [('production_state', '=', 'done'), ('arrival_id', 'in', arrivals.ids)],
             ['oil_qty_net', 'olive_qty', 'arrival_id'],
             ['arrival_id'])
-        for arrival_re in arrivals_res:
-            arrival = oao.browse(arrival_re['arrival_id'][0])
-            olive_qty_pressed = arrival_re['olive_qty']
-            oil_qty_net = arrival_re['oil_qty_net']
-            oil_ratio_net = olive_ratio_net = 0.0
-            if olive_qty_pressed:
-                oil_ratio_net = 100 * oil_qty_net / olive_qty_pressed
-            if oil_qty_net:
-                olive_ratio_net = olive_qty_pressed / oil_qty_net
-            arrival.write({
-                'olive_qty_pressed': olive_qty_pressed,
-                'oil_qty_net': oil_qty_net,
-                'oil_ratio_net': oil_ratio_net,
-                'olive_ratio_net': olive_ratio_net,
-                })
+        # system-driven update of the arrivals: no tracking
+        with olive_tracking_batch(oao, skip=True) as oao:
+            for arrival_re in arrivals_res:
+                arrival = oao.browse(arrival_re['arrival_id'][0])
+                olive_qty_pressed = arrival_re['olive_qty']
+                oil_qty_net = arrival_re['oil_qty_net']
+                oil_ratio_net = olive_ratio_net = 0.0
+                if olive_qty_pressed:
+                    oil_ratio_net = 100 * oil_qty_net / olive_qty_pressed
+                if oil_qty_net:
+                    olive_ratio_net = olive_qty_pressed / oil_qty_net
+                arrival.write({
+                    'olive_qty_pressed': olive_qty_pressed,
+                    'oil_qty_net': oil_qty_net,
+                    'oil_ratio_net': oil_ratio_net,
+                    'olive_ratio_net': olive_ratio_net,
+                    })
 
     def unlink(self):
         for production in self:
@@ -710,19 +734,46 @@ class OliveOilProduction(models.Model):
         self.palox_id.oil_product_id = self.oil_product_id.id
 
     def _compute_day_position(self):
+        # one search per day, not per production
+        date2order = {}
         for prod in self:
             if prod.state == 'cancel':
                 day_position = 0
             else:
-                # same order as on-screen
-                same_day_prod = self.search(
-                    [('date', '=', prod.date), ('state', '!=', 'cancel')])
-                same_day_reverse_order = [p for p in same_day_prod]
-                same_day_reverse_order.reverse()
-                index = same_day_reverse_order.index(prod)
+                if prod.date not in date2order:
+                    # same order as on-screen
+                    same_day_prod = self.search(
+                        [('date', '=', prod.date), ('state', '!=', 'cancel')])
+                    same_day_reverse_order = [p.id for p in same_day_prod]
+                    same_day_reverse_order.reverse()
+                    date2order[prod.date] = same_day_reverse_order
+                index = date2order[prod.date].index(prod.id)
                 day_position = index + 1
             prod.day_position = day_position
 
+    def report_prefetch(self):
+        """Read in bulk the data printed on the production sheets.
+        Returns this data, which is used to detect unchanged documents"""
+        lang = self.env.user.lang or 'en_US'
+        prods = self.with_context(lang=lang)
+        lines = prods.mapped('line_ids')
+        return {
+            'productions': prods.read([
+                'name', 'date', 'day_position', 'state', 'olive_qty',
+                'oil_destination', 'oil_product_id', 'palox_id', 'sample',
+                'sale_location_id', 'warehouse_id', 'compensation_type',
+                'compensation_oil_product_id', 'compensation_last_olive_qty',
+                'compensation_oil_qty_kg', 'olive_culture_type_logo']),
+            'lines': lines.read([
+                'name', 'commercial_partner_id', 'olive_qty',
+                'oil_destination', 'mix_withdrawal_oil_qty', 'extra_ids']),
+            'extras': lines.mapped('extra_ids').read([
+                'qty', 'product_id', 'fillup']),
+            'partners': lines.mapped('commercial_partner_id').read(['ref']),
+            'warehouse_partners': prods.mapped('warehouse_id.partner_id').read(
+                ['zip', 'city']),
+            }
+
     @api.model
     def fields_view_get(self, view_id=None, view_type='form', toolbar=False, submenu=False):
         res = super(OliveOilProduction, self).fields_view_get(
@@ -55,14 +55,19 @@ class OlivePalox(models.Model):
         'olive.palox.borrow.history', 'palox_id', string='Borrow History',
         readonly=True)
 
-    def _compute_weight(self):
+    def _get_weights(self):
+        """Returns {palox_id: weight} with a single read_group.
+        Empty palox are not in the dict."""
         res = self.env['olive.arrival.line'].read_group([
             ('palox_id', 'in', self.ids),
             ('state', '=', 'done'),
             ('production_id', '=', False),
             ], ['palox_id', 'olive_qty'], ['palox_id'])
-        for re in res:
-            self.browse(re['palox_id'][0]).weight = re['olive_qty']
+        return dict([(re['palox_id'][0], re['olive_qty']) for re in res])
+
+    def _compute_weight(self):
+        for palox_id, weight in self._get_weights().items():
+            self.browse(palox_id).weight = weight
 
     # I don't put the 2 compute methods in the same,
     # because name_get() only uses weight, and computation of weight is
@@ -108,9 +113,13 @@ class OlivePalox(models.Model):
 
     def name_get(self):
         res = []
+        # don't read rec.weight: it would re-compute the weight of all the
+        # palox of the prefetch, not only the ones of self
+        weights = self._get_weights()
+        self.mapped('oil_product_id.name')
         for rec in self:
             label = rec.label and ' ' + rec.label or ''
-            name = _('%s%s (Current: %s kg%s)') % (rec.name, label, rec.weight, rec.oil_product_id and ' ' + rec.oil_product_id.name or '')
+            name = _('%s%s (Current: %s kg%s)') % (rec.name, label, weights.get(rec.id, 0.0), rec.oil_product_id and ' ' + rec.oil_product_id.name or '')
             res.append((rec.id, name))
         return res
 
@@ -119,6 +128,38 @@ class OlivePalox(models.Model):
         'unique(name, company_id)',
         'This palox number already exists in this company.')]
 
+    def _balance_deltas(self, sign=1):
+        deltas = {}
+        for palox in self:
+            if palox.borrower_partner_id and palox.active:
+                delta = deltas.setdefault(
+                    (palox.company_id.id, palox.borrower_partner_id.id),
+                    [0, 0, 0])
+                delta[2] += sign
+        return deltas
+
+    @api.model
+    def create(self, vals):
+        palox = super(OlivePalox, self).create(vals)
+        self.env['olive.lended.balance']._add(palox._balance_deltas())
+        return palox
+
+    def write(self, vals):
+        olbo = self.env['olive.lended.balance']
+        update_balance = any([
+            field in vals for field in
+            ['company_id', 'borrower_partner_id', 'active']])
+        if update_balance:
+            olbo._add(self._balance_deltas(sign=-1))
+        res = super(OlivePalox, self).write(vals)
+        if update_balance:
+            olbo._add(self._balance_deltas())
+        return res
+
+    def unlink(self):
+        self.env['olive.lended.balance']._add(self._balance_deltas(sign=-1))
+        return super(OlivePalox, self).unlink()
+
     def lend_palox(self, partner):
         assert not partner.parent_id
         self.sudo().write({
@@ -127,20 +168,32 @@ class OlivePalox(models.Model):
             })
 
     def return_borrowed_palox(self):
-        self.ensure_one()
-        if not self.borrower_partner_id:
-            raise UserError(_(
-                "Cannot return palox '%s' because it currently has no borrower.")
-                % self.display_name)
-        if not self.borrowed_date:
-            raise UserError(_(
-                "Cannot return palox '%s' because it has no borrowed date.")
-                % self.display_name)
-        self.env['olive.palox.borrow.history'].sudo().create({
-            'palox_id': self.id,
-            'partner_id': self.borrower_partner_id.id,
-            'start_date': self.borrowed_date,
-            })
+        for palox in self:
+            if not palox.borrower_partner_id:
+                raise UserError(_(
+                    "Cannot return palox '%s' because it currently has no borrower.")
+                    % palox.display_name)
+            if not palox.borrowed_date:
+                raise UserError(_(
+                    "Cannot return palox '%s' because it has no borrowed date.")
+                    % palox.display_name)
+        if not self:
+            return
+        # One INSERT for the borrow history of all the palox
+        self._cr.execute("""
+            INSERT INTO olive_palox_borrow_history (
+                create_uid, create_date, write_uid, write_date,
+                palox_id, partner_id, start_date, end_date, season_id,
+                company_id)
+            SELECT %s, now() at time zone 'UTC', %s, now() at time zone 'UTC',
+                id, borrower_partner_id, borrowed_date, %s, %s, company_id
+            FROM olive_palox
+            WHERE id IN %s
+            """, (
+                self._uid, self._uid, fields.Date.context_today(self),
+                self.env.user.company_id.current_season_id.id or None,
+                tuple(self.ids)))
+        self.invalidate_cache(['borrow_history_ids'], self.ids)
         self.sudo().write({
             'borrower_partner_id': False,
             'borrowed_date': False,
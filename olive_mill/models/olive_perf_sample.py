@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Barroux Abbey (https://www.barroux.org/)
+# @author: Alexis de Lattre <alexis.delattre@akretion.com>
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, fields, models, tools
+from contextlib import contextmanager
+import functools
+import time
+
+PERF_PARAM = 'olive_mill.perf_instrumentation'
+
+
+def olive_perf(method):
+    """Decorator for the methods of the olive mill workflows: when the
+    system parameter olive_mill.perf_instrumentation is set to True,
+    each call of the method is recorded as an olive.perf.sample"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        sample_obj = self.env['olive.perf.sample']
+        if not sample_obj._perf_enabled():
+            return method(self, *args, **kwargs)
+        with sample_obj.measure('%s.%s' % (self._name, method.__name__)):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class OlivePerfSample(models.Model):
+    _name = 'olive.perf.sample'
+    _description = 'Olive Mill Performance Sample'
+    _order = 'id desc'
+    _rec_name = 'key'
+
+    date = fields.Date(string='Date', required=True, index=True, readonly=True)
+    key = fields.Char(string='Method', required=True, index=True, readonly=True)
+    duration = fields.Float(
+        string='Duration (ms)', digits=(16, 1), readonly=True,
+        group_operator='avg')
+    query_count = fields.Integer(
+        string='SQL Queries', readonly=True, group_operator='avg')
+    rows_written = fields.Integer(
+        string='Rows Written', readonly=True, group_operator='avg',
+        help="Number of rows inserted, updated or deleted in the database")
+    user_id = fields.Many2one(
+        'res.users', string='User', readonly=True, ondelete='set null')
+    company_id = fields.Many2one(
+        'res.company', string='Company', readonly=True, ondelete='cascade')
+
+    @api.model
+    @tools.ormcache()
+    def _perf_enabled(self):
+        # cleared when the system parameter is modified
+        value = self.env['ir.config_parameter'].sudo().get_param(PERF_PARAM)
+        return value in ('1', 'True', 'true')
+
+    @api.model
+    def _get_rows_written(self):
+        self._cr.execute("""
+            SELECT COALESCE(SUM(n_tup_ins + n_tup_upd + n_tup_del), 0)
+            FROM pg_stat_xact_user_tables
+            """)
+        return self._cr.fetchone()[0]
+
+    @contextmanager
+    def measure(self, key):
+        cr = self._cr
+        start_rows = self._get_rows_written()
+        start_count = cr.sql_log_count
+        start = time.time()
+        yield
+        duration = (time.time() - start) * 1000
+        query_count = cr.sql_log_count - start_count
+        rows_written = self._get_rows_written() - start_rows
+        self.sudo().create({
+            'date': fields.Date.context_today(self),
+            'key': key,
+            'duration': duration,
+            'query_count': query_count,
+            'rows_written': rows_written,
+            'user_id': self._uid,
+            'company_id': self.env.user.company_id.id,
+            })
+
+
+class OlivePerfSampleDay(models.Model):
+    _name = 'olive.perf.sample.day'
+    _description = 'Olive Mill Performance per Day'
+    _auto = False
+    _order = 'date desc, key'
+    _rec_name = 'key'
+
+    date = fields.Date(string='Date', readonly=True)
+    key = fields.Char(string='Method', readonly=True)
+    company_id = fields.Many2one('res.company', string='Company', readonly=True)
+    calls = fields.Integer(string='Calls', readonly=True)
+    duration_p50 = fields.Float(
+        string='Median Duration (ms)', digits=(16, 1), readonly=True)
+    duration_p90 = fields.Float(
+        string='90th Percentile (ms)', digits=(16, 1), readonly=True)
+    duration_p99 = fields.Float(
+        string='99th Percentile (ms)', digits=(16, 1), readonly=True)
+    duration_max = fields.Float(
+        string='Max Duration (ms)', digits=(16, 1), readonly=True)
+    query_count_avg = fields.Float(
+        string='Avg SQL Queries', digits=(16, 1), readonly=True)
+    rows_written_avg = fields.Float(
+        string='Avg Rows Written', digits=(16, 1), readonly=True)
+
+    @api.model_cr
+    def init(self):
+        tools.drop_view_if_exists(self._cr, self._table)
+        self._cr.execute("""
+            CREATE OR REPLACE VIEW olive_perf_sample_day AS (
+                SELECT
+                    MIN(id) AS id,
+                    date,
+                    key,
+                    company_id,
+                    COUNT(*) AS calls,
+                    percentile_cont(0.5)
+                        WITHIN GROUP (ORDER BY duration) AS duration_p50,
+                    percentile_cont(0.9)
+                        WITHIN GROUP (ORDER BY duration) AS duration_p90,
+                    percentile_cont(0.99)
+                        WITHIN GROUP (ORDER BY duration) AS duration_p99,
+                    MAX(duration) AS duration_max,
+                    AVG(query_count) AS query_count_avg,
+                    AVG(rows_written) AS rows_written_avg
+                FROM olive_perf_sample
+                GROUP BY date, key, company_id
+            )""")
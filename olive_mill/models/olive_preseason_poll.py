@@ -102,9 +102,50 @@ class OlivePreseasonPoll(models.Model):
             self.past_data_ok = False
 
     def update_past_data(self):
-        self.ensure_one()
-        oso = self.env['olive.season']
+        """Works on a recordset: all the polls are refreshed with
+        1 search of past seasons per (company, season) and 1 read_group
+        grouped by partner and season"""
         prec = self.env['decimal.precision'].precision_get('Olive Weight')
+        # key = (company, season), value = past_seasons
+        season2past = {}
+        for poll in self:
+            key = (poll.company_id, poll.season_id)
+            if key not in season2past:
+                season2past[key] = self.env['olive.season'].search([
+                    ('company_id', '=', poll.company_id.id),
+                    ('start_date', '<', poll.season_id.start_date),
+                    ], order='start_date desc', limit=3)
+        all_past_seasons = self.env['olive.season']
+        for past_seasons in season2past.values():
+            all_past_seasons |= past_seasons
+        # key = (commercial_partner_id, season_id), value = data dict
+        data = {}
+        if all_past_seasons:
+            res = self.env['olive.arrival.line'].read_group([
+                ('season_id', 'in', all_past_seasons.ids),
+                ('state', '=', 'done'),
+                ('production_state', '=', 'done'),
+                ('commercial_partner_id', 'in',
+                    self.mapped('commercial_partner_id').ids)],
+                ['olive_qty', 'oil_qty_net', 'sale_oil_qty', 'season_id',
+                 'commercial_partner_id'],
+                ['commercial_partner_id', 'season_id'], lazy=False)
+            for re in res:
+                if not float_is_zero(re['olive_qty'], precision_digits=prec):
+                    data[(
+                        re['commercial_partner_id'][0],
+                        re['season_id'][0])] = {
+                        'olive_qty': re['olive_qty'],
+                        'sale_oil_qty': re['sale_oil_qty'],
+                        'oil_qty_net': re['oil_qty_net'],
+                        }
+        for poll in self:
+            past_seasons = season2past[(poll.company_id, poll.season_id)]
+            vals = poll._prepare_past_data(past_seasons, data)
+            poll.write(vals)
+
+    def _prepare_past_data(self, past_seasons, data):
+        self.ensure_one()
         vals = {
             'past_data_ok': True,
             'past_average_ratio_net': 0.0,
@@ -113,34 +154,10 @@ class OlivePreseasonPoll(models.Model):
             'past_average_sale_oil_qty': 0.0,
             'past_average_sale_olive_qty': 0.0,
             }
-        season = self.season_id
-        company = self.company_id
         for i in ['n1', 'n2', 'n3']:
             for suffix in ['season_id', 'ratio_net', 'olive_qty', 'oil_qty_net', 'sale_olive_qty', 'sale_oil_qty']:
                 field_name = '%s_%s' % (i, suffix)
                 vals[field_name] = False
-        past_seasons = self.env['olive.season'].search([
-            ('company_id', '=', company.id),
-            ('start_date', '<', season.start_date),
-            ], order='start_date desc', limit=3)
-        res = self.env['olive.arrival.line'].read_group([
-            ('season_id', 'in', past_seasons.ids),
-            ('state', '=', 'done'),
-            ('production_state', '=', 'done'),
-            ('commercial_partner_id', '=', self.commercial_partner_id.id)],
-            ['olive_qty', 'oil_qty_net', 'sale_oil_qty', 'season_id'],
-            ['season_id'])
-        print "res=", res
-        season2data = {}
-        for re in res:
-            season_id = re['season_id'][0]
-            season = oso.browse(season_id)
-            if not float_is_zero(re['olive_qty'], precision_digits=prec):
-                season2data[season] = {
-                    'olive_qty': re['olive_qty'],
-                    'sale_oil_qty': re['sale_oil_qty'],
-                    'oil_qty_net': re['oil_qty_net'],
-                    }
         # caution: an olive farmer may not have arrivals during each season
         # We do the average on the seasons where he made at least 1 arrival
         season_count = 0
@@ -149,11 +166,12 @@ class OlivePreseasonPoll(models.Model):
             i += 1
             prefix = 'n%d_' % i
             vals[prefix + 'season_id'] = season.id
-            if season in season2data:
+            season_data = data.get((self.commercial_partner_id.id, season.id))
+            if season_data:
                 season_count += 1
                 for field_name in ['olive_qty', 'oil_qty_net', 'sale_oil_qty']:
-                    vals[prefix + field_name] = season2data[season][field_name]
-                    vals['past_average_' + field_name] += season2data[season][field_name]
+                    vals[prefix + field_name] = season_data[field_name]
+                    vals['past_average_' + field_name] += season_data[field_name]
                 vals[prefix + 'ratio_net'] = 100 * vals[prefix + 'oil_qty_net'] / vals[prefix + 'olive_qty']
                 if vals[prefix + 'ratio_net'] > 0:
                     vals[prefix + 'sale_olive_qty'] = vals[prefix + 'sale_oil_qty'] * 100 / vals[prefix + 'ratio_net']
@@ -165,7 +183,7 @@ class OlivePreseasonPoll(models.Model):
             vals['past_average_olive_qty'] = vals['past_average_olive_qty'] / season_count
             vals['past_average_oil_qty_net'] = vals['past_average_oil_qty_net'] / season_count
             vals['past_average_sale_oil_qty'] = vals['past_average_sale_oil_qty'] / season_count
-        self.write(vals)
+        return vals
 
     @api.depends('partner_id', 'season_id')
     def name_get(self):
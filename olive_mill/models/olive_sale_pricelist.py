@@ -3,7 +3,8 @@
 # @author: Alexis de Lattre <alexis.delattre@akretion.com>
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-from odoo import models, fields
+from odoo import api, models, fields, tools, _
+from odoo.exceptions import ValidationError
 import odoo.addons.decimal_precision as dp
 
 
@@ -26,18 +27,71 @@ class OliveSalePricelist(models.Model):
         'unique(name)',
         'This profile already exists.')]
 
-    def prepare_speeddict(self):
+    @api.model
+    @tools.ormcache('pricelist_id')
+    def _get_compiled_prices(self, pricelist_id):
+        """Returns {product_id: ((date_start, date_end, price), ...)}
+        Lines with a date range come before the lines without date range,
+        so that a dated price overrides the default price of the product.
+        The result is cached until the next write on a pricelist or
+        on a pricelist line, so it is shared between all the farmers
+        of an invoicing run. Don't modify the returned dict !"""
+        self._cr.execute("""
+            SELECT product_id, date_start, date_end, price
+            FROM olive_sale_pricelist_line
+            WHERE pricelist_id = %s
+            ORDER BY product_id, (date_start IS NULL AND date_end IS NULL),
+                date_start
+            """, (pricelist_id, ))
+        res = {}
+        for product_id, date_start, date_end, price in self._cr.fetchall():
+            res.setdefault(product_id, []).append(
+                (date_start, date_end, price))
+        return dict((key, tuple(value)) for (key, value) in res.items())
+
+    def get_product_price(self, product, date=False):
+        """Returns the price of the oil product at the given date,
+        or None if the product is not in the pricelist"""
+        self.ensure_one()
+        if not date:
+            date = fields.Date.context_today(self)
+        for date_start, date_end, price in self._get_compiled_prices(
+                self.id).get(product.id, ()):
+            if (
+                    (not date_start or date_start <= date) and
+                    (not date_end or date_end >= date)):
+                return price
+        return None
+
+    def prepare_speeddict(self, date=False):
         self.ensure_one()
+        ppo = self.env['product.product']
         product2price = {}
-        for line in self.line_ids:
-            product2price[line.product_id] = line.price
+        for product_id in self._get_compiled_prices(self.id).keys():
+            product = ppo.browse(product_id)
+            price = self.get_product_price(product, date=date)
+            if price is not None:
+                product2price[product] = price
         return product2price
 
+    @api.model
+    def create(self, vals):
+        self.clear_caches()
+        return super(OliveSalePricelist, self).create(vals)
+
+    def write(self, vals):
+        self.clear_caches()
+        return super(OliveSalePricelist, self).write(vals)
+
+    def unlink(self):
+        self.clear_caches()
+        return super(OliveSalePricelist, self).unlink()
+
 
 class OliveSalePricelistLine(models.Model):
     _name = 'olive.sale.pricelist.line'
     _description = 'Olive Sale Pricelist Line'
-    _order = 'pricelist_id'
+    _order = 'pricelist_id, product_id, date_start'
 
     pricelist_id = fields.Many2one(
         'olive.sale.pricelist', ondelete='cascade',
@@ -45,6 +99,12 @@ class OliveSalePricelistLine(models.Model):
     product_id = fields.Many2one(
         'product.product', string='Oil Product', required=True,
         domain=[('olive_type', '=', 'oil')])
+    date_start = fields.Date(
+        string='Start Date',
+        help="Leave empty if the price is valid since the beginning.")
+    date_end = fields.Date(
+        string='End Date',
+        help="Leave empty if the price has no end date.")
     price = fields.Monetary(
         string='Price', digits=dp.get_precision('Product Price'),
         required=True)
@@ -54,5 +114,68 @@ class OliveSalePricelistLine(models.Model):
 
     _sql_constraints = [(
         'pricelist_product_uniq',
-        'unique(pricelist_id, product_id)',
-        'There is already a line with the same product on this pricelist.')]
+        'unique(pricelist_id, product_id, date_start)',
+        'There is already a line with the same product and the same start '
+        'date on this pricelist.')]
+
+    @api.constrains('pricelist_id', 'product_id', 'date_start', 'date_end')
+    def pricelist_line_check(self):
+        for line in self:
+            if (
+                    line.date_start and line.date_end and
+                    line.date_start > line.date_end):
+                raise ValidationError(_(
+                    "On the olive sale pricelist '%s', the start date (%s) "
+                    "of the line with product '%s' is after its end "
+                    "date (%s).") % (
+                        line.pricelist_id.name, line.date_start,
+                        line.product_id.display_name, line.date_end))
+            if not line.date_start and not line.date_end:
+                # only one default price per product
+                if self.search([
+                        ('pricelist_id', '=', line.pricelist_id.id),
+                        ('product_id', '=', line.product_id.id),
+                        ('id', '!=', line.id),
+                        ('date_start', '=', False),
+                        ('date_end', '=', False)], limit=1):
+                    raise ValidationError(_(
+                        "On the olive sale pricelist '%s', there are "
+                        "several lines without start and end date with "
+                        "product '%s'.") % (
+                            line.pricelist_id.name,
+                            line.product_id.display_name))
+                continue
+            domain = [
+                ('pricelist_id', '=', line.pricelist_id.id),
+                ('product_id', '=', line.product_id.id),
+                ('id', '!=', line.id),
+                '|', ('date_start', '!=', False), ('date_end', '!=', False),
+                ]
+            if line.date_end:
+                domain += [
+                    '|', ('date_start', '=', False),
+                    ('date_start', '<=', line.date_end)]
+            if line.date_start:
+                domain += [
+                    '|', ('date_end', '=', False),
+                    ('date_end', '>=', line.date_start)]
+            overlap = self.search(domain, limit=1)
+            if overlap:
+                raise ValidationError(_(
+                    "On the olive sale pricelist '%s', the dates of the "
+                    "lines with product '%s' overlap.") % (
+                        line.pricelist_id.name,
+                        line.product_id.display_name))
+
+    @api.model
+    def create(self, vals):
+        self.clear_caches()
+        return super(OliveSalePricelistLine, self).create(vals)
+
+    def write(self, vals):
+        self.clear_caches()
+        return super(OliveSalePricelistLine, self).write(vals)
+
+    def unlink(self):
+        self.clear_caches()
+        return super(OliveSalePricelistLine, self).unlink()
@@ -10,6 +10,12 @@ from odoo.tools import float_round
 from dateutil.relativedelta import relativedelta
 from babel.dates import format_date
 import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# fields of olive.season read by res.company._get_current_season_id()
+CURRENT_SEASON_FIELDS = ['start_date', 'end_date', 'year', 'company_id']
 
 
 class OliveSeason(models.Model):
@@ -122,6 +128,21 @@ class OliveSeason(models.Model):
                 month=1, years=3, day=1)
             self.default_expiry_date = fields.Date.to_string(expiry_date_dt)
 
+    # invalidate res.company.olive_mill_context()
+    @api.model
+    def create(self, vals):
+        self.clear_caches()
+        return super(OliveSeason, self).create(vals)
+
+    def write(self, vals):
+        if any([field in vals for field in CURRENT_SEASON_FIELDS]):
+            self.clear_caches()
+        return super(OliveSeason, self).write(vals)
+
+    def unlink(self):
+        self.clear_caches()
+        return super(OliveSeason, self).unlink()
+
     @api.model
     def get_current_season(self):
         return self.env.user.company_id.get_current_season()
@@ -177,50 +198,78 @@ class OliveSeason(models.Model):
             })
         return action
 
+    def preseason_poll_update_past_data(self):
+        self.ensure_one()
+        polls = self.env['olive.preseason.poll'].search(
+            [('season_id', '=', self.id)])
+        if not polls:
+            raise UserError(_(
+                "There are no pre-season polls for season '%s'.")
+                % self.name)
+        polls.update_past_data()
+
     def generate_partner_organic_certif(self):
         self.ensure_one()
         # Get all partners that already had 1 organic certif in the past
         # Then look at the last arrival
         # If they had a valid organic certif for their last arrival
         # then we generate a draft organic certif
+        # Everything is done in 1 query: the last arrival of each farmer
+        # is selected with a window function and the draft certifications
+        # are inserted from the matching valid certifications
         poco = self.env['partner.organic.certification']
-        rpo = self.env['res.partner']
-        oao = self.env['olive.arrival']
         existing_cert = poco.search([('season_id', '=', self.id)])
         if existing_cert:
             raise UserError(_(
                 "Some certifications have already been generated for season '%s'.")
                 % self.name)
-        rg_res = poco.read_group(
-            [('state', '=', 'done')], ['partner_id'], ['partner_id'])
-        cert_ids = []
-        for rg_re in rg_res:
-            partner = rpo.browse(rg_re['partner_id'][0])
-            if partner.active and partner.olive_farmer and not partner.parent_id:
-                last_arrival = oao.search([
-                    ('state', '=', 'done'),
-                    ('season_id', '!=', self.id),
-                    ('commercial_partner_id', '=', partner.id),
-                    ], order='date desc', limit=1)
-                if last_arrival:
-                    cert = poco.search([
-                        ('state', '=', 'done'),
-                        ('season_id', '=', last_arrival.season_id.id),
-                        ('partner_id', '=', partner.id)], limit=1)
-                    if cert:
-                        new_cert = poco.create({
-                            'partner_id': partner.id,
-                            'season_id': self.id,
-                            'state': 'draft',
-                            'conversion': cert.conversion,
-                            'certifying_entity_id': cert.certifying_entity_id.id,
-                            })
-                        cert_ids.append(new_cert.id)
+        self._cr.execute("""
+            INSERT INTO partner_organic_certification (
+                partner_id, season_id, company_id, state, conversion,
+                certifying_entity_id, create_uid, create_date,
+                write_uid, write_date)
+            SELECT
+                rp.id, %(season_id)s, %(company_id)s, 'draft',
+                cert.conversion, cert.certifying_entity_id,
+                %(uid)s, (now() at time zone 'UTC'),
+                %(uid)s, (now() at time zone 'UTC')
+            FROM (
+                SELECT
+                    commercial_partner_id, season_id,
+                    row_number() OVER (
+                        PARTITION BY commercial_partner_id
+                        ORDER BY date DESC, id DESC) AS rank
+                FROM olive_arrival
+                WHERE state = 'done'
+                AND season_id != %(season_id)s
+                AND commercial_partner_id IS NOT NULL
+                ) AS last_arrival
+            JOIN res_partner rp
+                ON rp.id = last_arrival.commercial_partner_id
+            JOIN partner_organic_certification cert
+                ON cert.partner_id = rp.id
+                AND cert.season_id = last_arrival.season_id
+                AND cert.state = 'done'
+            WHERE last_arrival.rank = 1
+            AND rp.active IS true
+            AND rp.olive_farmer IS true
+            AND rp.parent_id IS NULL
+            RETURNING id
+            """, {
+                'season_id': self.id,
+                'company_id': self.company_id.id or None,
+                'uid': self._uid,
+                })
+        cert_ids = [row[0] for row in self._cr.fetchall()]
         if not cert_ids:
             raise UserError(_("No organic certification generated."))
+        logger.info(
+            '%d draft organic certifications generated for season %s',
+            len(cert_ids), self.name)
         self.partner_organic_certif_generated = True
         action = self.env.ref('olive_mill.partner_organic_certification_action').read()[0]
         action.update({
+            'name': _('%d Generated Organic Certifications') % len(cert_ids),
             'context': {'partner_organic_certification_main_view': True},
             'domain': [('id', 'in', cert_ids)],
             })
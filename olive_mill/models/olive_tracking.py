@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Barroux Abbey (https://www.barroux.org/)
+# @author: Alexis de Lattre <alexis.delattre@akretion.com>
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, models
+from contextlib import contextmanager
+import functools
+import uuid
+
+TRACKING_KEY = 'olive_tracking_batch'
+# {token: {model: {record_id: {field_name: initial_value}}}}
+_tracking_batches = {}
+
+
+@contextmanager
+def olive_tracking_batch(records, skip=False):
+    """Context manager for the bulk operations of the olive mill workflows.
+    It yields records with a context in which the tracking of the models
+    that inherit olive.tracking.mixin is collected instead of being posted
+    on each write ; at the end of the operation, one message per record
+    summarizes all the changes. With skip=True, no tracking at all
+    (for system-driven recomputations).
+    Usage:
+    with olive_tracking_batch(productions) as prods:
+        prods.write(...)"""
+    ctx = records._context
+    if skip:
+        yield records.with_context(mail_notrack=True)
+        return
+    if ctx.get(TRACKING_KEY) or ctx.get('mail_notrack'):
+        # nested call: the outer batch posts the messages
+        yield records
+        return
+    token = uuid.uuid4().hex
+    _tracking_batches[token] = {}
+    try:
+        yield records.with_context(**{TRACKING_KEY: token})
+        records.env['olive.tracking.mixin']._olive_tracking_flush(
+            _tracking_batches[token])
+    finally:
+        _tracking_batches.pop(token, None)
+
+
+def olive_batch_tracked(method):
+    """Decorator that runs the method inside olive_tracking_batch()"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with olive_tracking_batch(self) as records:
+            return method(records, *args, **kwargs)
+    return wrapper
+
+
+class OliveTrackingMixin(models.AbstractModel):
+    """Must be inherited BEFORE mail.thread:
+    _inherit = ['olive.tracking.mixin', 'mail.thread']"""
+    _name = 'olive.tracking.mixin'
+    _description = 'Olive Mill Batch Tracking'
+
+    def _olive_tracking_batch(self):
+        if self._context.get('mail_notrack'):
+            return None
+        return _tracking_batches.get(self._context.get(TRACKING_KEY))
+
+    def _olive_tracking_collect(self, batch, tracked_fields, created=False):
+        model_values = batch.setdefault(self._name, {})
+        for rec in self:
+            rec_values = model_values.setdefault(rec.id, {})
+            for fname in tracked_fields:
+                # keep the value at the beginning of the batch
+                if fname not in rec_values:
+                    rec_values[fname] = False if created else rec[fname]
+
+    @api.model
+    def create(self, vals):
+        batch = self._olive_tracking_batch()
+        if batch is None:
+            return super(OliveTrackingMixin, self).create(vals)
+        rec = super(OliveTrackingMixin, self.with_context(
+            mail_notrack=True)).create(vals)
+        rec = rec.with_env(self.env)
+        tracked_fields = rec._get_tracked_fields(vals.keys())
+        if tracked_fields:
+            rec._olive_tracking_collect(batch, tracked_fields, created=True)
+        return rec
+
+    def write(self, vals):
+        batch = self._olive_tracking_batch()
+        if batch is None:
+            return super(OliveTrackingMixin, self).write(vals)
+        tracked_fields = self._get_tracked_fields(vals.keys())
+        if tracked_fields:
+            self.with_context(lang=self.env.user.lang).\
+                _olive_tracking_collect(batch, tracked_fields)
+        return super(OliveTrackingMixin, self.with_context(
+            mail_notrack=True)).write(vals)
+
+    @api.model
+    def _olive_tracking_flush(self, batch):
+        for model, initial_values in batch.items():
+            records = self.env[model].with_context(
+                lang=self.env.user.lang).browse(
+                list(initial_values)).exists()
+            if not records:
+                continue
+            fnames = set()
+            for rec_values in initial_values.values():
+                fnames.update(rec_values)
+            tracked_fields = records._get_tracked_fields(list(fnames))
+            # fields written on some records only: no change on the others
+            records._olive_tracking_collect(
+                {model: initial_values}, tracked_fields)
+            records.message_track(tracked_fields, initial_values)
@@ -111,17 +111,12 @@ class ResPartner(models.Model):
         olive_oil_qty_withdrawn_current_season = 0.0
         if self.olive_farmer:
             company = self.env.user.company_id
-            cases_res = self.env['olive.lended.case'].read_group([
-                ('company_id', '=', company.id),
-                ('partner_id', '=', self.id)],
-                ['regular_qty', 'organic_qty'], [])
-            if cases_res:
-                olive_lended_regular_case = cases_res[0]['regular_qty'] or 0
-                olive_lended_organic_case = cases_res[0]['organic_qty'] or 0
-            olive_lended_palox = self.env['olive.palox'].search([
-                ('borrower_partner_id', '=', self.id),
-                ('company_id', '=', company.id),
-                ], count=True)
+            balance = self.env['olive.lended.balance'].get_balances(
+                company.id, [self.id]).get(self.id)
+            if balance:
+                olive_lended_regular_case = balance['regular_qty']
+                olive_lended_organic_case = balance['organic_qty']
+                olive_lended_palox = balance['palox_qty']
 
             parcel_res = self.env['olive.parcel'].read_group([
                 ('partner_id', '=', self.id)],
@@ -132,7 +127,7 @@ class ResPartner(models.Model):
 
             season_id = self._context.get('season_id')
             if not season_id:
-                season = self.env['olive.season'].get_current_season()
+                season = self.env.user.company_id.olive_mill_context().season
                 if season:
                     season_id = season.id
 
@@ -159,17 +154,9 @@ class ResPartner(models.Model):
                     olive_oil_qty_withdrawal_current_season = arrival_prod_res[0]['withdrawal_oil_qty_with_compensation'] or 0.0
                     if olive_qty_triturated_current_season:
                         olive_oil_ratio_current_season = 100 * olive_oil_qty_current_season / olive_qty_triturated_current_season
-            olive_products = self.env['product.product'].search([
-                ('olive_type', '=', 'oil')])
-            withdrawal_locations = self.env['stock.location'].search([
-                ('olive_tank_type', '=', False), ('usage', '=', 'internal')])
-            withdrawal_res = self.env['stock.quant'].read_group([
-                ('location_id', 'in', withdrawal_locations.ids),
-                ('product_id', 'in', olive_products.ids),
-                ('owner_id', '=', self.id)],
-                ['qty'], [])
-            if withdrawal_res:
-                olive_oil_qty_to_withdraw = withdrawal_res[0]['qty'] or 0.0
+            olive_oil_qty_to_withdraw = self.env[
+                'olive.oil.withdrawal.balance'].get_qty_to_withdraw(
+                [self.id]).get(self.id, 0.0)
             olive_oil_qty_withdrawn_current_season = olive_oil_qty_withdrawal_current_season - olive_oil_qty_to_withdraw
         self.olive_lended_regular_case = olive_lended_regular_case
         self.olive_lended_organic_case = olive_lended_organic_case
@@ -236,7 +223,7 @@ class ResPartner(models.Model):
 
                 season_id = self._context.get('season_id')
                 if not season_id:
-                    season = self.env['olive.season'].get_current_season()
+                    season = self.env.user.company_id.olive_mill_context().season
                     if season:
                         season_id = season.id
 
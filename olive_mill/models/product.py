@@ -6,6 +6,9 @@
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError, ValidationError
 from odoo.tools import float_compare
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class ProductTemplate(models.Model):
@@ -114,6 +117,13 @@ class ProductTemplate(models.Model):
                     "configured as a Service.") % (
                         pt.display_name))
 
+    def write(self, vals):
+        res = super(ProductTemplate, self).write(vals)
+        if 'olive_type' in vals or 'uom_id' in vals:
+            self.with_context(active_test=False).mapped(
+                'product_variant_ids')._olive_bottle_explosion_refresh()
+        return res
+
 
 class ProductProduct(models.Model):
     _inherit = 'product.product'
@@ -158,7 +168,175 @@ class ProductProduct(models.Model):
                     })],
                 })
 
+    def oil_merge_get_bom(self):
+        """Returns the merge BOM of the oil product, after checking it"""
+        self.ensure_one()
+        assert self.tracking == 'lot'
+        assert self.olive_type == 'oil'
+        boms = self.env['mrp.bom'].search([
+            ('product_tmpl_id', '=', self.product_tmpl_id.id),
+            ('type', '=', 'normal'),
+            ('product_uom_id', '=', self.uom_id.id),
+            ])
+        if len(boms) != 1:
+            raise UserError(_(
+                "The oil product '%s' should only have a single bill "
+                "of material.") % self.display_name)
+        liter_uom = self.env.ref('product.product_uom_litre')
+        bom = boms[0]
+        if bom.product_uom_id != liter_uom:
+            raise UserError(_(
+                "The unit of measure of the bill of material of product "
+                "'%s' should be liters.") % self.display_name)
+        bom_lines_qty = 0.0
+        for bom_line in bom.bom_line_ids:
+            if bom_line.product_id.olive_type != 'oil':
+                raise UserError(_(
+                    "The bill of material of the oil product '%s' "
+                    "should only have oil components.")
+                    % self.display_name)
+            if bom_line.product_uom_id != liter_uom:
+                raise UserError(_(
+                    "On the bill of material of product '%s', the line with "
+                    "product '%s' should have liters as unit of measure.") % (
+                        self.display_name, bom_line.product_id.display_name))
+            bom_lines_qty += bom_line.product_qty
+        p_prec = self.env['decimal.precision'].precision_get('Product Unit of Measure')
+        if float_compare(bom_lines_qty, bom.product_qty, precision_digits=p_prec):
+            raise UserError(_(
+                "The bill of material of the oil product '%s' is wrong: "
+                "the sum of the quantity of lines (%s) should be the quantity "
+                "of the bill of material (%s).")
+                % (self.display_name, bom_lines_qty, bom.product_qty))
+        return bom
+
     def oil_bottle_full_get_bom_and_oil_product(self):
+        """Returns (bom, oil_product, volume) from the explosion table.
+        If the bottle is not in the table, re-compute it from the BOM,
+        which raises an explicit error when the BOM is not valid"""
+        self.ensure_one()
+        assert self.olive_type == 'bottle_full'
+        explo = self.env['olive.oil.bottle.explosion'].search(
+            [('product_id', '=', self.id)], limit=1)
+        if not explo:
+            self._olive_bottle_explosion_refresh()
+            explo = self.env['olive.oil.bottle.explosion'].search(
+                [('product_id', '=', self.id)], limit=1)
+            if not explo:
+                return self._oil_bottle_full_compute_bom_and_oil_product()
+        return (explo.bom_id, explo.oil_product_id, explo.volume)
+
+    def oil_bottle_full_pack_get_bottles(self):
+        """Returns {bottle_full_product: qty} from the explosion table"""
+        self.ensure_one()
+        assert self.olive_type == 'bottle_full_pack'
+        explos = self.env['olive.oil.bottle.explosion'].search(
+            [('product_id', '=', self.id)])
+        if not explos:
+            self._olive_bottle_explosion_refresh()
+            explos = self.env['olive.oil.bottle.explosion'].search(
+                [('product_id', '=', self.id)])
+            if not explos:
+                return self._oil_bottle_full_pack_compute_bottles()
+        res = {}
+        for explo in explos:
+            res[explo.bottle_product_id] = explo.bottle_qty
+        return res
+
+    @api.model
+    def olive_oil_explosion_get(self, product_ids):
+        """Returns {product_id: {oil_product_id: liters per unit}}
+        for the full bottles and the packs of full bottles of product_ids"""
+        res = {}
+        for explo in self.env['olive.oil.bottle.explosion'].search_read(
+                [('product_id', 'in', product_ids)],
+                ['product_id', 'oil_product_id', 'volume']):
+            pdict = res.setdefault(explo['product_id'][0], {})
+            oil_product_id = explo['oil_product_id'][0]
+            pdict[oil_product_id] = pdict.get(oil_product_id, 0.0) +\
+                explo['volume']
+        return res
+
+    @api.model
+    def olive_oil_volume_get(self, product_qty):
+        """product_qty = {product_id: number of units}
+        Returns {oil_product_id: liters of oil}"""
+        res = {}
+        explosion = self.olive_oil_explosion_get(product_qty.keys())
+        for product_id, qty in product_qty.items():
+            for oil_product_id, volume in explosion.get(
+                    product_id, {}).items():
+                res[oil_product_id] = res.get(oil_product_id, 0.0) +\
+                    volume * qty
+        return res
+
+    def _olive_bottle_explosion_refresh(self):
+        """Re-compute the explosion table for the full bottles and packs
+        of self and for the packs that contain the full bottles of self.
+        Products with a BOM that is not valid are removed from the table"""
+        oobeo = self.env['olive.oil.bottle.explosion'].sudo()
+        bottles = self.filtered(lambda p: p.olive_type == 'bottle_full')
+        packs = self.filtered(lambda p: p.olive_type == 'bottle_full_pack')
+        if bottles:
+            pack_lines = self.env['mrp.bom.line'].sudo().search([
+                ('product_id', 'in', bottles.ids),
+                ('bom_id.product_tmpl_id.olive_type', '=', 'bottle_full_pack'),
+                ])
+            for bom_tmpl in pack_lines.mapped('bom_id.product_tmpl_id'):
+                packs |= bom_tmpl.product_variant_ids
+        oobeo.search([('product_id', 'in', (self | packs).ids)]).unlink()
+        for bottle in bottles:
+            try:
+                bom, oil_product, volume =\
+                    bottle._oil_bottle_full_compute_bom_and_oil_product()
+            except UserError as e:
+                logger.warning(
+                    'Bottle %s not added to the explosion table: %s',
+                    bottle.display_name, e)
+                continue
+            oobeo.create({
+                'product_id': bottle.id,
+                'bom_id': bom.id,
+                'oil_product_id': oil_product.id,
+                'volume': volume,
+                })
+        for pack in packs:
+            try:
+                pack_dict = pack._oil_bottle_full_pack_compute_bottles()
+            except UserError as e:
+                logger.warning(
+                    'Pack %s not added to the explosion table: %s',
+                    pack.display_name, e)
+                continue
+            vals_list = []
+            for cbottle, qty in pack_dict.items():
+                cexplo = oobeo.search(
+                    [('product_id', '=', cbottle.id)], limit=1)
+                if not cexplo:
+                    logger.warning(
+                        'Pack %s not added to the explosion table: bottle '
+                        '%s is not in the table', pack.display_name,
+                        cbottle.display_name)
+                    vals_list = []
+                    break
+                vals_list.append({
+                    'product_id': pack.id,
+                    'bom_id': cexplo.bom_id.id,
+                    'bottle_product_id': cbottle.id,
+                    'bottle_qty': qty,
+                    'oil_product_id': cexplo.oil_product_id.id,
+                    'volume': cexplo.volume * qty,
+                    })
+            for vals in vals_list:
+                oobeo.create(vals)
+
+    @api.model
+    def _olive_bottle_explosion_refresh_all(self):
+        products = self.with_context(active_test=False).search([
+            ('olive_type', 'in', ('bottle_full', 'bottle_full_pack'))])
+        products._olive_bottle_explosion_refresh()
+
+    def _oil_bottle_full_compute_bom_and_oil_product(self):
         self.ensure_one()
         assert self.olive_type == 'bottle_full'
         boms = self.env['mrp.bom'].search([
@@ -204,7 +382,7 @@ class ProductProduct(models.Model):
                     volume, bom.display_name, bom.id))
         return (bom, oil_bom_lines[0].product_id, volume)
 
-    def oil_bottle_full_pack_get_bottles(self):
+    def _oil_bottle_full_pack_compute_bottles(self):
         self.ensure_one()
         assert self.olive_type == 'bottle_full_pack'
         boms = self.env['mrp.bom'].search([
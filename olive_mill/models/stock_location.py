@@ -7,6 +7,8 @@ from odoo import api, fields, models, _
 from odoo.exceptions import UserError
 from odoo.tools import float_compare, float_round
 import odoo.addons.decimal_precision as dp
+from .olive_perf_sample import olive_perf
+from datetime import datetime
 
 
 class StockLocation(models.Model):
@@ -49,22 +51,33 @@ class StockLocation(models.Model):
     def olive_tank_type_change(self):
         if self.olive_tank_type:
             if not self.olive_season_id:
-                season = self.env['olive.season'].get_current_season()
+                season = self.env.user.company_id.olive_mill_context().season
                 if season:
                     self.olive_season_id = season
         else:
             self.olive_season_id = False
 
+    def write(self, vals):
+        res = super(StockLocation, self).write(vals)
+        # the oil to withdraw only counts the quants outside of the tanks
+        if 'olive_tank_type' in vals or 'usage' in vals:
+            self.env['olive.oil.withdrawal.balance'].rebuild(
+                location_ids=self.ids)
+        return res
+
     def name_get(self):
         res = super(StockLocation, self).name_get()
+        # iterate on self (and not on browse() of each entry) to keep
+        # the prefetching of the tank fields for the whole recordset
+        self.mapped('oil_product_id.name')
+        names = dict(res)
         new_res = []
-        for entry in res:
-            loc = self.browse(entry[0])
-            new_name = entry[1]
+        for loc in self:
+            new_name = names[loc.id]
             if loc.olive_tank_type and loc.oil_product_id:
                 new_name = '%s (%s, %s)' % (
                     new_name, loc.olive_season_year, loc.oil_product_id.name)
-            new_res.append((entry[0], new_name))
+            new_res.append((loc.id, new_name))
         return new_res
 
     def olive_oil_tank_compatibility_check(self, oil_product, season):
@@ -89,6 +102,7 @@ class StockLocation(models.Model):
                         self.display_name,
                         self.olive_season_id.name))
 
+    @olive_perf
     def olive_oil_tank_check(self, raise_if_not_merged=True, raise_if_empty=True):
         '''Returns quantity
         Always raises when there are reservations
@@ -116,11 +130,10 @@ class StockLocation(models.Model):
             raise UserError(_(
                 "Olive season is not configured on tank '%s'.") % self.name)
 
+        # {(location_id, product_id): {lot_id: qty}} for this tank
+        lot_qty = sqo.olive_lot_qty_get([self.id])
         # raise if empty
-        quant_qty_rg = sqo.read_group(
-            [('location_id', '=', self.id)],
-            ['qty'], [])
-        qty = quant_qty_rg and quant_qty_rg[0]['qty'] or 0
+        qty = sum([sum(lots.values()) for lots in lot_qty.values()])
         fcompare = float_compare(qty, 0, precision_digits=prec)
         if fcompare < 0:
             raise UserError(_(
@@ -141,10 +154,10 @@ class StockLocation(models.Model):
                 % (reserved_quants_count, self.name))
 
         if raise_if_not_merged:
-            quant_lot_rg = sqo.read_group(
-                [('location_id', '=', self.id)],
-                ['qty', 'lot_id'], ['lot_id'])
-            if len(quant_lot_rg) > 1:
+            lot_ids = set()
+            for lots in lot_qty.values():
+                lot_ids.update(lots.keys())
+            if len(lot_ids) > 1:
                 raise UserError(_(
                     "The tank '%s' (type '%s') is not merged: it "
                     "contains several different lots.") % (
@@ -152,12 +165,9 @@ class StockLocation(models.Model):
             # for risouletto, there are additionnal checks for raise_if_not_merged
             # see below
 
-        quant_product_rg = sqo.read_group(
-            [('location_id', '=', self.id)],
-            ['qty', 'product_id'], ['product_id'])
+        products = ppo.browse([product_id for (location_id, product_id) in lot_qty])
         if tank_type == 'risouletto':
-            for quant_product in quant_product_rg:
-                product = ppo.browse(quant_product['product_id'][0])
+            for product in products:
                 if raise_if_not_merged and product != self.oil_product_id:
                     raise UserError(_(
                         "The tank '%s' (type '%s') contains '%s', "
@@ -169,12 +179,12 @@ class StockLocation(models.Model):
                         "which is not an olive oil product.") % (
                             self.name, tank_type_label, product.display_name))
         else:  # regular oil => always 1 product, same as configured on tank
-            if len(quant_product_rg) > 1:
+            if len(products) > 1:
                 raise UserError(_(
                     "There are several different products in tank '%s'. "
                     "This should never happen in an oil tank which is "
                     "not a risouletto tank.") % self.name)
-            product = ppo.browse(quant_product_rg[0]['product_id'][0])
+            product = products[0]
             if product != self.oil_product_id:
                 raise UserError(_(
                     "The tank '%s' (type '%s') contains '%s' but it is "
@@ -184,6 +194,138 @@ class StockLocation(models.Model):
                         self.oil_product_id.display_name))
         return qty
 
+    @olive_perf
+    def olive_oil_tank_merge(self, origin=None, bom_cache=None):
+        """Merge the lots of the olive tank with a manufacturing order.
+        bom_cache = {oil_product: merge_bom} can be shared between calls
+        to check the merge BOM of each oil product only once.
+        Returns the manufacturing order"""
+        self.ensure_one()
+        if origin is None:
+            origin = _('Olive oil tank merge')
+        pr_oil = self.env['decimal.precision'].precision_get('Olive Oil Volume')
+        ppo = self.env['product.product']
+        mpo = self.env['mrp.production']
+        splo = self.env['stock.production.lot']
+        sqo = self.env['stock.quant']
+        loc = self
+        qty = loc.olive_oil_tank_check(raise_if_not_merged=False)
+        # Check if already merged
+        error_msg = _(
+            "Oil tank '%s' is already merged.") % loc.name
+        quant_lot_rg = sqo.read_group(
+            [('location_id', '=', loc.id)],
+            ['qty', 'lot_id'], ['lot_id'])
+        if loc.olive_tank_type == 'risouletto':
+            if len(quant_lot_rg) == 1:
+                lot = splo.browse(quant_lot_rg[0]['lot_id'][0])
+                if lot.product_id == loc.oil_product_id:
+                    raise UserError(error_msg)
+        else:
+            if len(quant_lot_rg) == 1:
+                raise UserError(error_msg)
+        product = loc.oil_product_id
+        if bom_cache is None:
+            bom_cache = {}
+        if product not in bom_cache:
+            bom_cache[product] = product.oil_merge_get_bom()
+        bom = bom_cache[product]
+        mo = mpo.create({
+            'product_id': product.id,
+            'product_qty': qty,
+            'product_uom_id': product.uom_id.id,
+            'location_src_id': loc.id,
+            'location_dest_id': loc.id,
+            'origin': origin,
+            'bom_id': bom.id,
+            })
+        assert mo.state == 'confirmed'
+        if loc.olive_tank_type != 'risouletto':
+            if len(mo.move_raw_ids) != 1:
+                raise UserError(_(
+                    "Wrong bill of material for olive product '%s' "
+                    "configured on oil tank '%s': it should have a single "
+                    "component and this component should be the same product.")
+                    % (product.display_name, loc.name))
+            if mo.move_raw_ids[0].product_id != product:
+                raise UserError(_(
+                    "Wrong bill of material for olive product '%s' "
+                    "configured on oil tank '%s': it's single component "
+                    "should be the same product.") % (
+                        product.display_name, loc.name))
+        else:
+            # Write qty on raw moves
+            productid2rawmoves = {}
+            for rmove in mo.move_raw_ids:
+                assert rmove.product_id not in productid2rawmoves, 'Double product in raw moves'
+                productid2rawmoves[rmove.product_id.id] = rmove
+            quant_rg = sqo.read_group(
+                [('location_id', '=', loc.id)],
+                ['qty', 'product_id'], ['product_id'])
+            for qrg in quant_rg:
+                ris_tank_product_id = qrg['product_id'][0]
+                if ris_tank_product_id not in productid2rawmoves:
+                    ris_tank_product = ppo.browse(ris_tank_product_id)
+                    raise UserError(_(
+                        "Product '%s' is not present on the bill of material "
+                        "of product '%s'.") % (ris_tank_product.display_name, product.display_name))
+                raw_move = productid2rawmoves[ris_tank_product_id]
+                raw_move.product_uom_qty = qrg['qty']
+                productid2rawmoves.pop(ris_tank_product_id)
+            for empty_raw_move in productid2rawmoves.values():
+                empty_raw_move.product_uom_qty = 0
+                empty_raw_move.action_cancel()
+
+        assert len(mo.move_finished_ids) == 1, 'Wrong finished moves'
+        assert mo.move_finished_ids[0].product_id == product, 'Wrong product on finished move'
+        mo.action_assign()
+        if mo.availability != 'assigned':
+            raise UserError(_(
+                "Could not reserve the oil to merge the tank %s. "
+                "This should never happen.")
+                % loc.name)
+        for raw_move in mo.move_raw_ids.filtered(lambda r: r.state != 'cancel'):
+            assert raw_move.move_lot_ids, 'No move_lot_ids'
+            for move_lot in raw_move.move_lot_ids:
+                assert move_lot.lot_id
+                move_lot.quantity_done = move_lot.quantity
+        # raw lines should be green at this step
+        # Create finished lot
+        merge_lot_name = self.env['ir.sequence'].next_by_code('olive.oil.merge.lot')
+        new_lot = splo.create({
+            'product_id': product.id,
+            'name': merge_lot_name,
+            })
+        self.env['stock.move.lots'].create({
+            'move_id': mo.move_finished_ids[0].id,
+            'product_id': product.id,
+            'production_id': mo.id,
+            'quantity': qty,
+            'quantity_done': qty,
+            'lot_id': new_lot.id,
+            })
+        for raw_move in mo.move_raw_ids.filtered(lambda r: r.state != 'cancel'):
+            for raw_move_lot in raw_move.move_lot_ids:
+                assert not raw_move_lot.lot_produced_id
+            raw_move.move_lot_ids.write({'lot_produced_id': new_lot.id})
+        mo.write({
+            'state': 'progress',
+            'date_start': datetime.now(),
+            })
+        assert mo.post_visible is True
+        mo.post_inventory()
+        assert mo.check_to_done is True
+        mo.button_mark_done()
+        post_mo_qty = loc.olive_oil_tank_check()
+        if float_compare(qty, post_mo_qty, precision_digits=pr_oil):
+            raise UserError(_(
+                "In tank '%s', the oil quantity after the merge (%s) "
+                "is different from the oil quantity before the merge (%s). "
+                "This should never happen.") % (
+                    loc.name, post_mo_qty, qty))
+        return mo
+
+    @olive_perf
     def olive_oil_transfer(
             self, dest_loc, transfer_type, warehouse, dest_partner=False,
             partial_transfer_qty=False, origin=False, auto_validate=False):
@@ -195,7 +337,7 @@ class StockLocation(models.Model):
                 % self.display_name)
         sqo = self.env['stock.quant']
         smo = self.env['stock.move']
-        pr_oil = self.env['decimal.precision'].precision_get('Olive Oil Volume')
+        pr_oil = self.env.user.company_id.olive_mill_context().pr_oil
         src_loc = self
         raise_if_not_merged = False
         if transfer_type == 'partial':
@@ -17,6 +17,7 @@ class StockProductionLot(models.Model):
     @api.depends('name', 'expiry_date', 'olive_production_id')
     def name_get(self):
         res = []
+        self.mapped('olive_production_id.farmers')
         for lot in self:
             dname = lot.name
             if lot.expiry_date:
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Barroux Abbey (https://www.barroux.org/)
+# @author: Alexis de Lattre <alexis.delattre@akretion.com>
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, fields, models
+import odoo.addons.decimal_precision as dp
+import logging
+logger = logging.getLogger(__name__)
+
+BALANCE_FIELDS = [
+    'qty', 'owner_id', 'product_id', 'location_id', 'company_id']
+
+
+class StockQuant(models.Model):
+    _inherit = 'stock.quant'
+
+    def _withdrawal_balance_deltas(self, sign=1):
+        """Olive oil owned by a farmer on an internal location
+        which is not a tank is oil to withdraw"""
+        deltas = {}
+        for quant in self:
+            if (
+                    quant.owner_id and
+                    quant.product_id.olive_type == 'oil' and
+                    quant.location_id.usage == 'internal' and
+                    not quant.location_id.olive_tank_type):
+                key = (
+                    quant.company_id.id, quant.owner_id.id,
+                    quant.product_id.id, quant.location_id.id)
+                deltas[key] = deltas.get(key, 0.0) + quant.qty * sign
+        return deltas
+
+    @api.model
+    def olive_lot_qty_get(self, location_ids, product_ids=None):
+        """Returns {(location_id, product_id): {lot_id: qty}} with a single
+        grouped query. lot_id is False for the quants without lot"""
+        domain = [('location_id', 'in', location_ids)]
+        if product_ids is not None:
+            domain.append(('product_id', 'in', product_ids))
+        res = {}
+        rg = self.read_group(
+            domain, ['qty', 'location_id', 'product_id', 'lot_id'],
+            ['location_id', 'product_id', 'lot_id'], lazy=False)
+        for re in rg:
+            key = (re['location_id'][0], re['product_id'][0])
+            lot_id = re['lot_id'] and re['lot_id'][0] or False
+            res.setdefault(key, {})[lot_id] = re['qty'] or 0.0
+        return res
+
+    @api.model
+    def create(self, vals):
+        quant = super(StockQuant, self).create(vals)
+        self.env['olive.oil.withdrawal.balance']._add(
+            quant._withdrawal_balance_deltas())
+        return quant
+
+    def write(self, vals):
+        owbo = self.env['olive.oil.withdrawal.balance']
+        update_balance = any([field in vals for field in BALANCE_FIELDS])
+        if update_balance:
+            owbo._add(self._withdrawal_balance_deltas(sign=-1))
+        res = super(StockQuant, self).write(vals)
+        if update_balance:
+            owbo._add(self._withdrawal_balance_deltas())
+        return res
+
+    def unlink(self):
+        self.env['olive.oil.withdrawal.balance']._add(
+            self._withdrawal_balance_deltas(sign=-1))
+        return super(StockQuant, self).unlink()
+
+
+class OliveOilWithdrawalBalance(models.Model):
+    _name = 'olive.oil.withdrawal.balance'
+    _description = 'Olive Oil to Withdraw per Farmer'
+    _rec_name = 'partner_id'
+    _order = 'partner_id, product_id'
+
+    company_id = fields.Many2one(
+        'res.company', string='Company', required=True, ondelete='cascade',
+        readonly=True)
+    partner_id = fields.Many2one(
+        'res.partner', string='Olive Farmer', required=True,
+        ondelete='cascade', readonly=True, index=True)
+    product_id = fields.Many2one(
+        'product.product', string='Oil Product', required=True,
+        ondelete='cascade', readonly=True)
+    location_id = fields.Many2one(
+        'stock.location', string='Location', required=True,
+        ondelete='cascade', readonly=True)
+    qty = fields.Float(
+        string='Oil Qty to Withdraw', readonly=True,
+        digits=dp.get_precision('Olive Oil Volume'))
+
+    _sql_constraints = [(
+        'company_partner_product_location_unique',
+        'unique(company_id, partner_id, product_id, location_id)',
+        'There is already a balance for this farmer, product and location.')]
+
+    @api.model_cr
+    def init(self):
+        # the balances are summed per farmer before filtering the farmers
+        # who have oil to withdraw, so a partial index on qty > 0 is useless
+        self._cr.execute(
+            "DROP INDEX IF EXISTS olive_oil_withdrawal_balance_to_withdraw_idx")
+        self._cr.execute("""
+            CREATE INDEX IF NOT EXISTS
+            olive_oil_withdrawal_balance_location_partner_idx
+            ON olive_oil_withdrawal_balance (location_id, partner_id)
+            """)
+
+    @api.model
+    def _add(self, deltas):
+        """deltas = {(company_id, partner_id, product_id, location_id): qty}
+        A single upsert per key: two transactions that create the first
+        quant of the same key don't conflict on the unique constraint"""
+        for (company_id, partner_id, product_id, location_id), qty in\
+                deltas.items():
+            if not qty:
+                continue
+            self._cr.execute("""
+                INSERT INTO olive_oil_withdrawal_balance (
+                    create_uid, create_date, write_uid, write_date,
+                    company_id, partner_id, product_id, location_id, qty)
+                VALUES (
+                    %s, now() at time zone 'UTC', %s, now() at time zone 'UTC',
+                    %s, %s, %s, %s, %s)
+                ON CONFLICT (company_id, partner_id, product_id, location_id)
+                DO UPDATE SET
+                    qty = olive_oil_withdrawal_balance.qty + EXCLUDED.qty,
+                    write_uid = EXCLUDED.write_uid,
+                    write_date = EXCLUDED.write_date
+                """, (self._uid, self._uid, company_id, partner_id,
+                      product_id, location_id, qty))
+        self.invalidate_cache(['qty'])
+
+    @api.model
+    def get_qty_to_withdraw(self, partner_ids=None, location_ids=None):
+        """Returns {partner_id: qty} for the farmers who still have oil
+        to withdraw. All farmers are considered when partner_ids is None.
+        As on the quants, the qty is the signed sum of the balances of the
+        farmer: a negative balance offsets the positive ones."""
+        where = []
+        params = []
+        if partner_ids is not None:
+            if not partner_ids:
+                return {}
+            where.append('partner_id IN %s')
+            params.append(tuple(partner_ids))
+        if location_ids is not None:
+            if not location_ids:
+                return {}
+            where.append('location_id IN %s')
+            params.append(tuple(location_ids))
+        self._cr.execute("""
+            SELECT partner_id, SUM(qty) FROM olive_oil_withdrawal_balance
+            """ + (where and 'WHERE ' + ' AND '.join(where) or '') + """
+            GROUP BY partner_id
+            HAVING SUM(qty) > 0
+            """, tuple(params))
+        return dict(self._cr.fetchall())
+
+    @api.model
+    def rebuild(self, location_ids=None):
+        """Fill the balances from the quants. Only needed when installing or
+        upgrading the module, and for the locations of location_ids when
+        their tank type or usage is modified: afterwards, the balances
+        are kept up-to-date by the quants"""
+        where = ''
+        params = [self._uid, self._uid]
+        if location_ids is not None:
+            if not location_ids:
+                return
+            where = ' AND sq.location_id IN %s'
+            params.append(tuple(location_ids))
+            self._cr.execute(
+                "DELETE FROM olive_oil_withdrawal_balance "
+                "WHERE location_id IN %s", (tuple(location_ids), ))
+        else:
+            self._cr.execute("DELETE FROM olive_oil_withdrawal_balance")
+        self._cr.execute("""
+            INSERT INTO olive_oil_withdrawal_balance (
+                create_uid, create_date, write_uid, write_date,
+                company_id, partner_id, product_id, location_id, qty)
+            SELECT %s, now() at time zone 'UTC', %s, now() at time zone 'UTC',
+                sq.company_id, sq.owner_id, sq.product_id, sq.location_id,
+                SUM(sq.qty)
+            FROM stock_quant sq
+            LEFT JOIN product_product pp ON pp.id = sq.product_id
+            LEFT JOIN product_template pt ON pt.id = pp.product_tmpl_id
+            LEFT JOIN stock_location sl ON sl.id = sq.location_id
+            WHERE sq.owner_id IS NOT NULL
+            AND pt.olive_type = 'oil'
+            AND sl.usage = 'internal'
+            AND sl.olive_tank_type IS NULL
+            """ + where + """
+            GROUP BY sq.company_id, sq.owner_id, sq.product_id, sq.location_id
+            """, tuple(params))
+        logger.info('%d oil withdrawal balances generated', self._cr.rowcount)
+        self.invalidate_cache()
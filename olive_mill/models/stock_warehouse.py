@@ -10,6 +10,11 @@ from dateutil.relativedelta import relativedelta
 import logging
 logger = logging.getLogger(__name__)
 
+# fields of stock.warehouse read by res.company.olive_mill_context()
+MILL_CONTEXT_FIELDS = [
+    'company_id', 'olive_mill', 'olive_withdrawal_loc_id',
+    'olive_compensation_loc_id']
+
 
 class StockWarehouse(models.Model):
     _inherit = 'stock.warehouse'
@@ -39,6 +44,11 @@ class StockWarehouse(models.Model):
         string='Last Update of the Compensation Ratio')
     olive_oil_compensation_ratio_days = fields.Integer(
         string='Base for Compensation Ratio Computation', default=7)
+    olive_oil_compensation_ratio_intraday = fields.Boolean(
+        string='Update Compensation Ratio after each Production',
+        help="If enabled, the compensation ratio is updated each time an "
+        "oil production of this warehouse is set to done. Otherwise, it "
+        "is updated once a day by the scheduled action.")
 
     _sql_constraints = [(
         'olive_oil_compensation_ratio_positive',
@@ -65,39 +75,143 @@ class StockWarehouse(models.Model):
                 wh.olive_regular_case_stock = wh.olive_regular_case_total
                 wh.olive_organic_case_stock = wh.olive_organic_case_total
 
+    # invalidate res.company.olive_mill_context()
+    @api.model
+    def create(self, vals):
+        self.clear_caches()
+        return super(StockWarehouse, self).create(vals)
+
+    def write(self, vals):
+        if any([field in vals for field in MILL_CONTEXT_FIELDS]):
+            self.clear_caches()
+        res = super(StockWarehouse, self).write(vals)
+        # the cron drops the days that are out of the window, so they
+        # must be restored when the window is enlarged
+        if 'olive_oil_compensation_ratio_days' in vals or 'olive_mill' in vals:
+            self.olive_oil_compensation_day_rebuild(warehouse_ids=self.ids)
+        return res
+
+    def unlink(self):
+        self.clear_caches()
+        return super(StockWarehouse, self).unlink()
+
     @api.model
     def olive_oil_compensation_ratio_update_cron(self):
         logger.info('Starting oil compensation ratio update cron')
-        for wh in self.search([('olive_mill', '=', True)]):
-            wh.olive_oil_compensation_ratio_update()
+        today = fields.Date.context_today(self)
+        # drop the days that are out of the window of their warehouse
+        self._cr.execute("""
+            DELETE FROM olive_oil_compensation_day ocd
+            USING stock_warehouse sw
+            WHERE sw.id = ocd.warehouse_id
+            AND ocd.date < %s::date - sw.olive_oil_compensation_ratio_days
+            """, (today, ))
+        logger.info(
+            '%d expired days deleted from the compensation days',
+            self._cr.rowcount)
+        self.env['olive.oil.compensation.day'].invalidate_cache()
+        whs = self.search([('olive_mill', '=', True)])
+        whs._olive_oil_compensation_ratio_write(today)
 
     def olive_oil_compensation_ratio_update(self):
         today = fields.Date.context_today(self)
-        today_dt = fields.Date.from_string(today)
-        if not self.olive_mill:
+        self.filtered('olive_mill')._olive_oil_compensation_ratio_write(today)
+
+    def _olive_oil_compensation_ratio_write(self, today):
+        if not self:
             return
-        start_date_dt = today_dt - relativedelta(
-            days=self.olive_oil_compensation_ratio_days)
-        start_date = fields.Date.to_string(start_date_dt)
-        rg = self.env['olive.arrival.line'].read_group([
-            ('production_state', '=', 'done'),
-            ('production_date', '<=', today),
-            ('production_date', '>=', start_date),
-            ], ['olive_qty', 'oil_qty'], [])
-        if rg and rg[0]['olive_qty']:
-            ratio = 100 * rg[0]['oil_qty'] / rg[0]['olive_qty']
-            self.write({
-                'olive_oil_compensation_ratio_update_date': today,
-                'olive_oil_compensation_ratio': ratio,
+        self._cr.execute("""
+            SELECT ocd.warehouse_id, SUM(ocd.olive_qty), SUM(ocd.oil_qty)
+            FROM olive_oil_compensation_day ocd
+            JOIN stock_warehouse sw ON sw.id = ocd.warehouse_id
+            WHERE ocd.warehouse_id IN %s
+            AND ocd.date <= %s
+            AND ocd.date >= %s::date - sw.olive_oil_compensation_ratio_days
+            GROUP BY ocd.warehouse_id
+            """, (tuple(self.ids), today, today))
+        wh2qty = dict([
+            (wh_id, (olive_qty, oil_qty))
+            for (wh_id, olive_qty, oil_qty) in self._cr.fetchall()])
+        for wh in self:
+            olive_qty, oil_qty = wh2qty.get(wh.id, (0, 0))
+            start_date = fields.Date.to_string(
+                fields.Date.from_string(today) -
+                relativedelta(days=wh.olive_oil_compensation_ratio_days))
+            if olive_qty:
+                ratio = 100 * oil_qty / olive_qty
+                wh.write({
+                    'olive_oil_compensation_ratio_update_date': today,
+                    'olive_oil_compensation_ratio': ratio,
+                    })
+                logger.info(
+                    'Oil compensation ratio updated to %s on warehouse %s '
+                    'start_date %s ', ratio, wh.name, start_date)
+            else:
+                logger.warning(
+                    'Oil compensation ratio not updated on warehouse %s '
+                    'because there is no production data between %s and %s',
+                    wh.name, start_date, today)
+
+    def olive_oil_compensation_day_add(self, date, olive_qty, oil_qty):
+        """Called when an oil production is set to done"""
+        self.ensure_one()
+        self._cr.execute("""
+            UPDATE olive_oil_compensation_day
+            SET olive_qty = olive_qty + %s, oil_qty = oil_qty + %s
+            WHERE warehouse_id = %s AND date = %s
+            """, (olive_qty, oil_qty, self.id, date))
+        if self._cr.rowcount:
+            self.env['olive.oil.compensation.day'].invalidate_cache()
+        else:
+            self.env['olive.oil.compensation.day'].sudo().create({
+                'warehouse_id': self.id,
+                'date': date,
+                'olive_qty': olive_qty,
+                'oil_qty': oil_qty,
                 })
-            logger.info(
-                'Oil compensation ratio updated to %s on warehouse %s '
-                'start_date %s ', ratio, self.name, start_date)
+        if self.olive_oil_compensation_ratio_intraday:
+            self.sudo().olive_oil_compensation_ratio_update()
+
+    @api.model
+    def olive_oil_compensation_day_rebuild(self, warehouse_ids=None):
+        """Fill the compensation days from the done productions.
+        Needed when installing or upgrading the module and, for the
+        warehouses of warehouse_ids, when their number of days is modified.
+        Afterwards, the days are kept up-to-date when productions are set
+        to done"""
+        today = fields.Date.context_today(self)
+        where = ''
+        params = [self._uid, self._uid, today, today]
+        if warehouse_ids is not None:
+            if not warehouse_ids:
+                return
+            where = ' AND oal.warehouse_id IN %s'
+            params.append(tuple(warehouse_ids))
+            self._cr.execute(
+                "DELETE FROM olive_oil_compensation_day "
+                "WHERE warehouse_id IN %s", (tuple(warehouse_ids), ))
         else:
-            logger.warning(
-                'Oil compensation ratio not updated on warehouse %s '
-                'because there is no production data between %s and %s',
-                self.name, start_date, today)
+            self._cr.execute("DELETE FROM olive_oil_compensation_day")
+        self._cr.execute("""
+            INSERT INTO olive_oil_compensation_day (
+                create_uid, create_date, write_uid, write_date,
+                warehouse_id, date, olive_qty, oil_qty)
+            SELECT %s, now() at time zone 'UTC',
+                %s, now() at time zone 'UTC',
+                oal.warehouse_id, oal.production_date,
+                SUM(oal.olive_qty), SUM(oal.oil_qty)
+            FROM olive_arrival_line oal
+            JOIN stock_warehouse sw ON sw.id = oal.warehouse_id
+            WHERE oal.production_state = 'done'
+            AND sw.olive_mill IS true
+            AND oal.production_date <= %s
+            AND oal.production_date >=
+                %s::date - sw.olive_oil_compensation_ratio_days
+            """ + where + """
+            GROUP BY oal.warehouse_id, oal.production_date
+            """, tuple(params))
+        logger.info('%d compensation days generated', self._cr.rowcount)
+        self.env['olive.oil.compensation.day'].invalidate_cache()
 
     def olive_get_shrinkage_tank(self, oil_product, raise_if_not_found=True):
         self.ensure_one()
@@ -113,3 +227,26 @@ class StockWarehouse(models.Model):
                 "that accepts '%s'.") % (
                     self.display_name, oil_product.name))
         return sloc or False
+
+
+class OliveOilCompensationDay(models.Model):
+    _name = 'olive.oil.compensation.day'
+    _description = 'Olive Oil Production Totals per Day for Compensation'
+    _order = 'date desc'
+    _rec_name = 'date'
+
+    warehouse_id = fields.Many2one(
+        'stock.warehouse', string='Warehouse', required=True,
+        ondelete='cascade', readonly=True, index=True)
+    date = fields.Date(string='Date', required=True, readonly=True)
+    olive_qty = fields.Float(
+        string='Olive Qty (kg)', digits=dp.get_precision('Olive Weight'),
+        readonly=True)
+    oil_qty = fields.Float(
+        string='Oil Qty (L)', digits=dp.get_precision('Olive Oil Volume'),
+        readonly=True)
+
+    _sql_constraints = [(
+        'warehouse_date_unique',
+        'unique(warehouse_id, date)',
+        'This day already exists for this warehouse.')]
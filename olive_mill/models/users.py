@@ -14,8 +14,4 @@ class ResUsers(models.Model):
 
     def _default_olive_mill_wh(self):
         self.ensure_one()
-        wh = self.env['stock.warehouse'].search([
-            ('company_id', '=', self.company_id.id),
-            ('olive_mill', '=', True)],
-            limit=1)
-        return wh
+        return self.company_id.olive_mill_context().warehouse
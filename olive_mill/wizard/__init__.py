@@ -5,16 +5,22 @@ from . import olive_palox_case_lend
 from . import olive_palox_generate_production
 from . import olive_arrival_warning
 from . import olive_withdrawal
+from . import olive_withdrawal_batch
 from . import olive_oil_production_ratio2force
 from . import olive_oil_production_force_ratio
 from . import olive_oil_production_pack2check
 from . import olive_invoice_create
 from . import olive_oil_tank_transfer
 from . import olive_oil_tank_merge
+from . import olive_oil_tank_merge_batch
 from . import olive_oil_bottling
+from . import olive_oil_bottling_run
 from . import olive_oil_picking
 from . import olive_oil_production_compensation
 from . import olive_oil_production_product_swap
 from . import olive_appointment_print
 from . import olive_oil_production_day_print
+from . import olive_day_print
 from . import olive_partner_warning_print
+from . import olive_season_forecast
+from . import olive_oil_analysis_import
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Barroux Abbey (https://www.barroux.org/)
+# @author: Alexis de Lattre <alexis.delattre@akretion.com>
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import fields, models, _
+from odoo.exceptions import UserError
+import hashlib
+import json
+import logging
+logger = logging.getLogger(__name__)
+
+# document: (model, report_name, file prefix)
+DAY_DOCUMENTS = {
+    'arrival': ('olive.arrival', 'olive.arrival', 'Arrivals'),
+    'production': (
+        'olive.oil.production', 'olive.oil.production', 'Productions'),
+    }
+
+
+class OliveDayPrint(models.TransientModel):
+    _name = 'olive.day.print'
+    _description = 'Wizard to print all the documents of the day'
+
+    date = fields.Date(
+        string='Date', default=fields.Date.context_today, required=True)
+    warehouse_id = fields.Many2one(
+        'stock.warehouse', string='Olive Mill', required=True,
+        domain=[('olive_mill', '=', True)],
+        default=lambda self: self.env.user._default_olive_mill_wh())
+    document = fields.Selection([
+        ('arrival', 'Arrival Tickets'),
+        ('production', 'Olive Oil Production Sheets'),
+        ], string='Documents', default='arrival', required=True)
+
+    def _get_records(self):
+        model = DAY_DOCUMENTS[self.document][0]
+        if self.document == 'arrival':
+            order = 'name'
+        else:
+            order = 'sequence desc, id asc'
+        return self.env[model].search([
+            ('date', '=', self.date),
+            ('warehouse_id', '=', self.warehouse_id.id),
+            ('state', '!=', 'cancel'),
+            ], order=order)
+
+    def run(self):
+        self.ensure_one()
+        model, report_name, prefix = DAY_DOCUMENTS[self.document]
+        iao = self.env['ir.attachment']
+        records = self._get_records()
+        if not records:
+            raise UserError(_("There are no documents to print on %s.")
+                            % self.date)
+        # A single call reads all the data of the template in bulk
+        # the rendering will then use the cache
+        data = records.report_prefetch()
+        report = self.env['report']._get_report_from_name(report_name)
+        content_hash = hashlib.sha1(json.dumps([
+            records.ids, data, report.write_date,
+            self.env.user.lang, self.env.user.company_id.id],
+            sort_keys=True, default=unicode)).hexdigest()[:16]
+        filename = '%s-%s-%s.%s' % (
+            prefix, self.date, content_hash, report.py3o_filetype)
+        # Reprint of unchanged documents: no new rendering
+        attach = iao.search([
+            ('res_model', '=', 'stock.warehouse'),
+            ('res_id', '=', self.warehouse_id.id),
+            ('name', '=', filename),
+            ], limit=1)
+        if attach:
+            logger.info('Reprint of %s: re-use existing attachment', filename)
+        else:
+            content, filetype = self.env[
+                'ir.actions.report.xml'].render_report(
+                records.ids, report_name, {})
+            # the documents of the day have changed: drop the old prints
+            iao.search([
+                ('res_model', '=', 'stock.warehouse'),
+                ('res_id', '=', self.warehouse_id.id),
+                ('name', '=like', '%s-%s-%%' % (prefix, self.date)),
+                ]).unlink()
+            attach = iao.create({
+                'name': filename,
+                'datas_fname': filename,
+                'datas': content.encode('base64'),
+                'res_model': 'stock.warehouse',
+                'res_id': self.warehouse_id.id,
+                })
+        action = {
+            'type': 'ir.actions.act_url',
+            'url': '/web/content/%d?download=true' % attach.id,
+            'target': 'self',
+            }
+        return action
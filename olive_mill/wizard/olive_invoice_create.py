@@ -5,6 +5,7 @@
 
 from odoo import fields, models, _
 from odoo.exceptions import UserError
+from ..models.olive_perf_sample import olive_perf
 
 
 class OliveInvoiceCreate(models.TransientModel):
@@ -40,6 +41,7 @@ class OliveInvoiceCreate(models.TransientModel):
         ('all', 'Supplier and Customer Invoice'),
         ], string='Invoice Type', default='all', required=True)
 
+    @olive_perf
     def validate(self):
         self.ensure_one()
         oalo = self.env['olive.arrival.line']
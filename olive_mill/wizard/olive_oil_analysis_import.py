@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Barroux Abbey (https://www.barroux.org/)
+# @author: Alexis de Lattre <alexis.delattre@akretion.com>
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import fields, models, _
+from odoo.exceptions import UserError
+from odoo.tools import float_is_zero
+from ..models.olive_tracking import olive_tracking_batch
+from datetime import date, datetime
+import base64
+import csv
+import io
+import logging
+logger = logging.getLogger(__name__)
+
+try:
+    import openpyxl
+except ImportError:
+    logger.debug('Cannot import openpyxl')
+    openpyxl = None
+
+HEADER2KEY = {
+    'analysis': 'analysis',
+    'analysis number': 'analysis',
+    'lot': 'lot',
+    'arrival line': 'arrival_line',
+    'arrival_line': 'arrival_line',
+    'type': 'type',
+    'analysis type': 'type',
+    'result': 'result',
+    'date': 'date',
+    }
+PRECISION2FIELD = {
+    0: 'result_int',
+    1: 'result_p1',
+    2: 'result_p2',
+    }
+
+
+class OliveOilAnalysisImport(models.TransientModel):
+    _name = 'olive.oil.analysis.import'
+    _description = 'Import the results of olive oil analysis'
+
+    file_to_import = fields.Binary(string='File to Import', required=True)
+    filename = fields.Char(string='Filename')
+    csv_delimiter = fields.Char(string='CSV Delimiter', size=1, default=';')
+    csv_encoding = fields.Selection([
+        ('utf-8', 'UTF-8'),
+        ('cp1252', 'Windows-1252 (Excel)'),
+        ('iso-8859-15', 'ISO-8859-15 (Latin-9)'),
+        ], string='CSV Encoding', default='utf-8', required=True)
+    execution_partner_id = fields.Many2one(
+        'res.partner', string='Laboratory', required=True,
+        domain=[('supplier', '=', True)])
+    date = fields.Date(
+        string='Analysis Date', required=True,
+        default=fields.Date.context_today,
+        help="Used for the rows that don't have a date.")
+    validate_analysis = fields.Boolean(
+        string='Validate Complete Analysis', default=True,
+        help="If enabled, the analysis that have a result on all their "
+        "lines after the import are validated.")
+    row_count = fields.Integer(string='Imported Rows', readonly=True)
+    analysis_ids = fields.Many2many(
+        'olive.oil.analysis', string='Updated Analysis', readonly=True)
+    validated_count = fields.Integer(
+        string='Validated Analysis', readonly=True)
+    reject_ids = fields.One2many(
+        'olive.oil.analysis.import.reject', 'wizard_id', string='Rejects',
+        readonly=True)
+    state = fields.Selection([
+        ('draft', 'Draft'),
+        ('done', 'Done'),
+        ], default='draft', readonly=True)
+
+    def _iter_rows(self):
+        """Generator of (row_number, [cell values]). The XLSX files are
+        read in read-only mode, so the workbook is not loaded in memory"""
+        data = base64.b64decode(self.file_to_import)
+        if self.filename and self.filename.lower().endswith('.xlsx'):
+            if openpyxl is None:
+                raise UserError(_(
+                    "The Python library openpyxl is required to import "
+                    "XLSX files."))
+            wb = openpyxl.load_workbook(
+                io.BytesIO(data), read_only=True, data_only=True)
+            for i, row in enumerate(wb.worksheets[0].iter_rows(), 1):
+                yield i, [cell.value for cell in row]
+        else:
+            encoding = self.csv_encoding or 'utf-8'
+            reader = csv.reader(
+                io.BytesIO(data), delimiter=str(self.csv_delimiter or ';'))
+            for i, row in enumerate(reader, 1):
+                try:
+                    cells = [cell.decode(encoding) for cell in row]
+                except UnicodeDecodeError:
+                    raise UserError(_(
+                        "Line %d of the CSV file is not encoded in %s. "
+                        "Select the encoding of the file (Windows-1252 for "
+                        "the CSV files exported by Excel) and try again.")
+                        % (i, encoding))
+                yield i, cells
+
+    def _cell2str(self, value):
+        if value is None:
+            return u''
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        if not isinstance(value, basestring):
+            value = unicode(value)
+        return value.strip()
+
+    def _cell2date(self, value):
+        if isinstance(value, (date, datetime)):
+            return fields.Date.to_string(value)
+        value = self._cell2str(value)
+        if not value:
+            return self.date
+        # raises ValueError when the format is not YYYY-MM-DD
+        return fields.Date.to_string(fields.Date.from_string(value))
+
+    def _build_indexes(self):
+        """Returns the indexes used to match the rows:
+        {'analysis': {name: [analysis_ids]}, 'lot': {...},
+        'arrival_line': {...}, 'type': {name_or_code: product}}"""
+        indexes = {'analysis': {}, 'lot': {}, 'arrival_line': {}, 'type': {}}
+        lot2ana = {}
+        aline2ana = {}
+        for ana in self.env['olive.oil.analysis'].search_read([
+                ('state', '=', 'draft'),
+                ('company_id', '=', self.env.user.company_id.id)],
+                ['name', 'lot_id', 'arrival_line_id']):
+            indexes['analysis'].setdefault(ana['name'], []).append(ana['id'])
+            if ana['lot_id']:
+                lot2ana.setdefault(ana['lot_id'][0], []).append(ana['id'])
+            if ana['arrival_line_id']:
+                aline2ana.setdefault(
+                    ana['arrival_line_id'][0], []).append(ana['id'])
+        for lot in self.env['stock.production.lot'].search_read(
+                [('id', 'in', list(lot2ana))], ['name']):
+            indexes['lot'].setdefault(lot['name'], []).extend(
+                lot2ana[lot['id']])
+        for aline in self.env['olive.arrival.line'].search_read(
+                [('id', 'in', list(aline2ana))], ['name']):
+            indexes['arrival_line'].setdefault(aline['name'], []).extend(
+                aline2ana[aline['id']])
+        for product in self.env['product.product'].search(
+                [('olive_type', '=', 'analysis')]):
+            indexes['type'][product.name.lower()] = product
+            if product.default_code:
+                indexes['type'][product.default_code.lower()] = product
+        return indexes
+
+    def _read_file(self, indexes, rejects):
+        """Returns (row_count, {analysis_id: {product_id: (row, result)}},
+        {analysis_id: date})"""
+        results = {}
+        ana2date = {}
+        today = fields.Date.context_today(self)
+        col2key = None
+        row_count = 0
+        for i, row in self._iter_rows():
+            if not any([self._cell2str(cell) for cell in row]):
+                continue
+            if col2key is None:
+                col2key = dict([
+                    (col, HEADER2KEY.get(self._cell2str(cell).lower()))
+                    for (col, cell) in enumerate(row)])
+                keys = col2key.values()
+                if (
+                        'type' not in keys or 'result' not in keys or
+                        not any([key in keys for key in (
+                            'analysis', 'lot', 'arrival_line')])):
+                    raise UserError(_(
+                        "The first line of the file must contain the column "
+                        "headers 'type', 'result' and 'analysis', 'lot' "
+                        "or 'arrival line'."))
+                continue
+            row_count += 1
+            rvals = {}
+            for col, cell in enumerate(row):
+                if col2key.get(col):
+                    rvals[col2key[col]] = cell
+            ana_ids = None
+            ref = u''
+            for key in ('analysis', 'lot', 'arrival_line'):
+                ref = self._cell2str(rvals.get(key))
+                if ref:
+                    ana_ids = indexes[key].get(ref)
+                    break
+            if not ana_ids:
+                rejects.append((i, ref, _("No draft analysis found.")))
+                continue
+            if len(ana_ids) > 1:
+                rejects.append((i, ref, _("Several draft analysis found.")))
+                continue
+            product = indexes['type'].get(
+                self._cell2str(rvals.get('type')).lower())
+            if not product:
+                rejects.append((i, ref, _("Unknown analysis type '%s'.") % (
+                    self._cell2str(rvals.get('type')))))
+                continue
+            result = rvals.get('result')
+            try:
+                if not isinstance(result, (int, float)):
+                    result = float(self._cell2str(result).replace(',', '.'))
+                ana_date = self._cell2date(rvals.get('date'))
+            except ValueError:
+                rejects.append((i, ref, _("Wrong result or date format.")))
+                continue
+            if ana_date > today:
+                rejects.append((i, ref, _("The date is in the future.")))
+                continue
+            results.setdefault(ana_ids[0], {})[product.id] = (i, result)
+            ana2date[ana_ids[0]] = ana_date
+        return row_count, results, ana2date
+
+    def run(self):
+        self.ensure_one()
+        ooao = self.env['olive.oil.analysis']
+        ooalo = self.env['olive.oil.analysis.line']
+        ppo = self.env['product.product']
+        rejects = []
+        indexes = self._build_indexes()
+        row_count, results, ana2date = self._read_file(indexes, rejects)
+        # one query for the existing lines of all the analysis
+        existing = {}
+        for line in ooalo.search_read(
+                [('analysis_id', 'in', list(results))],
+                ['analysis_id', 'product_id', 'decimal_precision']):
+            existing[(line['analysis_id'][0], line['product_id'][0])] = line
+        validated_count = 0
+        with olive_tracking_batch(ooao) as ooao:
+            analyses = ooao.browse(list(results))
+            for ana in analyses:
+                line_cmds = []
+                for product_id, (row, result) in results[ana.id].items():
+                    line = existing.get((ana.id, product_id))
+                    if line:
+                        precision = line['decimal_precision']
+                    else:
+                        precision = ppo.browse(
+                            product_id).olive_analysis_decimal_precision
+                    if precision not in PRECISION2FIELD:
+                        rejects.append((row, ana.name, _(
+                            "Decimal precision %s not supported.")
+                            % precision))
+                        continue
+                    if not precision:
+                        result = int(round(result))
+                    vals = {PRECISION2FIELD[precision]: result}
+                    if line:
+                        line_cmds.append((1, line['id'], vals))
+                    else:
+                        vals['product_id'] = product_id
+                        line_cmds.append((0, 0, vals))
+                ana.write({
+                    'line_ids': line_cmds,
+                    'date': ana2date[ana.id],
+                    'execution_mode': 'external',
+                    'execution_partner_id': self.execution_partner_id.id,
+                    'execution_user_id': False,
+                    })
+            if self.validate_analysis and analyses:
+                incomplete_ids = set()
+                for line in ooalo.search_read(
+                        [('analysis_id', 'in', analyses.ids)],
+                        ['analysis_id', 'result_int', 'result_p1',
+                         'result_p2']):
+                    if (
+                            not line['result_int'] and
+                            float_is_zero(
+                                line['result_p1'], precision_digits=1) and
+                            float_is_zero(
+                                line['result_p2'], precision_digits=2)):
+                        incomplete_ids.add(line['analysis_id'][0])
+                to_validate = analyses.filtered(
+                    lambda x: x.id not in incomplete_ids)
+                to_validate.validate()
+                validated_count = len(to_validate)
+        self.write({
+            'state': 'done',
+            'row_count': row_count,
+            'analysis_ids': [(6, 0, list(results))],
+            'validated_count': validated_count,
+            'reject_ids': [(0, 0, {
+                'row': row,
+                'reference': ref,
+                'message': message,
+                }) for (row, ref, message) in rejects],
+            })
+        logger.info(
+            'Olive oil analysis import: %d rows, %d analysis updated, '
+            '%d rejects', row_count, len(results), len(rejects))
+        action = self.env.ref(
+            'olive_mill.olive_oil_analysis_import_action').read()[0]
+        action['res_id'] = self.id
+        return action
+
+    def show_analysis(self):
+        self.ensure_one()
+        action = self.env['ir.actions.act_window'].for_xml_id(
+            'olive_mill', 'olive_oil_analysis_action')
+        action['domain'] = [('id', 'in', self.analysis_ids.ids)]
+        return action
+
+
+class OliveOilAnalysisImportReject(models.TransientModel):
+    _name = 'olive.oil.analysis.import.reject'
+    _description = 'Rejected rows of the olive oil analysis import'
+    _order = 'row'
+
+    wizard_id = fields.Many2one(
+        'olive.oil.analysis.import', ondelete='cascade')
+    row = fields.Integer(string='Row', readonly=True)
+    reference = fields.Char(string='Reference', readonly=True)
+    message = fields.Char(string='Error', readonly=True)
@@ -3,11 +3,10 @@
 # @author: Alexis de Lattre <alexis.delattre@akretion.com>
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-from odoo import fields, models, _
+from odoo import api, fields, models, _
 from odoo.tools import float_compare, float_is_zero, float_round
 import odoo.addons.decimal_precision as dp
 from odoo.exceptions import UserError
-from datetime import datetime
 
 OIL_QTY_NOT_EMPTY = 0.1
 
@@ -95,6 +94,64 @@ class OliveOilBottling(models.TransientModel):
         ('produce', 'Produce'),
         ], default='select', readonly=True, string='State')
 
+    @api.model
+    def _get_inventory_qty(self, start_qty, oil_qty, end_status):
+        """Returns (inventory_required, inventory_start_qty,
+        inventory_end_qty) for the bottling of oil_qty from a tank
+        that contains start_qty"""
+        prec = self.env['decimal.precision'].precision_get('Product Unit of Measure')
+        inventory_required = 'no'
+        inventory_start_qty = inventory_end_qty = 0
+        fcompare = float_compare(start_qty, oil_qty, precision_digits=prec)
+        if fcompare < 0:
+            if end_status == 'empty':
+                inventory_required = 'yes'
+                inventory_start_qty = oil_qty
+                inventory_end_qty = 0
+            elif end_status == 'not_empty':
+                inventory_required = 'yes'
+                inventory_start_qty = oil_qty + OIL_QTY_NOT_EMPTY
+                inventory_end_qty = OIL_QTY_NOT_EMPTY
+        elif fcompare == 0:
+            if end_status == 'not_empty':
+                inventory_required = 'yes'
+                inventory_start_qty = oil_qty + OIL_QTY_NOT_EMPTY
+                inventory_end_qty = OIL_QTY_NOT_EMPTY
+        elif fcompare > 0:
+            if end_status == 'empty':
+                inventory_required = 'yes'
+                inventory_start_qty = oil_qty
+                inventory_end_qty = 0
+        return (inventory_required, inventory_start_qty, inventory_end_qty)
+
+    @api.model
+    def _tank_inventory(self, name, location, tank_lines):
+        """Create and validate one inventory for tank_lines, a list of
+        (tank, oil_product, theoretical_qty, inventory_qty)"""
+        sqo = self.env['stock.quant']
+        inv_lines = []
+        for tank, oil_product, theoretical_qty, inventory_qty in tank_lines:
+            tank_quants = sqo.search([('location_id', '=', tank.id)])
+            assert len(tank_quants) == 1
+            assert tank_quants.product_id == oil_product
+            assert tank_quants.lot_id
+            inv_lines.append((0, 0, {
+                'product_id': oil_product.id,
+                'product_uom_id': oil_product.uom_id.id,
+                'location_id': tank.id,
+                'prod_lot_id': tank_quants.lot_id.id,
+                'product_qty': inventory_qty,
+                'theoretical_qty': theoretical_qty,
+                }))
+        inventory = self.env['stock.inventory'].create({
+            'name': name,
+            'location_id': location.id,
+            'filter': 'none',
+            'line_ids': inv_lines,
+            })
+        inventory.action_done()
+        return inventory
+
     def select2qty(self):
         self.ensure_one()
         assert self.state == 'select'
@@ -124,29 +181,9 @@ class OliveOilBottling(models.TransientModel):
         # Check we have enough oil
         oil_qty = self.bottle_qty * self.bottle_volume
         src_location_end_qty = float_round(src_location_start_qty - oil_qty, precision_digits=prec)
-        inventory_required = 'no'
-        inventory_start_qty = inventory_end_qty = 0
-        fcompare = float_compare(src_location_start_qty, oil_qty, precision_digits=prec)
-        if fcompare < 0:
-            if self.src_location_end_status == 'empty':
-                inventory_required = 'yes'
-                inventory_start_qty = oil_qty
-                inventory_end_qty = 0
-            elif self.src_location_end_status == 'not_empty':
-                inventory_required = 'yes'
-                inventory_start_qty = oil_qty + OIL_QTY_NOT_EMPTY
-                inventory_end_qty = OIL_QTY_NOT_EMPTY
-        elif fcompare == 0:
-            if self.src_location_end_status == 'not_empty':
-                inventory_required = 'yes'
-                inventory_start_qty = oil_qty + OIL_QTY_NOT_EMPTY
-                inventory_end_qty = OIL_QTY_NOT_EMPTY
-        elif fcompare > 0:
-            if self.src_location_end_status == 'empty':
-                inventory_required = 'yes'
-                inventory_start_qty = oil_qty
-                inventory_end_qty = 0
-
+        inventory_required, inventory_start_qty, inventory_end_qty =\
+            self._get_inventory_qty(
+                src_location_start_qty, oil_qty, self.src_location_end_status)
         self.write({
             'state': 'produce',
             'src_location_start_qty': src_location_start_qty,
@@ -168,7 +205,6 @@ class OliveOilBottling(models.TransientModel):
         mpo = self.env['mrp.production']
         splo = self.env['stock.production.lot']
         sqo = self.env['stock.quant']
-        smo = self.env['stock.move']
         mblo = self.env['mrp.bom.line']
         oil_product = self.oil_product_id
         bottle_product = self.bottle_product_id
@@ -218,74 +254,16 @@ class OliveOilBottling(models.TransientModel):
                         qty_required, uom.name))
         # Inventory
         if self.inventory_required == 'yes':
-            tank_quants = sqo.search([('location_id', '=', self.src_location_id.id)])
-            assert len(tank_quants) == 1
-            assert tank_quants.product_id == oil_product
-            assert tank_quants.lot_id
-            oil_lot_id = tank_quants.lot_id.id
-            inv_line_vals = {
-                'product_id': oil_product.id,
-                'product_uom_id': oil_product.uom_id.id,
-                'location_id': self.src_location_id.id,
-                'prod_lot_id': oil_lot_id,
-                'product_qty': self.inventory_start_qty,
-                'theoretical_qty': src_location_start_qty,
-                }
-            inventory = self.env['stock.inventory'].create({
-                'name': _('Oil bottling %s from %s') % (self.bottle_product_id.name, self.src_location_id.name),
-                'location_id': self.src_location_id.id,
-                'product_id': oil_product.id,
-                'lot_id': oil_lot_id,
-                'filter': 'none',
-                'line_ids': [(0, 0, inv_line_vals)],
-                })
-            inventory.action_done()
+            self._tank_inventory(
+                _('Oil bottling %s from %s') % (
+                    self.bottle_product_id.name, self.src_location_id.name),
+                self.src_location_id, [(
+                    self.src_location_id, oil_product,
+                    src_location_start_qty, self.inventory_start_qty)])
             src_location_start_qty = self.src_location_id.olive_oil_tank_check()
             if float_compare(src_location_start_qty, self.inventory_start_qty, precision_digits=prec):
                 raise UserError(_(
                     "Something went wrong in the automatic inventory operation."))
-        mo = mpo.create({
-            'product_id': bottle_product.id,
-            'product_qty': self.bottle_qty,
-            'product_uom_id': bottle_product.uom_id.id,
-            'location_src_id': self.src_location_id.id,
-            'location_dest_id': self.dest_location_id.id,
-            'origin': origin,
-            'bom_id': bom.id,
-        })
-        assert mo.state == 'confirmed'
-        assert len(mo.move_raw_ids) > 0, 'Missing raw moves'
-        assert len(mo.move_finished_ids) == 1, 'Wrong finished moves'
-        assert mo.move_finished_ids[0].product_id == bottle_product, 'Wrong product on finished move'
-        oil_raw_move = smo.search([
-            ('product_id.olive_type', '=', 'oil'),
-            ('raw_material_production_id', '=', mo.id)])
-        other_raw_moves = smo.search([
-            ('product_id.olive_type', '!=', 'oil'),
-            ('raw_material_production_id', '=', mo.id)])
-        for rmove in other_raw_moves:
-            if rmove.product_id.tracking in ('lot', 'serial'):
-                raise UserError(_(
-                    "The bill of material has the component '%s' "
-                    "which is tracked by lot or serial. For the moment, "
-                    "the only supported scenario is where the only component "
-                    "of the bill of material tracked by lot is the oil.")
-                    % rmove.product_id.display_name)
-        # BOM has already been checked, so this should really never happen
-        assert len(oil_raw_move) == 1, 'Wrong number of oil raw moves'
-        # HACK change source location for other raw moves
-        other_raw_moves.write({'location_id': self.other_src_location_id.id})
-        mo.action_assign()
-        if mo.availability != 'assigned':
-            raise UserError(_(
-                "Could not reserve the raw material for this bottling operation. "
-                "Check that you have enough oil and empty bottles."))
-        for move_lot in oil_raw_move.move_lot_ids:
-            assert move_lot.lot_id
-            move_lot.quantity_done = move_lot.quantity
-        for rmove in other_raw_moves:
-            rmove.quantity_done = rmove.product_uom_qty
-        # raw lines should be green at this step
         # Create finished lot
         if self.lot_type == 'new':
             existing_lots = splo.search([
@@ -305,25 +283,10 @@ class OliveOilBottling(models.TransientModel):
             if not bottle_lot:
                 raise UserError(_(
                     'You must select an existing lot for the bottle product.'))
-        self.env['stock.move.lots'].create({
-            'move_id': mo.move_finished_ids[0].id,
-            'product_id': bottle_product.id,
-            'production_id': mo.id,
-            'quantity': self.bottle_qty,
-            'quantity_done': self.bottle_qty,
-            'lot_id': bottle_lot.id,
-            })
-        for raw_move_lot in oil_raw_move.move_lot_ids:
-            assert not raw_move_lot.lot_produced_id
-        oil_raw_move.move_lot_ids.write({'lot_produced_id': bottle_lot.id})
-        mo.write({
-            'state': 'progress',
-            'date_start': datetime.now(),
-            })
-        assert mo.post_visible is True
-        mo.post_inventory()
-        assert mo.check_to_done is True
-        mo.button_mark_done()
+        mo = mpo.olive_oil_bottling_produce(
+            bottle_product, self.bottle_qty, bom, self.src_location_id,
+            self.other_src_location_id, self.dest_location_id, bottle_lot,
+            origin)
 
         # Check oil end qty
         oil_end_qty_in_tank = self.src_location_id.olive_oil_tank_check()
@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Barroux Abbey (https://www.barroux.org/)
+# @author: Alexis de Lattre <alexis.delattre@akretion.com>
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, fields, models, _
+from odoo.tools import float_compare, float_round
+import odoo.addons.decimal_precision as dp
+from odoo.exceptions import UserError
+
+
+class OliveOilBottlingRun(models.TransientModel):
+    _name = 'olive.oil.bottling.run'
+    _description = 'Wizard to fill-up several formats of olive oil bottles'
+
+    warehouse_id = fields.Many2one(
+        'stock.warehouse', string='Warehouse',
+        domain=[('olive_mill', '=', True)], required=True,
+        default=lambda self: self.env.user._default_olive_mill_wh(),
+        readonly=True, states={'draft': [('readonly', False)]})
+    season_id = fields.Many2one(
+        'olive.season', string='Season', required=True,
+        default=lambda self: self.env.user.company_id.current_season_id.id,
+        readonly=True, states={'draft': [('readonly', False)]})
+    other_src_location_id = fields.Many2one(
+        'stock.location', string='Source Location for Empty Bottles',
+        domain=[('usage', '=', 'internal')], required=True,
+        default=lambda self: self.env.user._default_olive_mill_wh().lot_stock_id.id,
+        readonly=True, states={'draft': [('readonly', False)]})
+    dest_location_id = fields.Many2one(
+        'stock.location', string='Destination Location for Full Bottles',
+        domain=[('olive_tank_type', '=', False), ('usage', '=', 'internal')],
+        required=True,
+        default=lambda self: self.env.user._default_olive_mill_wh().lot_stock_id.id,
+        readonly=True, states={'draft': [('readonly', False)]})
+    empty_tank_ids = fields.Many2many(
+        'stock.location', string='Empty Tanks at End of Bottling',
+        domain=[('olive_tank_type', '!=', False), ('usage', '=', 'internal')],
+        readonly=True, states={'draft': [('readonly', False)]})
+    expiry_date = fields.Date(
+        string='Expiry Date',
+        default=lambda self: self.env.user.company_id.current_season_id.default_expiry_date,
+        readonly=True, states={'draft': [('readonly', False)]},
+        help="Expiry date of the new lots")
+    line_ids = fields.One2many(
+        'olive.oil.bottling.run.line', 'run_id', string='Lines',
+        readonly=True, states={'draft': [('readonly', False)]})
+    plan_ids = fields.One2many(
+        'olive.oil.bottling.run.plan', 'run_id', string='Material Plan',
+        readonly=True)
+    production_ids = fields.Many2many(
+        'mrp.production', string='Manufacturing Orders', readonly=True)
+    inventory_id = fields.Many2one(
+        'stock.inventory', string='Inventory', readonly=True)
+    state = fields.Selection([
+        ('draft', 'Draft'),
+        ('planned', 'Planned'),
+        ('done', 'Done'),
+        ], default='draft', readonly=True, string='State')
+
+    @api.onchange('warehouse_id')
+    def warehouse_id_change(self):
+        if self.warehouse_id:
+            self.other_src_location_id = self.warehouse_id.lot_stock_id
+            self.dest_location_id = self.warehouse_id.lot_stock_id
+
+    @api.onchange('season_id')
+    def season_id_change(self):
+        if self.season_id:
+            self.expiry_date = self.season_id.default_expiry_date
+
+    def _prepare_plan(self):
+        """Check the tanks once per tank and the empty bottles once per
+        product. Returns (tank_plan, component_plan, bottle2bom) where
+        tank_plan = {tank: {'oil_product': , 'start_qty': , 'oil_qty': ,
+        'inventory_required': , 'inventory_start_qty': ,
+        'inventory_end_qty': }}
+        component_plan = {product: {'required_qty': , 'available_qty': }}
+        bottle2bom = {bottle_product: (bom, oil_product, volume)}"""
+        self.ensure_one()
+        prec = self.env['decimal.precision'].precision_get('Product Unit of Measure')
+        oobo = self.env['olive.oil.bottling']
+        if not self.line_ids:
+            raise UserError(_("There are no lines to bottle."))
+        bottle2bom = {}
+        tank2lines = {}
+        component_plan = {}
+        for line in self.line_ids:
+            bottle = line.bottle_product_id
+            if line.bottle_qty <= 0:
+                raise UserError(_(
+                    "The quantity of bottles to produce must be positive "
+                    "(line '%s').") % bottle.display_name)
+            if bottle not in bottle2bom:
+                bom, oil_product, volume = bottle.oil_bottle_full_get_bom_and_oil_product()
+                assert oil_product.olive_type == 'oil'
+                bottle2bom[bottle] = (bom, oil_product, volume)
+            bom, oil_product, volume = bottle2bom[bottle]
+            for bom_line in bom.bom_line_ids:
+                if bom_line.product_id != oil_product:
+                    component = component_plan.setdefault(
+                        bom_line.product_id,
+                        {'required_qty': 0, 'available_qty': 0})
+                    component['required_qty'] += line.bottle_qty * bom_line.product_qty
+            tank2lines.setdefault(line.src_location_id, []).append(line)
+
+        tank_plan = {}
+        for tank, lines in tank2lines.items():
+            start_qty = tank.olive_oil_tank_check()
+            oil_qty = 0.0
+            for line in lines:
+                bom, oil_product, volume = bottle2bom[line.bottle_product_id]
+                tank.olive_oil_tank_compatibility_check(
+                    oil_product, self.season_id)
+                oil_qty += line.bottle_qty * volume
+            oil_qty = float_round(oil_qty, precision_digits=prec)
+            end_status = tank in self.empty_tank_ids and 'empty' or 'not_empty'
+            inventory_required, inventory_start_qty, inventory_end_qty =\
+                oobo._get_inventory_qty(start_qty, oil_qty, end_status)
+            tank_plan[tank] = {
+                'oil_product': oil_product,
+                'start_qty': start_qty,
+                'oil_qty': oil_qty,
+                'inventory_required': inventory_required,
+                'inventory_start_qty': inventory_start_qty,
+                'inventory_end_qty': inventory_end_qty,
+                }
+
+        if component_plan:
+            qrg = self.env['stock.quant'].read_group([
+                ('location_id', '=', self.other_src_location_id.id),
+                ('product_id', 'in', [p.id for p in component_plan]),
+                ('reservation_id', '=', False),
+                ], ['qty', 'product_id'], ['product_id'])
+            ppo = self.env['product.product']
+            for re in qrg:
+                product = ppo.browse(re['product_id'][0])
+                component_plan[product]['available_qty'] = re['qty'] or 0
+        return tank_plan, component_plan, bottle2bom
+
+    def dry_run(self):
+        """Compute the material plan without touching the stock"""
+        self.ensure_one()
+        tank_plan, component_plan, bottle2bom = self._prepare_plan()
+        plan_lines = [(5, 0, 0)]
+        for tank, tplan in tank_plan.items():
+            plan_lines.append((0, 0, {
+                'plan_type': 'oil',
+                'location_id': tank.id,
+                'product_id': tplan['oil_product'].id,
+                'available_qty': tplan['start_qty'],
+                'required_qty': tplan['oil_qty'],
+                'enough': True,
+                'inventory_required': tplan['inventory_required'],
+                'inventory_start_qty': tplan['inventory_start_qty'],
+                'inventory_end_qty': tplan['inventory_end_qty'],
+                }))
+        for product, cplan in component_plan.items():
+            plan_lines.append((0, 0, {
+                'plan_type': 'component',
+                'location_id': self.other_src_location_id.id,
+                'product_id': product.id,
+                'available_qty': cplan['available_qty'],
+                'required_qty': cplan['required_qty'],
+                'enough': float_compare(
+                    cplan['available_qty'], cplan['required_qty'],
+                    precision_digits=0) > 0,
+                'inventory_required': 'no',
+                }))
+        self.write({
+            'state': 'planned',
+            'plan_ids': plan_lines,
+            'line_ids': [(1, line.id, {
+                'oil_qty': line.bottle_qty * bottle2bom[line.bottle_product_id][2],
+                }) for line in self.line_ids],
+            })
+        action = self.env.ref('olive_mill.olive_oil_bottling_run_action').read()[0]
+        action['res_id'] = self.id
+        return action
+
+    def back2draft(self):
+        self.ensure_one()
+        self.write({'state': 'draft', 'plan_ids': [(5, 0, 0)]})
+        action = self.env.ref('olive_mill.olive_oil_bottling_run_action').read()[0]
+        action['res_id'] = self.id
+        return action
+
+    def _get_bottle_lots(self):
+        """Returns {line: lot}. New lots are created once
+        per (bottle product, lot name)"""
+        splo = self.env['stock.production.lot']
+        new_lines = self.line_ids.filtered(lambda x: x.lot_type == 'new')
+        res = {}
+        if new_lines:
+            if not self.expiry_date:
+                raise UserError(_("You must set the expiry date."))
+            if self.expiry_date < fields.Date.context_today(self):
+                raise UserError(_(
+                    "The expiry date should not be in the past."))
+            for line in new_lines:
+                if not line.lot_name:
+                    raise UserError(_(
+                        "Missing lot name on the line of '%s'.")
+                        % line.bottle_product_id.display_name)
+            existing_lots = splo.search([
+                ('product_id', 'in', new_lines.mapped('bottle_product_id').ids),
+                ('name', 'in', new_lines.mapped('lot_name'))])
+            existing_keys = set([
+                (lot.product_id.id, lot.name) for lot in existing_lots])
+            new_lots = {}
+            for line in new_lines:
+                key = (line.bottle_product_id.id, line.lot_name)
+                if key in existing_keys:
+                    raise UserError(_(
+                        "Lot '%s' already exists for the same product '%s'.")
+                        % (line.lot_name, line.bottle_product_id.display_name))
+                if key not in new_lots:
+                    new_lots[key] = splo.create({
+                        'product_id': line.bottle_product_id.id,
+                        'name': line.lot_name,
+                        'expiry_date': self.expiry_date,
+                        })
+                res[line] = new_lots[key]
+        for line in self.line_ids - new_lines:
+            if not line.lot_id:
+                raise UserError(_(
+                    "You must select an existing lot on the line of '%s'.")
+                    % line.bottle_product_id.display_name)
+            if line.lot_id.product_id != line.bottle_product_id:
+                raise UserError(_(
+                    "The lot '%s' is not a lot of '%s'.") % (
+                        line.lot_id.name, line.bottle_product_id.display_name))
+            res[line] = line.lot_id
+        return res
+
+    def validate(self):
+        self.ensure_one()
+        assert self.state in ('draft', 'planned')
+        prec = self.env['decimal.precision'].precision_get('Product Unit of Measure')
+        origin = _('Olive oil bottling run')
+        mpo = self.env['mrp.production']
+        # Re-compute the plan: the stock may have changed since the dry run
+        tank_plan, component_plan, bottle2bom = self._prepare_plan()
+        for product, cplan in component_plan.items():
+            if float_compare(
+                    cplan['available_qty'], cplan['required_qty'],
+                    precision_digits=0) <= 0:
+                uom = product.uom_id
+                raise UserError(_(
+                    "The stock location '%s' contains %s %s '%s' without reservation. "
+                    "This is not enough for this bottling run (%s %s required).") % (
+                        self.other_src_location_id.display_name,
+                        cplan['available_qty'], uom.name, product.name,
+                        cplan['required_qty'], uom.name))
+        line2lot = self._get_bottle_lots()
+        # One inventory for all the tanks
+        inv_tanks = [
+            tank for tank, tplan in tank_plan.items()
+            if tplan['inventory_required'] == 'yes']
+        inventory = False
+        if inv_tanks:
+            inventory = self.env['olive.oil.bottling']._tank_inventory(
+                _('Oil bottling run of %s') % fields.Date.context_today(self),
+                self.warehouse_id.view_location_id, [(
+                    tank, tank_plan[tank]['oil_product'],
+                    tank_plan[tank]['start_qty'],
+                    tank_plan[tank]['inventory_start_qty'])
+                    for tank in inv_tanks])
+            for tank in inv_tanks:
+                tplan = tank_plan[tank]
+                start_qty = tank.olive_oil_tank_check()
+                if float_compare(
+                        start_qty, tplan['inventory_start_qty'],
+                        precision_digits=prec):
+                    raise UserError(_(
+                        "Something went wrong in the automatic inventory "
+                        "operation of tank '%s'.") % tank.name)
+                tplan['start_qty'] = start_qty
+        productions = mpo
+        for line in self.line_ids:
+            bom = bottle2bom[line.bottle_product_id][0]
+            mo = mpo.olive_oil_bottling_produce(
+                line.bottle_product_id, line.bottle_qty, bom,
+                line.src_location_id, self.other_src_location_id,
+                self.dest_location_id, line2lot[line], origin)
+            line.production_id = mo.id
+            productions |= mo
+        # Check oil end qty
+        for tank, tplan in tank_plan.items():
+            end_qty = tank.olive_oil_tank_check(raise_if_empty=False)
+            if float_compare(
+                    end_qty, tplan['start_qty'] - tplan['oil_qty'],
+                    precision_digits=prec):
+                raise UserError(_(
+                    "The end quantity in tank '%s' (%s L) is wrong. "
+                    "This should never happen.") % (tank.name, end_qty))
+        self.write({
+            'state': 'done',
+            'production_ids': [(6, 0, productions.ids)],
+            'inventory_id': inventory and inventory.id or False,
+            })
+        action = self.env['ir.actions.act_window'].for_xml_id(
+            'mrp', 'mrp_production_action')
+        action.update({
+            'domain': [('id', 'in', productions.ids)],
+            'context': {},
+            })
+        return action
+
+
+class OliveOilBottlingRunLine(models.TransientModel):
+    _name = 'olive.oil.bottling.run.line'
+    _description = 'Line of the olive oil bottling run'
+
+    run_id = fields.Many2one(
+        'olive.oil.bottling.run', ondelete='cascade')
+    src_location_id = fields.Many2one(
+        'stock.location', string='Oil Tank', required=True,
+        domain=[('olive_tank_type', '!=', False), ('usage', '=', 'internal')])
+    bottle_product_id = fields.Many2one(
+        'product.product', string='Oil Bottle to Produce', required=True,
+        domain=[('olive_type', '=', 'bottle_full')])
+    bottle_qty = fields.Integer(string='Produced Bottles Qty', required=True)
+    oil_qty = fields.Float(
+        string='Oil Qty', readonly=True,
+        digits=dp.get_precision('Product Unit of Measure'))
+    lot_type = fields.Selection([
+        ('new', 'New'),
+        ('existing', 'Existing'),
+        ], string='Lot Type', default='new', required=True)
+    lot_name = fields.Char(string='Lot')
+    lot_id = fields.Many2one(
+        'stock.production.lot', string='Existing Lot')
+    production_id = fields.Many2one(
+        'mrp.production', string='Manufacturing Order', readonly=True)
+
+
+class OliveOilBottlingRunPlan(models.TransientModel):
+    _name = 'olive.oil.bottling.run.plan'
+    _description = 'Material plan of the olive oil bottling run'
+    _order = 'plan_type desc, location_id, product_id'
+
+    run_id = fields.Many2one(
+        'olive.oil.bottling.run', ondelete='cascade')
+    plan_type = fields.Selection([
+        ('oil', 'Oil'),
+        ('component', 'Component'),
+        ], string='Type', readonly=True)
+    location_id = fields.Many2one(
+        'stock.location', string='Location', readonly=True)
+    product_id = fields.Many2one(
+        'product.product', string='Product', readonly=True)
+    uom_id = fields.Many2one(
+        related='product_id.uom_id', readonly=True)
+    available_qty = fields.Float(
+        string='Available Qty', readonly=True,
+        digits=dp.get_precision('Product Unit of Measure'))
+    required_qty = fields.Float(
+        string='Required Qty', readonly=True,
+        digits=dp.get_precision('Product Unit of Measure'))
+    enough = fields.Boolean(string='Enough', readonly=True)
+    inventory_required = fields.Selection([
+        ('yes', 'Yes'),
+        ('no', 'No'),
+        ], readonly=True, string='Inventory Required')
+    inventory_start_qty = fields.Float(
+        string='Inventory Qty before Bottling',
+        digits=dp.get_precision('Product Unit of Measure'), readonly=True)
+    inventory_end_qty = fields.Float(
+        string='Inventory Qty after Bottling',
+        digits=dp.get_precision('Product Unit of Measure'), readonly=True)
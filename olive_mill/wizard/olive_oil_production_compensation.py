@@ -97,12 +97,13 @@ class OliveOilProductionCompensation(models.TransientModel):
 
     def validate(self):
         self.ensure_one()
-        pr_oli = self.env['decimal.precision'].precision_get('Olive Weight')
-        pr_ratio = self.env['decimal.precision'].precision_get('Olive Oil Ratio')
         prod = self.production_id
+        mctx = prod.company_id.olive_mill_context()
+        pr_oli = mctx.pr_oli
+        pr_ratio = mctx.pr_ratio
         ctype = self.compensation_type
         cloc = self.compensation_location_id
-        density = prod.company_id.olive_oil_density
+        density = mctx.density
         compensation_oil_qty = False
         if ctype in ('first', 'last'):
             if not cloc:
@@ -7,6 +7,7 @@ from odoo import api, fields, models, _
 import odoo.addons.decimal_precision as dp
 from odoo.tools import float_round
 from odoo.exceptions import UserError
+from ..models.olive_tracking import olive_batch_tracked
 
 
 class OliveOilProductionRatio2force(models.TransientModel):
@@ -55,12 +56,13 @@ class OliveOilProductionRatio2force(models.TransientModel):
 
     @api.depends('oil_qty_kg')
     def _compute_all(self):
-        pr_oil = self.env['decimal.precision'].precision_get(
-            'Olive Oil Volume')
-        pr_ratio = self.env['decimal.precision'].precision_get(
-            'Olive Oil Ratio')
         for wiz in self:
-            density = wiz.production_id.company_id.olive_oil_density
+            company = wiz.production_id.company_id or\
+                self.env.user.company_id
+            mctx = company.olive_mill_context()
+            pr_oil = mctx.pr_oil
+            pr_ratio = mctx.pr_ratio
+            density = mctx.density
             oil_qty = 0.0
             ratio = 0.0
             if density:
@@ -86,6 +88,7 @@ class OliveOilProductionRatio2force(models.TransientModel):
                 decanter_speed = wiz.olive_qty * 60 / wiz.decanter_duration
             wiz.decanter_speed = decanter_speed
 
+    @olive_batch_tracked
     def validate(self):
         self.ensure_one()
         prod = self.production_id
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Barroux Abbey (https://www.barroux.org/)
+# @author: Alexis de Lattre <alexis.delattre@akretion.com>
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import fields, models, _
+import odoo.addons.decimal_precision as dp
+from odoo.exceptions import UserError
+import logging
+logger = logging.getLogger(__name__)
+
+
+class OliveOilTankMergeBatch(models.TransientModel):
+    _name = 'olive.oil.tank.merge.batch'
+    _description = 'Wizard to merge all the olive oil tanks of an olive mill'
+
+    warehouse_id = fields.Many2one(
+        'stock.warehouse', string='Olive Mill', required=True,
+        domain=[('olive_mill', '=', True)],
+        default=lambda self: self.env.user._default_olive_mill_wh(),
+        readonly=True, states={'draft': [('readonly', False)]})
+    line_ids = fields.One2many(
+        'olive.oil.tank.merge.batch.line', 'wizard_id',
+        string='Tanks to Merge', readonly=True)
+    state = fields.Selection([
+        ('draft', 'Draft'),
+        ('scanned', 'Scanned'),
+        ('done', 'Done'),
+        ], default='draft', readonly=True, string='State')
+
+    def _reopen(self):
+        action = self.env.ref(
+            'olive_mill.olive_oil_tank_merge_batch_action').read()[0]
+        action['res_id'] = self.id
+        return action
+
+    def scan(self):
+        """Find the tanks which are not merged with a single grouped query"""
+        self.ensure_one()
+        tanks = self.env['stock.location'].search([
+            ('olive_tank_type', '!=', False),
+            ('usage', '=', 'internal'),
+            ('location_id', 'child_of', self.warehouse_id.view_location_id.id),
+            ])
+        lot_qty = self.env['stock.quant'].olive_lot_qty_get(tanks.ids)
+        tank2data = {}
+        for (location_id, product_id), lots in lot_qty.items():
+            data = tank2data.setdefault(
+                location_id, {'lots': set(), 'products': set(), 'qty': 0.0})
+            data['lots'].update(lots.keys())
+            data['products'].add(product_id)
+            data['qty'] += sum(lots.values())
+        lines = [(5, 0, 0)]
+        for tank in tanks.sorted(key=lambda x: x.name):
+            data = tank2data.get(tank.id)
+            if not data:
+                continue
+            to_merge = len(data['lots']) > 1
+            if (
+                    tank.olive_tank_type == 'risouletto' and
+                    data['products'] != set([tank.oil_product_id.id])):
+                to_merge = True
+            if to_merge:
+                lines.append((0, 0, {
+                    'location_id': tank.id,
+                    'lot_qty': len(data['lots']),
+                    'qty': data['qty'],
+                    }))
+        if len(lines) == 1:
+            raise UserError(_(
+                "All the olive oil tanks of '%s' are already merged.")
+                % self.warehouse_id.display_name)
+        self.write({'state': 'scanned', 'line_ids': lines})
+        return self._reopen()
+
+    def validate(self):
+        """Merge the tanks. A tank that can't be merged doesn't block
+        the others: its error is displayed in the summary"""
+        self.ensure_one()
+        assert self.state == 'scanned'
+        origin = _('Olive oil tank batch merge wizard')
+        bom_cache = {}
+        for line in self.line_ids:
+            try:
+                with self.env.cr.savepoint():
+                    mo = line.location_id.olive_oil_tank_merge(
+                        origin=origin, bom_cache=bom_cache)
+                line.write({'production_id': mo.id, 'state': 'done'})
+            except UserError as e:
+                # the savepoint was rolled back: drop the records in cache
+                self.env.invalidate_all()
+                logger.warning(
+                    'Failed to merge tank %s: %s',
+                    line.location_id.name, e.name)
+                line.write({'state': 'error', 'error_msg': e.name})
+        self.state = 'done'
+        return self._reopen()
+
+    def show_productions(self):
+        self.ensure_one()
+        action = self.env['ir.actions.act_window'].for_xml_id(
+            'mrp', 'mrp_production_action')
+        action.update({
+            'domain': [('id', 'in', self.line_ids.mapped('production_id').ids)],
+            'context': {},
+            })
+        return action
+
+
+class OliveOilTankMergeBatchLine(models.TransientModel):
+    _name = 'olive.oil.tank.merge.batch.line'
+    _description = 'Line of the olive oil tank batch merge wizard'
+
+    wizard_id = fields.Many2one(
+        'olive.oil.tank.merge.batch', ondelete='cascade')
+    location_id = fields.Many2one(
+        'stock.location', string='Olive Tank', readonly=True)
+    oil_product_id = fields.Many2one(
+        related='location_id.oil_product_id', readonly=True)
+    lot_qty = fields.Integer(string='Number of Lots', readonly=True)
+    qty = fields.Float(
+        string='Oil Qty', readonly=True,
+        digits=dp.get_precision('Olive Oil Volume'))
+    production_id = fields.Many2one(
+        'mrp.production', string='Manufacturing Order', readonly=True)
+    state = fields.Selection([
+        ('todo', 'To Merge'),
+        ('done', 'Merged'),
+        ('error', 'Error'),
+        ], default='todo', readonly=True, string='State')
+    error_msg = fields.Char(string='Error', readonly=True)
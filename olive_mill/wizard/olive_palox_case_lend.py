@@ -39,13 +39,12 @@ class OlivePaloxCaseLend(models.TransientModel):
             palox = self.env['olive.palox'].search([('borrower_partner_id', '=', res['partner_id']), ('borrowed_date', '!=', False)])
             if palox:
                 res['return_palox_ids'] = palox.ids
-            cases_res = self.env['olive.lended.case'].read_group([
-                ('company_id', '=', self.env.user.company_id.id),
-                ('partner_id', '=', res['partner_id'])],
-                ['regular_qty', 'organic_qty'], [])
-            if cases_res:
-                res['regular_case_qty'] = cases_res[0]['regular_qty'] or 0
-                res['organic_case_qty'] = cases_res[0]['organic_qty'] or 0
+            balance = self.env['olive.lended.balance'].get_balances(
+                self.env.user.company_id.id, [res['partner_id']]).get(
+                res['partner_id'])
+            if balance:
+                res['regular_case_qty'] = balance['regular_qty']
+                res['organic_case_qty'] = balance['organic_qty']
         return res
 
     def validate(self):
@@ -5,6 +5,7 @@
 
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
+from ..models.olive_tracking import olive_batch_tracked
 
 
 class OlivePaloxGenerateProduction(models.TransientModel):
@@ -26,11 +27,13 @@ class OlivePaloxGenerateProduction(models.TransientModel):
         res['palox_ids'] = self.env.context.get('active_ids')
         return res
 
+    @olive_batch_tracked
     def generate(self):
         self.ensure_one()
         if not self.palox_ids:
             raise UserError(_("No palox selected."))
         oopo = self.env['olive.oil.production']
+        vals_list = []
         for palox in self.palox_ids:
             if not palox.oil_product_id:
                 raise UserError(_(
@@ -40,8 +43,9 @@ class OlivePaloxGenerateProduction(models.TransientModel):
                 'palox_id': palox.id,
                 'warehouse_id': self.warehouse_id.id,
                 }
-            vals = oopo.play_onchanges(vals, ['palox_id', 'warehouse_id'])
-            prod = oopo.create(vals)
+            vals_list.append(
+                oopo.play_onchanges(vals, ['palox_id', 'warehouse_id']))
+        for prod in oopo.olive_create_multi(vals_list):
             prod.draft2ratio()
         action = self.env['ir.actions.act_window'].for_xml_id(
             'olive_mill', 'olive_oil_production_action')
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Barroux Abbey (https://www.barroux.org/)
+# @author: Alexis de Lattre <alexis.delattre@akretion.com>
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, fields, models, _
+import odoo.addons.decimal_precision as dp
+from odoo.exceptions import UserError
+from dateutil.relativedelta import relativedelta
+import math
+
+
+class OliveSeasonForecast(models.TransientModel):
+    _name = 'olive.season.forecast'
+    _description = 'Forecast of arrivals, palox and tanks for a season'
+
+    @api.model
+    def _default_season(self):
+        if (
+                self._context.get('active_model') == 'olive.season' and
+                self._context.get('active_id')):
+            return self._context['active_id']
+        return self.env.user.company_id.current_season_id.id
+
+    season_id = fields.Many2one(
+        'olive.season', string='Season', required=True,
+        default=_default_season)
+    qty_per_palox = fields.Integer(
+        string='Olive Qty per Palox (kg)', required=True,
+        default=lambda self:
+        self.env.user.company_id.olive_appointment_qty_per_palox or
+        self.env.user.company_id.olive_max_qty_per_palox)
+    past_season_ids = fields.Many2many(
+        'olive.season', string='Past Seasons used for the Daily Profile',
+        readonly=True)
+    line_ids = fields.One2many(
+        'olive.season.forecast.line', 'wizard_id', string='Forecast',
+        readonly=True)
+    state = fields.Selection([
+        ('draft', 'Draft'),
+        ('done', 'Done'),
+        ], default='draft', readonly=True)
+
+    _sql_constraints = [(
+        'qty_per_palox_positive',
+        'CHECK(qty_per_palox > 0)',
+        'The olive qty per palox must be strictly positive.')]
+
+    def _get_daily_profile(self, past_seasons):
+        '''Returns {day offset from season start: share of the season
+        arrivals}, computed on the arrivals of past_seasons'''
+        self._cr.execute("""
+            SELECT oal.arrival_date - os.start_date, SUM(oal.olive_qty)
+            FROM olive_arrival_line oal
+            JOIN olive_season os ON os.id = oal.season_id
+            WHERE oal.season_id = ANY(%s)
+            AND oal.arrival_state = 'done'
+            GROUP BY 1
+            """, (past_seasons.ids, ))
+        offset2qty = dict(self._cr.fetchall())
+        total = sum(offset2qty.values())
+        if not total:
+            return {}
+        return dict([
+            (offset, qty / total) for (offset, qty) in offset2qty.items()])
+
+    def run(self):
+        self.ensure_one()
+        season = self.season_id
+        ofl = self.env['olive.season.forecast.line']
+        past_seasons = self.env['olive.season'].search([
+            ('company_id', '=', season.company_id.id),
+            ('start_date', '<', season.start_date),
+            ], order='start_date desc', limit=3)
+        profile = self._get_daily_profile(past_seasons)
+        if not profile:
+            raise UserError(_(
+                "There are no arrivals in the past seasons, so it is not "
+                "possible to compute the daily arrival profile."))
+        rg = self.env['olive.preseason.poll.line'].read_group(
+            [('season_id', '=', season.id)],
+            ['olive_qty', 'oil_qty', 'sale_oil_qty', 'oil_product_id'],
+            ['oil_product_id'])
+        if not rg:
+            raise UserError(_(
+                "There are no pre-season polls for season '%s'.")
+                % season.name)
+        self.line_ids.unlink()
+        start_date_dt = fields.Date.from_string(season.start_date)
+        end_date_dt = fields.Date.from_string(season.end_date)
+        for re in rg:
+            oil_product_id = re['oil_product_id'] and re['oil_product_id'][0]
+            cumul_sale_oil_qty = 0.0
+            for offset in sorted(profile.keys()):
+                date_dt = start_date_dt + relativedelta(days=offset)
+                if date_dt > end_date_dt:
+                    break
+                share = profile[offset]
+                olive_qty = re['olive_qty'] * share
+                cumul_sale_oil_qty += re['sale_oil_qty'] * share
+                ofl.create({
+                    'wizard_id': self.id,
+                    'date': fields.Date.to_string(date_dt),
+                    'oil_product_id': oil_product_id,
+                    'olive_qty': olive_qty,
+                    'palox_qty': int(
+                        math.ceil(olive_qty / self.qty_per_palox)),
+                    'oil_qty': re['oil_qty'] * share,
+                    'sale_tank_oil_qty': cumul_sale_oil_qty,
+                    })
+        self.write({
+            'state': 'done',
+            'past_season_ids': [(6, 0, past_seasons.ids)],
+            })
+        action = self.env.ref(
+            'olive_mill.olive_season_forecast_action').read()[0]
+        action['res_id'] = self.id
+        return action
+
+
+class OliveSeasonForecastLine(models.TransientModel):
+    _name = 'olive.season.forecast.line'
+    _description = 'Season Forecast Line'
+    _order = 'date, oil_product_id'
+
+    wizard_id = fields.Many2one('olive.season.forecast', ondelete='cascade')
+    date = fields.Date(string='Date', readonly=True)
+    oil_product_id = fields.Many2one(
+        'product.product', string='Oil Type', readonly=True)
+    olive_qty = fields.Float(
+        string='Expected Olive Arrivals (kg)',
+        digits=dp.get_precision('Olive Weight'), readonly=True)
+    palox_qty = fields.Integer(string='Palox Needed', readonly=True)
+    oil_qty = fields.Float(
+        string='Expected Oil (L)',
+        digits=dp.get_precision('Olive Oil Volume'), readonly=True)
+    sale_tank_oil_qty = fields.Float(
+        string='Oil in Sale Tanks (L)',
+        digits=dp.get_precision('Olive Oil Volume'), readonly=True,
+        help="Cumulated sale oil quantity since the start of the season.")
@@ -3,7 +3,7 @@
 # @author: Alexis de Lattre <alexis.delattre@akretion.com>
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-from odoo import fields, models, _
+from odoo import api, fields, models, _
 from odoo.exceptions import UserError
 
 
@@ -29,38 +29,28 @@ class OliveWithdrawal(models.TransientModel):
         'stock.warehouse', string='Olive Mill', required=True,
         default=lambda self: self.env.user._default_olive_mill_wh())
 
-    def _prepare_picking(self):
-        src_loc = self.warehouse_id.olive_withdrawal_loc_id
-        commercial_partner = self.partner_id.commercial_partner_id
-        quants_group_product = self.env['stock.quant'].read_group([
-            ('location_id', '=', src_loc.id),
-            ('reservation_id', '=', False),
-            ('owner_id', '=', commercial_partner.id),
-            ], ['product_id', 'qty'], ['product_id'])
-        if not quants_group_product:
-            raise UserError(_(
-                "There are no unreserved quants on the stock location '%s' "
-                "owned by '%s'") % (
-                    src_loc.display_name,
-                    commercial_partner.display_name))
+    @api.model
+    def _prepare_withdrawal_picking(
+            self, warehouse, partner, quants_group_product):
+        """quants_group_product is a list of (product, qty)"""
+        src_loc = warehouse.olive_withdrawal_loc_id
+        commercial_partner = partner.commercial_partner_id
         moves = []
-        for quant_gp in quants_group_product:
-            product_id = quant_gp['product_id'][0]
-            product = self.env['product.product'].browse(product_id)
+        for product, qty in quants_group_product:
             mvals = {
                 'name': _('Withdrawal of Olive Oil'),
-                'product_id': product_id,
+                'product_id': product.id,
                 'location_id': src_loc.id,
-                'location_dest_id': self.partner_id.property_stock_customer.id,
+                'location_dest_id': partner.property_stock_customer.id,
                 'product_uom': product.uom_id.id,
-                'product_uom_qty': quant_gp['qty'],
+                'product_uom_qty': qty,
                 'origin': _('Olive Withdrawal Wizard'),
                 'restrict_partner_id': commercial_partner.id,
                 }
             moves.append((0, 0, mvals))
         vals = {
-            'partner_id': self.partner_id.id,
-            'picking_type_id': self.warehouse_id.out_type_id.id,
+            'partner_id': partner.id,
+            'picking_type_id': warehouse.out_type_id.id,
             'move_lines': moves,
             'origin': _('Olive Withdrawal Wizard'),
             'location_id': src_loc.id,
@@ -68,6 +58,26 @@ class OliveWithdrawal(models.TransientModel):
             }
         return vals
 
+    def _prepare_picking(self):
+        src_loc = self.warehouse_id.olive_withdrawal_loc_id
+        commercial_partner = self.partner_id.commercial_partner_id
+        quants_group_product = self.env['stock.quant'].read_group([
+            ('location_id', '=', src_loc.id),
+            ('reservation_id', '=', False),
+            ('owner_id', '=', commercial_partner.id),
+            ], ['product_id', 'qty'], ['product_id'])
+        if not quants_group_product:
+            raise UserError(_(
+                "There are no unreserved quants on the stock location '%s' "
+                "owned by '%s'") % (
+                    src_loc.display_name,
+                    commercial_partner.display_name))
+        ppo = self.env['product.product']
+        return self._prepare_withdrawal_picking(
+            self.warehouse_id, self.partner_id, [
+                (ppo.browse(quant_gp['product_id'][0]), quant_gp['qty'])
+                for quant_gp in quants_group_product])
+
     def validate(self):
         self.ensure_one()
         if not self.warehouse_id.olive_withdrawal_loc_id:
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Barroux Abbey (https://www.barroux.org/)
+# @author: Alexis de Lattre <alexis.delattre@akretion.com>
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import fields, models, _
+import odoo.addons.decimal_precision as dp
+from odoo.exceptions import UserError
+
+
+class OliveWithdrawalBatch(models.TransientModel):
+    _name = 'olive.withdrawal.batch'
+    _description = 'Wizard to withdraw the olive oil of several farmers'
+
+    source = fields.Selection([
+        ('appointment', 'Withdrawal Appointments of the Day'),
+        ('partner', 'List of Farmers'),
+        ('to_withdraw', 'All Farmers with Oil to Withdraw'),
+        ], string='Farmers', default='appointment', required=True)
+    date = fields.Date(string='Date', default=fields.Date.context_today)
+    partner_ids = fields.Many2many(
+        'res.partner', string='Olive Farmers',
+        domain=[('olive_farmer', '=', True), ('parent_id', '=', False)])
+    warehouse_id = fields.Many2one(
+        'stock.warehouse', string='Olive Mill', required=True,
+        default=lambda self: self.env.user._default_olive_mill_wh())
+    line_ids = fields.One2many(
+        'olive.withdrawal.batch.line', 'wizard_id', string='Pick List',
+        readonly=True)
+    picking_ids = fields.Many2many(
+        'stock.picking', string='Pickings', readonly=True)
+    no_oil_partner_ids = fields.Many2many(
+        'res.partner', 'olive_withdrawal_batch_no_oil_partner_rel',
+        'wizard_id', 'partner_id', string='Farmers without Oil to Withdraw',
+        readonly=True)
+    state = fields.Selection([
+        ('draft', 'Draft'),
+        ('done', 'Done'),
+        ], default='draft', readonly=True)
+
+    def _get_partners(self):
+        if self.source == 'appointment':
+            if not self.date:
+                raise UserError(_("You must set the date."))
+            appointments = self.env['olive.appointment'].search([
+                ('date', '=', self.date),
+                ('appointment_type', '=', 'withdrawal'),
+                ('company_id', '=', self.warehouse_id.company_id.id),
+                ])
+            partners = appointments.mapped('commercial_partner_id')
+            if not partners:
+                raise UserError(_(
+                    "There are no withdrawal appointments on %s.")
+                    % self.date)
+        elif self.source == 'to_withdraw':
+            partners = self.env['res.partner'].browse(list(self.env[
+                'olive.oil.withdrawal.balance'].get_qty_to_withdraw(
+                location_ids=[self.warehouse_id.olive_withdrawal_loc_id.id])))
+            if not partners:
+                raise UserError(_(
+                    "There are no olive farmers with oil to withdraw."))
+        else:
+            partners = self.partner_ids.mapped('commercial_partner_id')
+            if not partners:
+                raise UserError(_("You must select olive farmers."))
+        return partners
+
+    def validate(self):
+        self.ensure_one()
+        wh = self.warehouse_id
+        src_loc = wh.olive_withdrawal_loc_id
+        if not src_loc:
+            raise UserError(_(
+                "Missing Olive Oil Withdrawal Location on "
+                "warehouse '%s'") % wh.display_name)
+        owo = self.env['olive.withdrawal']
+        ppo = self.env['product.product']
+        partners = self._get_partners()
+        # One read_group for the unreserved quants of all the farmers
+        rg = self.env['stock.quant'].read_group([
+            ('location_id', '=', src_loc.id),
+            ('reservation_id', '=', False),
+            ('owner_id', 'in', partners.ids),
+            ], ['owner_id', 'product_id', 'qty'], ['owner_id', 'product_id'],
+            lazy=False)
+        partner2products = {}
+        for re in rg:
+            partner2products.setdefault(re['owner_id'][0], []).append(
+                (ppo.browse(re['product_id'][0]), re['qty']))
+        pickings = self.env['stock.picking']
+        line_vals = []
+        for partner in partners.sorted(key=lambda p: p.name):
+            products = partner2products.get(partner.id)
+            if not products:
+                continue
+            pick = pickings.create(owo._prepare_withdrawal_picking(
+                wh, partner, products))
+            pickings |= pick
+            for product, qty in products:
+                line_vals.append((0, 0, {
+                    'partner_id': partner.id,
+                    'product_id': product.id,
+                    'qty': qty,
+                    'picking_id': pick.id,
+                    }))
+        if not pickings:
+            raise UserError(_(
+                "There are no unreserved quants on the stock location '%s' "
+                "owned by the selected farmers.") % src_loc.display_name)
+        pickings.action_confirm()
+        pickings.action_assign()
+        self.write({
+            'state': 'done',
+            'line_ids': line_vals,
+            'picking_ids': [(6, 0, pickings.ids)],
+            'no_oil_partner_ids': [(6, 0, [
+                pid for pid in partners.ids
+                if pid not in partner2products])],
+            })
+        action = self.env.ref(
+            'olive_mill.olive_withdrawal_batch_action').read()[0]
+        action['res_id'] = self.id
+        return action
+
+    def show_pickings(self):
+        self.ensure_one()
+        action = self.env['ir.actions.act_window'].for_xml_id(
+            'stock', 'action_picking_tree_all')
+        action['domain'] = [('id', 'in', self.picking_ids.ids)]
+        return action
+
+
+class OliveWithdrawalBatchLine(models.TransientModel):
+    _name = 'olive.withdrawal.batch.line'
+    _description = 'Pick List of the Olive Oil Withdrawal'
+    _order = 'partner_id, product_id'
+
+    wizard_id = fields.Many2one('olive.withdrawal.batch', ondelete='cascade')
+    partner_id = fields.Many2one(
+        'res.partner', string='Olive Farmer', readonly=True)
+    product_id = fields.Many2one(
+        'product.product', string='Product', readonly=True)
+    qty = fields.Float(
+        string='Quantity', readonly=True,
+        digits=dp.get_precision('Product Unit of Measure'))
+    uom_id = fields.Many2one(
+        related='product_id.uom_id', readonly=True)
+    picking_id = fields.Many2one(
+        'stock.picking', string='Picking', readonly=True)
+    picking_state = fields.Selection(
+        related='picking_id.state', readonly=True, string='Picking Status')
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Barroux Abbey (https://www.barroux.org/)
+# @author: Alexis de Lattre <alexis.delattre@akretion.com>
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+{
+    'name': 'Olive Mill Benchmark',
+    'version': '10.0.1.0.0',
+    'category': 'Manufacturing',
+    'license': 'AGPL-3',
+    'summary': 'Benchmark the olive mill workflows on a synthetic season',
+    'author': 'Akretion,Barroux Abbey',
+    'website': 'https://github.com/akretion/vertical-olive-mill',
+    'depends': [
+        'l10n_fr_olive_mill',
+        ],
+    'data': [
+        'wizard/olive_benchmark_view.xml',
+    ],
+    'installable': True,
+}
@@ -0,0 +1,546 @@
+# -*- coding: utf-8 -*-
+# Copyright 2019 Barroux Abbey (https://www.barroux.org/)
+# @author: Alexis de Lattre <alexis.delattre@akretion.com>
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+from contextlib import contextmanager
+from datetime import timedelta
+import base64
+import json
+import math
+import random
+import time
+import logging
+logger = logging.getLogger(__name__)
+
+PARTNER_LIST_FIELDS = [
+    'display_name', 'olive_culture_type', 'olive_lended_palox',
+    'olive_qty_current_season', 'olive_oil_qty_current_season',
+    'olive_oil_qty_to_withdraw', 'olive_invoicing_ko']
+# the number of queries of name_get() must not depend on the size of the list
+NAME_GET_MODELS = [
+    'olive.arrival.line', 'stock.location', 'stock.production.lot',
+    'olive.palox']
+NAME_GET_SIZES = [10, 100, 1000]
+# volumes (L) of the bottle formats generated for the bottling runs
+BOTTLE_VOLUMES = [0.5, 1.0]
+
+
+class OliveBenchmark(models.TransientModel):
+    """Generates a synthetic season (farmers, ochards, palox, sale tanks,
+    arrivals, productions and bottlings) and measures the duration and the number of
+    SQL queries of the main olive mill workflows. The results are stored
+    as a JSON attachment, so that the runs can be compared from one release
+    to another. It can also be started from an Odoo shell:
+    env['olive.benchmark'].create({'arrival_per_day': 50}).run()
+    By default, the synthetic data is removed at the end of the run."""
+    _name = 'olive.benchmark'
+    _description = 'Olive Mill Benchmark'
+
+    @api.model
+    def _default_oil_product(self):
+        return self.env.ref('olive_mill.oil', raise_if_not_found=False)
+
+    oil_product_id = fields.Many2one(
+        'product.product', string='Oil Type', required=True,
+        domain=[
+            ('olive_type', '=', 'oil'),
+            ('olive_culture_type', '=', 'regular')],
+        default=_default_oil_product)
+    farmer_qty = fields.Integer(string='Farmers', default=50, required=True)
+    ochard_per_farmer = fields.Integer(
+        string='Ochards per Farmer', default=2, required=True)
+    palox_qty = fields.Integer(string='Palox', default=40, required=True)
+    tank_qty = fields.Integer(string='Sale Tanks', default=4, required=True)
+    day_qty = fields.Integer(string='Days', default=10, required=True)
+    arrival_per_day = fields.Integer(
+        string='Arrivals per Day', default=20, required=True)
+    line_per_arrival = fields.Integer(
+        string='Lines per Arrival', default=2, required=True)
+    line_per_palox = fields.Integer(
+        string='Arrival Lines per Palox', default=4, required=True)
+    bottling_qty = fields.Integer(
+        string='Bottling Runs', default=5, required=True,
+        help="Each bottling run fills the bottles of all the generated "
+        "formats with half of the oil left in a sale tank.")
+    invoice_qty = fields.Integer(
+        string='Farmers to Invoice', default=20, required=True)
+    seed = fields.Integer(string='Random Seed', default=42)
+    keep_data = fields.Boolean(
+        string='Keep Synthetic Data',
+        help="If disabled, all the data generated by the benchmark is "
+        "removed at the end of the run.")
+    result = fields.Text(string='Result', readonly=True)
+    attachment_id = fields.Many2one(
+        'ir.attachment', string='Result Attachment', readonly=True)
+    result_file = fields.Binary(
+        related='attachment_id.datas', string='Result File', readonly=True)
+    result_filename = fields.Char(
+        related='attachment_id.datas_fname', readonly=True)
+    state = fields.Selection([
+        ('draft', 'Draft'),
+        ('done', 'Done'),
+        ], default='draft', readonly=True)
+
+    _sql_constraints = [(
+        'farmer_qty_positive',
+        'CHECK(farmer_qty > 0)',
+        'The number of farmers must be strictly positive.'), (
+        'palox_qty_positive',
+        'CHECK(palox_qty > 0)',
+        'The number of palox must be strictly positive.'), (
+        'tank_qty_positive',
+        'CHECK(tank_qty > 0)',
+        'The number of sale tanks must be strictly positive.'), (
+        'line_per_palox_positive',
+        'CHECK(line_per_palox > 0)',
+        'The number of arrival lines per palox must be strictly positive.'), (
+        'bottling_qty_positive',
+        'CHECK(bottling_qty >= 0)',
+        'The number of bottling runs must be positive or null.')]
+
+    @contextmanager
+    def _measure(self, stats, key):
+        cr = self._cr
+        start_count = cr.sql_log_count
+        start = time.time()
+        yield
+        stat = stats.setdefault(key, {'durations': [], 'queries': 0})
+        stat['durations'].append(time.time() - start)
+        stat['queries'] += cr.sql_log_count - start_count
+
+    @api.model
+    def _summarize(self, stats):
+        res = {}
+        for key, stat in stats.items():
+            durations = sorted(stat['durations'])
+            calls = len(durations)
+            total = sum(durations)
+            res[key] = {
+                'calls': calls,
+                'total_s': round(total, 3),
+                'mean_ms': round(1000 * total / calls, 2),
+                'median_ms': round(1000 * durations[calls // 2], 2),
+                'p95_ms': round(
+                    1000 * durations[int(math.ceil(0.95 * calls)) - 1], 2),
+                'max_ms': round(1000 * durations[-1], 2),
+                'queries': stat['queries'],
+                'queries_per_call': round(stat['queries'] * 1.0 / calls, 1),
+                }
+        return res
+
+    def _check_config(self, mctx):
+        if not mctx.warehouse:
+            raise UserError(_(
+                "There is no olive mill warehouse in company '%s'.")
+                % mctx.company.display_name)
+        if not mctx.warehouse.olive_withdrawal_loc_id:
+            raise UserError(_(
+                "Missing withdrawal location on warehouse '%s'.")
+                % mctx.warehouse.display_name)
+        if not mctx.season:
+            raise UserError(_(
+                "There is no current season in company '%s'.")
+                % mctx.company.display_name)
+        if not self.oil_product_id.shrinkage_prodlot_id:
+            raise UserError(_(
+                "Missing shrinkage production lot on product '%s'.")
+                % self.oil_product_id.display_name)
+        palox_per_day = int(math.ceil(
+            self.arrival_per_day * self.line_per_arrival * 1.0 /
+            self.line_per_palox))
+        if palox_per_day > self.palox_qty:
+            raise UserError(_(
+                "With %d arrivals per day and %d lines per arrival, "
+                "the benchmark needs %d palox per day, but it is configured "
+                "with %d palox.") % (
+                    self.arrival_per_day, self.line_per_arrival,
+                    palox_per_day, self.palox_qty))
+        if self.bottling_qty:
+            # raises when the merge BOM of the oil product is not valid
+            self.oil_product_id.oil_merge_get_bom()
+
+    def _generate_masterdata(self, mctx):
+        company = mctx.company
+        wh = mctx.warehouse
+        oil_product = self.oil_product_id
+        slo = self.env['stock.location']
+        pricelist = self.env['olive.sale.pricelist'].search(
+            [('company_id', '=', company.id)], limit=1)
+        fiscal_position = self.env['account.fiscal.position'].search(
+            [('company_id', '=', company.id)], limit=1)
+        farmers = []
+        for i in range(self.farmer_qty):
+            farmer = self.env['res.partner'].create({
+                'name': u'Benchmark Farmer %04d' % (i + 1),
+                'olive_farmer': True,
+                'customer': True,
+                'supplier': True,
+                'olive_sale_pricelist_id': pricelist.id or False,
+                'property_account_position_id': fiscal_position.id or False,
+                })
+            ochards = self.env['olive.ochard']
+            for j in range(self.ochard_per_farmer):
+                ochards |= ochards.create({
+                    'name': u'%s Ochard %d' % (farmer.name, j + 1),
+                    'partner_id': farmer.id,
+                    })
+            farmers.append((farmer, ochards))
+        paloxes = self.env['olive.palox']
+        for i in range(self.palox_qty):
+            paloxes |= paloxes.create({
+                'name': u'BENCH%04d' % (i + 1),
+                'company_id': company.id,
+                })
+        tanks = slo
+        for i in range(self.tank_qty):
+            tanks |= slo.create({
+                'name': u'Benchmark Tank %d' % (i + 1),
+                'usage': 'internal',
+                'olive_tank_type': 'regular',
+                'oil_product_id': oil_product.id,
+                'olive_season_id': mctx.season.id,
+                'location_id': wh.lot_stock_id.id,
+                })
+        if not wh.olive_get_shrinkage_tank(
+                oil_product, raise_if_not_found=False):
+            slo.create({
+                'name': u'Benchmark Shrinkage Tank',
+                'usage': 'internal',
+                'olive_tank_type': 'shrinkage',
+                'oil_product_id': oil_product.id,
+                'olive_shrinkage_oil_product_ids': [(6, 0, [oil_product.id])],
+                'location_id': wh.lot_stock_id.id,
+                })
+        variants = self.env['olive.variant'].search([])
+        if not variants:
+            variants = variants.create({'name': u'Benchmark Variant'})
+        return farmers, paloxes, tanks, variants
+
+    def _generate_bottles(self, mctx, empty_bottle_qty):
+        """Creates one full bottle product per format of BOTTLE_VOLUMES with
+        its BOM, and puts empty_bottle_qty empty bottles of each format
+        in the stock of the mill. Returns the full bottle products"""
+        ppo = self.env['product.product']
+        liter_uom = self.env.ref('product.product_uom_litre')
+        stock_loc = mctx.warehouse.lot_stock_id
+        full_bottles = ppo
+        inv_lines = []
+        for volume in BOTTLE_VOLUMES:
+            empty_bottle = ppo.create({
+                'name': u'Benchmark Empty Bottle %sL' % volume,
+                'olive_type': 'bottle',
+                'type': 'product',
+                })
+            full_bottle = ppo.create({
+                'name': u'Benchmark Oil Bottle %sL' % volume,
+                'olive_type': 'bottle_full',
+                'type': 'product',
+                'tracking': 'lot',
+                })
+            self.env['mrp.bom'].create({
+                'product_tmpl_id': full_bottle.product_tmpl_id.id,
+                'product_qty': 1,
+                'product_uom_id': full_bottle.uom_id.id,
+                'type': 'normal',
+                'bom_line_ids': [
+                    (0, 0, {
+                        'product_id': self.oil_product_id.id,
+                        'product_qty': volume,
+                        'product_uom_id': liter_uom.id,
+                        }),
+                    (0, 0, {
+                        'product_id': empty_bottle.id,
+                        'product_qty': 1,
+                        'product_uom_id': empty_bottle.uom_id.id,
+                        }),
+                    ],
+                })
+            inv_lines.append((0, 0, {
+                'product_id': empty_bottle.id,
+                'product_uom_id': empty_bottle.uom_id.id,
+                'location_id': stock_loc.id,
+                'product_qty': empty_bottle_qty,
+                }))
+            full_bottles |= full_bottle
+        inventory = self.env['stock.inventory'].create({
+            'name': u'Benchmark Empty Bottles',
+            'location_id': stock_loc.id,
+            'filter': 'none',
+            'line_ids': inv_lines,
+            })
+        inventory.action_done()
+        return full_bottles
+
+    def _simulate_bottlings(self, mctx, stats, tanks):
+        """Runs bottling_qty bottling runs on the sale tanks that contain
+        oil, in turn. Each run bottles half of the oil left in the tank,
+        after merging its lots. Returns the number of bottling runs"""
+        sqo = self.env['stock.quant']
+        tank2qty = {}
+        for tank in tanks:
+            qty = tank.olive_oil_tank_check(
+                raise_if_not_merged=False, raise_if_empty=False)
+            if qty > 0:
+                tank2qty[tank] = qty
+        if not tank2qty:
+            logger.warning(
+                'Olive mill benchmark: no oil in the sale tanks, '
+                'no bottling')
+            return 0
+        # each run takes at most half of the oil left in the tank
+        empty_bottle_qty = int(
+            sum(tank2qty.values()) / sum(BOTTLE_VOLUMES)) + 1
+        full_bottles = self._generate_bottles(mctx, empty_bottle_qty)
+        full_tanks = tanks.filtered(lambda t: t in tank2qty)
+        expiry_date = fields.Date.to_string(
+            fields.Date.from_string(fields.Date.context_today(self)) +
+            timedelta(days=730))
+        bom_cache = {}
+        bottling_count = 0
+        for i in range(self.bottling_qty):
+            tank = full_tanks[i % len(full_tanks)]
+            lot_qty = sqo.olive_lot_qty_get([tank.id])
+            if sum([len(lots) for lots in lot_qty.values()]) > 1:
+                with self._measure(stats, 'tank_merge'):
+                    tank.olive_oil_tank_merge(bom_cache=bom_cache)
+            oil_qty = tank.olive_oil_tank_check()
+            bottle_qty = int(oil_qty / 2.0 / sum(BOTTLE_VOLUMES))
+            if bottle_qty < 1:
+                continue
+            run = self.env['olive.oil.bottling.run'].create({
+                'warehouse_id': mctx.warehouse.id,
+                'season_id': mctx.season.id,
+                'other_src_location_id': mctx.warehouse.lot_stock_id.id,
+                'dest_location_id': mctx.warehouse.lot_stock_id.id,
+                'expiry_date': expiry_date,
+                'line_ids': [(0, 0, {
+                    'src_location_id': tank.id,
+                    'bottle_product_id': bottle.id,
+                    'bottle_qty': bottle_qty,
+                    'lot_type': 'new',
+                    'lot_name': u'BENCH%04d' % (i + 1),
+                    }) for bottle in full_bottles],
+                })
+            with self._measure(stats, 'bottling_run_validate'):
+                run.validate()
+            bottling_count += 1
+        return bottling_count
+
+    def _simulate_day(
+            self, mctx, rand, stats, date, farmers, paloxes, tanks,
+            variants):
+        oao = self.env['olive.arrival']
+        oopo = self.env['olive.oil.production']
+        wh = mctx.warehouse
+        olive_qty_max = mctx.company.olive_max_qty_per_palox * 1.0 /\
+            self.line_per_palox
+        palox_index = 0
+        palox_line_count = 0
+        palox2dest = {}
+        for i in range(self.arrival_per_day):
+            farmer, ochards = rand.choice(farmers)
+            line_vals = []
+            for j in range(self.line_per_arrival):
+                if palox_line_count == self.line_per_palox:
+                    palox_index += 1
+                    palox_line_count = 0
+                palox = paloxes[palox_index]
+                palox_line_count += 1
+                if palox not in palox2dest:
+                    palox2dest[palox] = rand.choice(['withdrawal', 'sale'])
+                line_vals.append((0, 0, {
+                    'variant_id': rand.choice(variants).id,
+                    'ochard_id': rand.choice(ochards).id,
+                    'palox_id': palox.id,
+                    'olive_qty': int(rand.uniform(0.5, 1) * olive_qty_max),
+                    'oil_destination': palox2dest[palox],
+                    'oil_product_id': self.oil_product_id.id,
+                    'ripeness': 'optimal',
+                    'sanitary_state': 'good',
+                    }))
+            arrival = oao.create({
+                'partner_id': farmer.id,
+                'warehouse_id': wh.id,
+                'season_id': mctx.season.id,
+                'date': date,
+                'harvest_start_date': date,
+                'line_ids': line_vals,
+                })
+            with self._measure(stats, 'arrival_validate'):
+                arrival.with_context(olive_no_warning=True).validate()
+        # press all the palox filled during the day
+        min_ratio, max_ratio = mctx.min_ratio, mctx.max_ratio
+        margin = (max_ratio - min_ratio) / 4.0
+        productions = oopo
+        for palox, oil_destination in palox2dest.items():
+            prod = oopo.create({
+                'palox_id': palox.id,
+                'warehouse_id': wh.id,
+                'season_id': mctx.season.id,
+                'date': date,
+                'withdrawal_location_id': wh.olive_withdrawal_loc_id.id,
+                'compensation_type': 'none',
+                })
+            with self._measure(stats, 'production_draft2ratio'):
+                prod.draft2ratio()
+            prod.start_ratio2force()
+            ratio = rand.uniform(min_ratio + margin, max_ratio - margin)
+            oil_qty = prod.olive_qty * ratio / 100.0
+            wiz = self.env['olive.oil.production.ratio2force'].create({
+                'production_id': prod.id,
+                'oil_qty_kg': mctx.olive_oil_liter2kg(oil_qty),
+                'sale_location_id':
+                oil_destination == 'sale' and rand.choice(tanks).id or False,
+                })
+            # ratio2force() calls set_qty_on_lines()
+            with self._measure(stats, 'production_set_qty_on_lines'):
+                wiz.validate()
+            if prod.state == 'force':
+                prod.force2pack()
+            if prod.state == 'pack':
+                prod.pack2check()
+            with self._measure(stats, 'production_check2done'):
+                prod.check2done()
+            productions |= prod
+        return productions
+
+    def _run_benchmark(self, stats):
+        mctx = self.env.user.company_id.olive_mill_context()
+        self._check_config(mctx)
+        rand = random.Random(self.seed)
+        farmers, paloxes, tanks, variants = self._generate_masterdata(mctx)
+        today_dt = fields.Date.from_string(fields.Date.context_today(self))
+        start_date_dt = today_dt - timedelta(days=self.day_qty - 1)
+        productions = self.env['olive.oil.production']
+        for day in range(self.day_qty):
+            date = fields.Date.to_string(start_date_dt + timedelta(days=day))
+            logger.info('Olive mill benchmark: simulating day %s', date)
+            productions |= self._simulate_day(
+                mctx, rand, stats, date, farmers, paloxes, tanks, variants)
+
+        logger.info('Olive mill benchmark: invoicing')
+        invoice_type = 'all'
+        if any([not farmer.property_account_position_id
+                for (farmer, ochards) in farmers]):
+            invoice_type = 'out'
+        farmers_to_invoice = self.env['res.partner']
+        for line in productions.mapped('line_ids'):
+            if len(farmers_to_invoice) >= self.invoice_qty:
+                break
+            farmers_to_invoice |= line.commercial_partner_id
+        for farmer in farmers_to_invoice:
+            wiz = self.env['olive.invoice.create'].create({
+                'partner_id': farmer.id,
+                'season_id': mctx.season.id,
+                'warehouse_id': mctx.warehouse.id,
+                'invoice_type': invoice_type,
+                })
+            with self._measure(stats, 'invoice_create'):
+                wiz.validate()
+
+        bottling_count = 0
+        if self.bottling_qty:
+            logger.info('Olive mill benchmark: bottling')
+            bottling_count = self._simulate_bottlings(mctx, stats, tanks)
+
+        logger.info('Olive mill benchmark: AgriMer report')
+        report = self.env['olive.agrimer.report'].create({
+            'company_id': mctx.company.id,
+            'date_start': fields.Date.to_string(start_date_dt),
+            'date_end': fields.Date.to_string(today_dt),
+            })
+        with self._measure(stats, 'agrimer_report_generate'):
+            report.generate_report()
+        with self._measure(stats, 'agrimer_ledger_rebuild'):
+            report.rebuild_ledger()
+
+        logger.info('Olive mill benchmark: partner list and traceability')
+        rpo = self.env['res.partner']
+        for i in range(3):
+            rpo.invalidate_cache()
+            with self._measure(stats, 'partner_list_read'):
+                rpo.search_read(
+                    [('olive_farmer', '=', True)], PARTNER_LIST_FIELDS,
+                    limit=80)
+        lots = self.env['stock.production.lot'].search([
+            ('olive_production_id', 'in', productions.ids)])
+        for lot in lots:
+            lot.invalidate_cache()
+            with self._measure(stats, 'lot_traceability'):
+                lot.report_get_arrival_lines()
+
+        logger.info('Olive mill benchmark: name_get')
+        name_get_sizes = {}
+        for model in NAME_GET_MODELS:
+            for size in NAME_GET_SIZES:
+                recs = self.env[model].search([], limit=size)
+                key = 'name_get_%s_%d' % (model.replace('.', '_'), size)
+                name_get_sizes[key] = len(recs)
+                recs.invalidate_cache()
+                # browse again to start with an empty prefetch
+                recs = recs.browse(recs.ids)
+                with self._measure(stats, key):
+                    recs.name_get()
+        return {
+            'productions': len(productions),
+            'arrival_lines': len(productions.mapped('line_ids')),
+            'lots': len(lots),
+            'bottlings': bottling_count,
+            'name_get_records': name_get_sizes,
+            }
+
+    def run(self):
+        self.ensure_one()
+        if not self.env.user.has_group('base.group_system'):
+            raise UserError(_(
+                "Only the administrators can run the olive mill benchmark."))
+        stats = {}
+        module = self.env['ir.module.module'].search(
+            [('name', '=', 'olive_mill')], limit=1)
+        start = time.time()
+        self._cr.execute('SAVEPOINT olive_mill_benchmark')
+        try:
+            counters = self._run_benchmark(stats)
+        finally:
+            if not self.keep_data:
+                self._cr.execute('ROLLBACK TO SAVEPOINT olive_mill_benchmark')
+                self.env.invalidate_all()
+                # the cached mill context may reference removed records
+                self.clear_caches()
+        res = {
+            'database': self._cr.dbname,
+            'date': fields.Datetime.now(),
+            'olive_mill_version': module.latest_version,
+            'duration_s': round(time.time() - start, 3),
+            'scale': dict([(fname, self[fname]) for fname in [
+                'farmer_qty', 'ochard_per_farmer', 'palox_qty', 'tank_qty',
+                'day_qty', 'arrival_per_day', 'line_per_arrival',
+                'line_per_palox', 'bottling_qty', 'invoice_qty',
+                'seed']]),
+            'counters': counters,
+            'operations': self._summarize(stats),
+            }
+        result = json.dumps(res, indent=2, sort_keys=True)
+        filename = 'olive_mill_benchmark_%s.json' % res['date'].replace(
+            ' ', '_').replace(':', '')
+        attachment = self.env['ir.attachment'].create({
+            'name': filename,
+            'datas_fname': filename,
+            'datas': base64.b64encode(result),
+            'mimetype': 'application/json',
+            })
+        logger.info(
+            'Olive mill benchmark finished, results stored in attachment %s',
+            filename)
+        self.write({
+            'state': 'done',
+            'result': result,
+            'attachment_id': attachment.id,
+            })
+        action = self.env.ref(
+            'olive_mill_benchmark.olive_benchmark_action').read()[0]
+        action['res_id'] = self.id
+        return action